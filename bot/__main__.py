@@ -0,0 +1,4 @@
+# Entry point: python -m bot (chart workers skip re-importing this module, unlike python -m bot.main)
+from .main import run
+
+run()
@@ -0,0 +1,94 @@
+# Set-based evaluation of percent-change alerts for a whole tick
+from bisect import bisect_right
+import pandas as pd
+
+SUBSCRIPTION_COLUMNS = ["subscription_id", "server_id", "ticker", "threshold", "alerted", "last_alerted"]
+
+
+def evaluate(subscriptions, quotes):
+    ''' Compute threshold crossings for every subscription at once.
+
+    subscriptions: rows from subscribed_stock_db.get_all_subscriptions()
+    quotes: ticker -> {"lastPrice", "previousClose"} from market_data
+    Returns (to_alert, to_reset) DataFrames; subscriptions without a quote are left untouched.
+    '''
+    frame = pd.DataFrame(subscriptions, columns=SUBSCRIPTION_COLUMNS)
+    prices = pd.DataFrame.from_dict(quotes, orient="index", columns=["lastPrice", "previousClose"])
+    if frame.empty or prices.empty:
+        empty = frame.iloc[0:0].assign(lastPrice=[], previousClose=[], percent_change=[])
+        return empty, empty
+
+    frame = frame.join(prices, on="ticker", how="inner")
+    frame["threshold"] = frame["threshold"].astype(float)
+    frame["alerted"] = frame["alerted"].astype(bool)
+    frame["percent_change"] = ((frame["lastPrice"] - frame["previousClose"]) / frame["previousClose"] * 100).round(2)
+
+    crossed = frame["percent_change"].abs() >= frame["threshold"]
+    to_alert = frame[crossed & ~frame["alerted"]]
+    to_reset = frame[~crossed & frame["alerted"]]
+    return to_alert, to_reset
+
+
+def percent_change(quote):
+    return round((quote["lastPrice"] - quote["previousClose"]) / quote["previousClose"] * 100, 2)
+
+
+def to_frame(rows, quote):
+    ''' Subscription rows for one ticker as an evaluate()-style frame priced with quote '''
+    frame = pd.DataFrame(rows, columns=SUBSCRIPTION_COLUMNS)
+    frame["threshold"] = frame["threshold"].astype(float)
+    frame["alerted"] = frame["alerted"].astype(bool)
+    frame["lastPrice"] = float(quote["lastPrice"])
+    frame["previousClose"] = float(quote["previousClose"])
+    frame["percent_change"] = percent_change(quote)
+    return frame
+
+
+class ThresholdIndex:
+    ''' One ticker's subscriptions sorted by threshold, for evaluating a price update in O(log n + k).
+
+    Subscriptions left of `boundary` (threshold <= last |change|) should be alerted and the rest not;
+    `exceptions` holds the positions whose stored state disagrees, i.e. pending sends and failed ones.
+    A new change only moves the boundary, so just the span it moved over and the exceptions are visited.
+    '''
+
+    def __init__(self, rows):
+        rows = sorted(rows, key=lambda row: float(row[3]))
+        self.rows = rows
+        self.thresholds = [float(row[3]) for row in rows]
+        self.alerted = [bool(row[4]) for row in rows]
+        self.position = {row[0]: i for i, row in enumerate(rows)}
+        # Start from the boundary the stored states imply so a consistent book has no exceptions
+        self.boundary = sum(self.alerted)
+        self.exceptions = {i for i, alerted in enumerate(self.alerted) if alerted != (i < self.boundary)}
+
+    def __len__(self):
+        return len(self.rows)
+
+    def update(self, change):
+        ''' Move the boundary to a new percent change; returns (rows to alert, rows to reset) '''
+        new_boundary = bisect_right(self.thresholds, abs(change))
+        low, high = sorted((self.boundary, new_boundary))
+        candidates = self.exceptions.union(range(low, high))
+        self.boundary = new_boundary
+        self.exceptions = set()
+        to_alert, to_reset = [], []
+        for i in candidates:
+            should_alert = i < new_boundary
+            if self.alerted[i] != should_alert:
+                self.exceptions.add(i)
+                (to_alert if should_alert else to_reset).append(self.rows[i])
+        return to_alert, to_reset
+
+    def confirm(self, subscription_ids, alerted):
+        ''' Record states that were persisted; anything unconfirmed stays an exception and is retried '''
+        for subscription_id in subscription_ids:
+            i = self.position.get(subscription_id)
+            if i is None:
+                continue
+            self.alerted[i] = alerted
+            self.rows[i] = self.rows[i][:4] + (alerted,) + self.rows[i][5:]
+            if alerted == (i < self.boundary):
+                self.exceptions.discard(i)
+            else:
+                self.exceptions.add(i)
@@ -0,0 +1,266 @@
+# Condition-based alert rules: a small rule syntax compiled into a plan that evaluates every rule of a tick with
+# NumPy array operations over a (ticker x feature) matrix, so each series is read once per ticker however many rules use it
+import re
+from collections import namedtuple
+import numpy as np
+import pandas as pd
+
+RULE_COLUMNS = ["rule_id", "server_id", "ticker", "rule", "alerted", "last_alerted"]
+# Rule words -> history frame columns ("price" is the live quote, falling back to the last close)
+SERIES = {
+    "price": "Close", "close": "Close", "volume": "Volume",
+    "sma20": "sma_20", "sma50": "sma_50", "ema12": "ema_12", "ema26": "ema_26", "rsi": "rsi_14", "rsi14": "rsi_14",
+    "bb_upper": "bb_upper", "bb_middle": "bb_middle", "bb_lower": "bb_lower", "atr": "atr_14", "atr14": "atr_14",
+}
+OPERATORS = {">": ">", "<": "<", ">=": ">=", "<=": "<=", "above": ">", "below": "<"}
+# Volume spikes compare against the average of this many previous daily volumes
+VOLUME_AVERAGE_DAYS = 20
+MAX_CHANGE_DAYS = 250
+
+RULE_HELP = ("price > 200 · price crosses below 150 · sma20 crosses above sma50 · rsi14 > 70 · "
+             "volume > 3x · change 5d > 10% · change 20d < -15%")
+
+# compare: left op right * scale now; cross: the comparison became true since the previous bar
+Rule = namedtuple("Rule", ["kind", "left", "op", "right", "scale", "text"])
+
+_TOKEN = re.compile(r"\s*(>=|<=|>|<|-?\d+(?:\.\d+)?|[a-z_][a-z_0-9]*|%)")
+
+
+def _tokenize(text):
+    text = text.strip().lower()
+    tokens, position = [], 0
+    while position < len(text):
+        match = _TOKEN.match(text, position)
+        if not match:
+            raise ValueError(f"Unexpected '{text[position:].strip()[:10]}'")
+        tokens.append(match.group(1))
+        position = match.end()
+        while position < len(text) and text[position].isspace():
+            position += 1
+    return tokens
+
+
+def _number(token):
+    try:
+        return float(token)
+    except (TypeError, ValueError):
+        return None
+
+
+def _series(token):
+    if token not in SERIES:
+        raise ValueError(f"Unknown series '{token}'. Known: {', '.join(sorted(SERIES))}")
+    return SERIES[token]
+
+
+def _operand(tokens):
+    ''' A number or series name; returns (feature, scale) '''
+    if len(tokens) != 1:
+        raise ValueError("Expected one number or series after the comparison")
+    value = _number(tokens[0])
+    return ("one", value) if value is not None else (_series(tokens[0]), 1.0)
+
+
+def parse_rule(text):
+    ''' Parse a rule such as "sma20 crosses above sma50"; raises ValueError with a user-facing message '''
+    tokens = _tokenize(text)
+    if not tokens:
+        raise ValueError("Empty rule")
+
+    if tokens[0] == "change":
+        # change <N>d <op> <number>[%]
+        if len(tokens) < 5 or tokens[2] != "d" or tokens[3] not in OPERATORS or _number(tokens[1]) is None:
+            raise ValueError("Write percent changes as `change 5d > 10%`")
+        days = int(_number(tokens[1]))
+        if not 1 <= days <= MAX_CHANGE_DAYS:
+            raise ValueError(f"Change windows must be between 1 and {MAX_CHANGE_DAYS} days")
+        level = _number(tokens[4])
+        if level is None or tokens[5:] not in ([], ["%"]):
+            raise ValueError("Write percent changes as `change 5d > 10%`")
+        op = OPERATORS[tokens[3]]
+        return Rule("compare", f"change_{days}d", op, "one", level, f"change {days}d {op} {level:g}%")
+
+    left = _series(tokens[0])
+    if len(tokens) >= 3 and tokens[1] == "crosses" and tokens[2] in ("above", "below"):
+        right, scale = _operand(tokens[3:])
+        op = OPERATORS[tokens[2]]
+        return Rule("cross", left, op, right, scale, f"{tokens[0]} crosses {tokens[2]} {tokens[3]}")
+
+    if len(tokens) < 3 or tokens[1] not in OPERATORS:
+        raise ValueError(f"Could not read the rule. Examples: {RULE_HELP}")
+    op = OPERATORS[tokens[1]]
+    if left == "Volume" and tokens[3:] == ["x"] and _number(tokens[2]) is not None:
+        # volume > 3x: today's volume against a multiple of the recent average
+        multiple = _number(tokens[2])
+        return Rule("compare", "Volume", op, f"volume_avg{VOLUME_AVERAGE_DAYS}", multiple, f"volume {op} {multiple:g}x")
+    right, scale = _operand(tokens[2:])
+    return Rule("compare", left, op, right, scale, f"{tokens[0]} {op} {tokens[2]}")
+
+
+def history_bars(feature):
+    ''' Daily bars a feature needs: current and previous bar, the volume average window or the change window '''
+    if feature.startswith("change_"):
+        return int(feature[len("change_"):-1]) + 1
+    if feature.startswith("volume_avg"):
+        return VOLUME_AVERAGE_DAYS + 1
+    return 2
+
+
+def _period_for(bars):
+    # Smallest yfinance period whose calendar days hold that many trading days (with room for holidays)
+    for period, days in (("1mo", 31), ("3mo", 92), ("6mo", 183), ("1y", 366), ("2y", 731)):
+        if days * 5 / 7 - 10 >= bars:
+            return period
+    return "2y"
+
+
+def _feature_value(feature, columns, quote):
+    ''' One feature for one ticker from its history columns (name -> float array), NaN when the data is missing '''
+    if feature == "one":
+        return 1.0
+    name, _, lag = feature.partition("@")
+    lag = int(lag or 0)
+    if name == "Close" and quote is not None:
+        return float(quote["previousClose"] if lag else quote["lastPrice"])
+    if name.startswith("change_"):
+        days = int(name[len("change_"):-1])
+        closes = columns.get("Close")
+        if closes is None or len(closes) <= days:
+            return np.nan
+        price = float(quote["lastPrice"]) if quote is not None else closes[-1]
+        return (price / closes[-1 - days] - 1) * 100
+    if name.startswith("volume_avg"):
+        volumes = columns.get("Volume")
+        if volumes is None or len(volumes) <= VOLUME_AVERAGE_DAYS:
+            return np.nan
+        return float(volumes[-1 - VOLUME_AVERAGE_DAYS:-1].mean())
+    values = columns.get(name)
+    if values is None or len(values) <= lag:
+        return np.nan
+    return float(values[-1 - lag])
+
+
+def _base_column(feature):
+    # History column a feature reads (None for the constant)
+    name = feature.partition("@")[0]
+    if name == "one":
+        return None
+    if name.startswith("change_"):
+        return "Close"
+    if name.startswith("volume_avg"):
+        return "Volume"
+    return name
+
+
+_OP_CODES = {">": 0, "<": 1, ">=": 2, "<=": 3}
+
+
+def _compare(codes, left, right):
+    with np.errstate(invalid="ignore"):
+        return np.select([codes == 0, codes == 1, codes == 2], [left > right, left < right, left >= right], left <= right)
+
+
+class RulePlan:
+    ''' Rules compiled once: every rule becomes indexes into a shared (ticker x feature) matrix.
+
+    evaluate() fills the matrix once per ticker and feature, then decides all rules with a handful of array
+    operations; rules whose inputs are missing (NaN) keep their state.
+    '''
+
+    def __init__(self, rows):
+        self.signature = rule_signature(rows)
+        self.rows = []
+        rules = []
+        parsed = {}  # many guilds store the same rule text
+        for row in rows:
+            if row[3] not in parsed:
+                try:
+                    parsed[row[3]] = parse_rule(row[3])
+                except ValueError:
+                    parsed[row[3]] = None  # stored before a syntax change; never matches
+            if parsed[row[3]] is not None:
+                rules.append(parsed[row[3]])
+                self.rows.append(row)
+        self.frame = pd.DataFrame(self.rows, columns=RULE_COLUMNS)
+
+        self.tickers = sorted({row[2] for row in self.rows})
+        ticker_index = {ticker: i for i, ticker in enumerate(self.tickers)}
+        self.features = ["one"]
+        feature_index = {"one": 0}
+
+        def index(feature):
+            if feature not in feature_index:
+                feature_index[feature] = len(self.features)
+                self.features.append(feature)
+            return feature_index[feature]
+
+        def previous(feature):
+            return feature if feature == "one" else f"{feature}@1"
+
+        self.ticker = np.array([ticker_index[row[2]] for row in self.rows], dtype=np.intp)
+        self.left = np.array([index(rule.left) for rule in rules], dtype=np.intp)
+        self.right = np.array([index(rule.right) for rule in rules], dtype=np.intp)
+        self.left_before = np.array([index(previous(rule.left)) if rule.kind == "cross" else 0 for rule in rules], dtype=np.intp)
+        self.right_before = np.array([index(previous(rule.right)) if rule.kind == "cross" else 0 for rule in rules], dtype=np.intp)
+        self.scale = np.array([rule.scale for rule in rules], dtype=float)
+        self.op = np.array([_OP_CODES[rule.op] for rule in rules], dtype=np.int8)
+        self.cross = np.array([rule.kind == "cross" for rule in rules], dtype=bool)
+        self.alerted = np.array([bool(row[4]) for row in self.rows], dtype=bool)
+
+        # Which tickers need stored daily history (anything beyond the live price) and how much of it
+        history_features = {feature for feature in self.features if feature.partition("@")[0] not in ("one", "Close")}
+        self.history_tickers = sorted({self.tickers[t] for t, l, r, lb, rb in
+                                       zip(self.ticker, self.left, self.right, self.left_before, self.right_before)
+                                       if {self.features[i] for i in (l, r, lb, rb)} & history_features})
+        self.period = _period_for(max((history_bars(feature) for feature in history_features), default=2))
+        self.columns = {_base_column(feature) for feature in self.features} - {None}
+
+    def __len__(self):
+        return len(self.rows)
+
+    def refresh_states(self, rows):
+        ''' Take the stored alerted flags of an unchanged rule set instead of recompiling '''
+        alerted = {row[0]: bool(row[4]) for row in rows}
+        self.alerted = np.array([alerted.get(row[0], False) for row in self.rows], dtype=bool)
+
+    def feature_matrix(self, histories, quotes):
+        matrix = np.full((len(self.tickers), len(self.features)), np.nan)
+        for t, ticker in enumerate(self.tickers):
+            hist, quote = histories.get(ticker), quotes.get(ticker)
+            if hist is None and quote is None:
+                continue
+            columns = {} if hist is None else {name: hist[name].to_numpy(dtype=float) for name in self.columns if name in hist}
+            for f, feature in enumerate(self.features):
+                matrix[t, f] = _feature_value(feature, columns, quote)
+        return matrix
+
+    def evaluate(self, histories, quotes):
+        ''' Returns (to_alert, to_reset) frames of rule rows, with the compared values in `value` and `target` '''
+        if not self.rows:
+            empty = self.frame.assign(value=[], target=[])
+            return empty, empty
+        matrix = self.feature_matrix(histories, quotes)
+        left = matrix[self.ticker, self.left]
+        right = matrix[self.ticker, self.right] * self.scale
+        now = _compare(self.op, left, right)
+
+        left_before = matrix[self.ticker, self.left_before]
+        right_before = matrix[self.ticker, self.right_before] * self.scale
+        before = _compare(self.op, left_before, right_before)
+        hit = np.where(self.cross, now & ~before, now)
+
+        valid = np.isfinite(left) & np.isfinite(right) & (~self.cross | (np.isfinite(left_before) & np.isfinite(right_before)))
+        frame = self.frame.assign(value=left, target=right)
+        return frame[valid & hit & ~self.alerted], frame[valid & ~hit & self.alerted]
+
+
+def rule_signature(rows):
+    return frozenset((row[0], row[2], row[3]) for row in rows)
+
+
+def compile_rules(rows, previous=None):
+    ''' Compile rule rows (see RULE_COLUMNS), reusing the previous plan while the rule set is unchanged '''
+    if previous is not None and previous.signature == rule_signature(rows):
+        previous.refresh_states(rows)
+        return previous
+    return RulePlan(rows)
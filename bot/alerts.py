@@ -1,73 +1,184 @@
+import asyncio
+import csv
 import discord
+import io
+import os
+import socket
+import time
+import uuid
 from discord.ext import commands, tasks
-import yfinance as yf
-from .config import bot, logger, STOCKS_ALERT_CHANNEL_NAME, FREE_PLAN_MAX_WATCHED_STOCKS, PRO_PLAN_MAX_WATCHED_STOCKS
+from .config import bot, logger, STOCKS_ALERT_CHANNEL_NAME, FREE_PLAN_MAX_WATCHED_STOCKS, PRO_PLAN_MAX_WATCHED_STOCKS, SHARD_COUNT, SHARD_IDS, ALERT_LEASE_SECONDS, FREE_PLAN_MAX_ALERT_RULES, PRO_PLAN_MAX_ALERT_RULES
+from . import market_data, alert_engine, alert_rules, market_hours, metrics, price_stream
+from .dispatcher import dispatcher
 
+import database_services.alert_lease_db as alert_lease_db
+import database_services.alert_rule_db as alert_rule_db
 import database_services.subscribed_stock_db as subscribed_stock_db
 import database_services.stock_db as stock_db
+import database_services.server_db as server_db
 import database_services.server_plan_db as server_plan_db
+from database_services import db
 
 
-@bot.command()
-async def watch(ctx, arg, threshold: float = 10.0):
-    '''Watch a stock and get notified when its price changes by a certain percentage (default: 10%).'''
+DEFAULT_WATCH_THRESHOLD = 10.0
+# Largest watchlist CSV accepted as an attachment
+WATCHLIST_MAX_BYTES = 64 * 1024
+# Tickers per !rules page; keeps each embed well inside Discord's 25 field / 6000 character limits
+RULES_TICKERS_PER_PAGE = 10
+# Seconds !rules waits for the ▶️ reaction before it stops paging
+RULES_PAGE_TIMEOUT_SECONDS = 120
+
+def parse_watch_args(args):
+    '''Parse "AAPL MSFT:5 NVDA 3" into [(symbol, threshold)] plus the tokens that could not be read.'''
+    items, invalid = [], []
+    explicit = False
+    for token in args:
+        symbol, separator, value = token.partition(":")
+        try:
+            threshold = float((value if separator else token).rstrip("%"))
+        except ValueError:
+            if separator:
+                invalid.append(token)
+            else:
+                items.append((token, DEFAULT_WATCH_THRESHOLD))
+                explicit = False
+            continue
+        if separator:
+            items.append((symbol, threshold))
+            explicit = True
+        elif items and not explicit:
+            # A bare number sets the threshold of the symbol before it (!watch AAPL 5)
+            items[-1] = (items[-1][0], threshold)
+            explicit = True
+        else:
+            invalid.append(token)
+    return items, invalid
+
+async def read_watchlist_attachment(attachment):
+    '''Read (symbol, threshold) pairs from a CSV with a symbol column and an optional threshold column.'''
+    if attachment.size > WATCHLIST_MAX_BYTES:
+        raise ValueError(f"Watchlist files can be at most {WATCHLIST_MAX_BYTES // 1024} KB.")
+    text = (await attachment.read()).decode("utf-8-sig", errors="replace")
+    tokens = []
+    for row in csv.reader(io.StringIO(text)):
+        cells = [cell.strip() for cell in row if cell.strip()]
+        if not cells or cells[0].lower() in ("ticker", "symbol", "company", "name"):
+            continue
+        tokens.append(f"{cells[0]}:{cells[1]}" if len(cells) > 1 else cells[0])
+    return parse_watch_args(tokens)
+
+def resolve_symbols(symbols):
+    '''Map user input to tickers in one pass over the in-memory index; returns ({symbol: ticker}, not found).'''
+    resolved, not_found = {}, []
+    for symbol in symbols:
+        ticker = stock_db.get_ticker_by_name(symbol)
+        if ticker:
+            resolved[symbol] = ticker
+        else:
+            not_found.append(symbol)
+    return resolved, not_found
 
-    
-    #check if server is stored in db, if not add it
+def _field_value(entries):
+    value = ", ".join(entries)
+    return value if len(value) <= 1024 else value[:1020] + " ..."
+
+@bot.command()
+async def watch(ctx, *args):
+    '''Watch stocks and get notified when their price changes by a certain percentage (default: 10%).'''
     server_id = ctx.message.guild.id
-    ticker = stock_db.get_ticker_by_name(arg)
-    if not ticker:
-        await ctx.send(f"❌ Ticker symbol for '{arg}' not found.")
+    items, invalid = parse_watch_args(args)
+    for attachment in ctx.message.attachments:
+        try:
+            attachment_items, attachment_invalid = await read_watchlist_attachment(attachment)
+        except (ValueError, discord.HTTPException) as e:
+            await ctx.send(f"❌ Could not read {attachment.filename}: {e}")
+            return
+        items.extend(attachment_items)
+        invalid.extend(attachment_invalid)
+    if not items and not invalid:
+        await ctx.send("❌ Usage: `!watch <ticker>[:threshold] ...` or attach a CSV of tickers and thresholds.")
         return
 
-    subscribed_stocks = subscribed_stock_db.get_subscribed_stocks(server_id)
+    resolved, not_found = resolve_symbols(symbol for symbol, _ in items)
+    thresholds = {resolved[symbol]: abs(threshold) for symbol, threshold in items if symbol in resolved}
 
-    # Check if server has reached the maximum number of watched stocks
-    plan = server_plan_db.get_server_plan(server_id)
+    plan = await db.run(server_plan_db.get_server_plan, server_id)
     max_stocks = FREE_PLAN_MAX_WATCHED_STOCKS if not plan or plan[0] == "Free" else PRO_PLAN_MAX_WATCHED_STOCKS
-    if len(subscribed_stocks) >= int(max_stocks):
-        await ctx.send(f"❌ You have reached the maximum number of watched stocks ({max_stocks}) for your current plan ({plan[0] if plan else 'Free'}). Please upgrade your plan to watch more stocks.")
-        return
 
-    # Check if stock is already being watched
-    for stock_id, change_percentage, alerted, last_alerted in subscribed_stocks:
-        existing_ticker = stock_db.get_ticker_by_id(stock_id)
+    # Limit check, duplicate detection and all writes happen in one transaction
+    result = {"added": [], "updated": [], "unchanged": [], "limit": []}
+    if thresholds:
+        result = await db.run(subscribed_stock_db.upsert_server_stocks, server_id, thresholds, int(max_stocks))
+    if result["added"] or result["updated"]:
+        notify_subscriptions_changed()
 
-        # Update threshold if the same stock is being watched with a different threshold
-        if existing_ticker == ticker and change_percentage != abs(threshold):
-            subscribed_stock_db.update_server_stock_threshold(server_id, ticker, abs(threshold))
-            await ctx.send(f"✏️ Updated notification threshold for **{ticker}** from {change_percentage}% to {abs(threshold)}%.")
-            return
-        elif existing_ticker == ticker:
-            await ctx.send(f"⚠️ Notifications for **{ticker}** are already set at {change_percentage}%.")
-            return
-        
+    if len(items) == 1 and not invalid and not ctx.message.attachments:
+        # Single stock: keep the short replies
+        if not_found:
+            await ctx.send(f"❌ Ticker symbol for '{not_found[0]}' not found.")
+        elif result["limit"]:
+            await ctx.send(f"❌ You have reached the maximum number of watched stocks ({max_stocks}) for your current plan ({plan[0] if plan else 'Free'}). Please upgrade your plan to watch more stocks.")
+        elif result["unchanged"]:
+            ticker, previous = result["unchanged"][0]
+            await ctx.send(f"⚠️ Notifications for **{ticker}** are already set at {previous}%.")
+        elif result["updated"]:
+            ticker, previous, threshold = result["updated"][0]
+            await ctx.send(f"✏️ Updated notification threshold for **{ticker}** from {previous}% to {threshold}%.")
+        else:
+            ticker, threshold = result["added"][0]
+            await ctx.send(f"✅ Notifications for **{ticker}** when the price changes by {threshold}%.")
+        return
 
-    subscribed_stock_db.insert_server_stock(server_id, ticker, abs(threshold))
-    await ctx.send(f"✅ Notifications for **{ticker}** when the price changes by {abs(threshold)}%.")
+    embed = discord.Embed(title="👀 Watchlist Updated", color=discord.Color.blue())
+    if result["added"]:
+        embed.add_field(name="✅ Now watching", value=_field_value(f"{ticker} ({threshold}%)" for ticker, threshold in result["added"]), inline=False)
+    if result["updated"]:
+        embed.add_field(name="✏️ Threshold updated", value=_field_value(f"{ticker} ({previous}% → {threshold}%)" for ticker, previous, threshold in result["updated"]), inline=False)
+    if result["unchanged"]:
+        embed.add_field(name="⚠️ Already watched", value=_field_value(f"{ticker} ({previous}%)" for ticker, previous in result["unchanged"]), inline=False)
+    if result["limit"]:
+        embed.add_field(name=f"❌ Over your plan limit ({max_stocks})", value=_field_value(result["limit"]), inline=False)
+    if not_found or invalid:
+        embed.add_field(name="❌ Not found", value=_field_value(not_found + invalid), inline=False)
+    await ctx.send(embed=embed)
 
 @bot.command()
-async def unwatch(ctx, arg):
-    '''Stop watching a stock.'''
+async def unwatch(ctx, *args):
+    '''Stop watching one or more stocks.'''
     server_id = ctx.message.guild.id
-    ticker = stock_db.get_ticker_by_name(arg)
-    if not ticker:
-        await ctx.send(f"❌ Ticker symbol for '{arg}' not found.")
+    if not args:
+        await ctx.send("❌ Usage: `!unwatch <ticker> ...`")
+        return
+    resolved, not_found = resolve_symbols(args)
+    tickers = sorted(set(resolved.values()))
+    if tickers:
+        await db.run(subscribed_stock_db.delete_server_stocks, server_id, tickers)
+        notify_subscriptions_changed()
+
+    if len(args) == 1:
+        if not_found:
+            await ctx.send(f"❌ Ticker symbol for '{args[0]}' not found.")
+        else:
+            await ctx.send(f"🗑️ Stopped watching **{tickers[0]}**.")
         return
 
-    subscribed_stock_db.delete_server_stock(server_id, ticker)
-    await ctx.send(f"🗑️ Stopped watching **{ticker}**.")
+    embed = discord.Embed(title="🗑️ Unwatched Stocks")
+    if tickers:
+        embed.add_field(name="Stopped watching", value=_field_value(tickers), inline=False)
+    if not_found:
+        embed.add_field(name="❌ Not found", value=_field_value(not_found), inline=False)
+    await ctx.send(embed=embed)
 
 @bot.command()
 async def unwatchall(ctx):
     '''Stop watching all stocks.'''
     server_id = ctx.message.guild.id
-    stocks_ids = subscribed_stock_db.delete_server_stocks_from_server(server_id)
+    tickers = await db.run(subscribed_stock_db.delete_server_stocks_from_server, server_id)
+    notify_subscriptions_changed()
     embed = discord.Embed(
         title="🗑️ Unwatched All Stocks",
     )
-    for stock_id in stocks_ids:
-        ticker = stock_db.get_ticker_by_id(stock_id)
+    for ticker in tickers:
         embed.add_field(name=ticker, value="Unwatched", inline=False)
 
     await ctx.send(embed=embed)
@@ -76,9 +187,9 @@ async def unwatchall(ctx):
 async def list(ctx):
     '''List all watched stocks for this server.'''
     server_id = ctx.message.guild.id
-    subscribed_stocks = subscribed_stock_db.get_subscribed_stocks(server_id)
+    subscriptions = await db.run(subscribed_stock_db.get_server_subscriptions, server_id)
 
-    if not subscribed_stocks:
+    if not subscriptions:
         await ctx.send("ℹ️ No stocks are currently being watched on this server.")
         return
 
@@ -88,59 +199,365 @@ async def list(ctx):
         color=discord.Color.blue()
     )
 
-    for stock_id, threshold, alerted, last_alerted in subscribed_stocks:
-        ticker = stock_db.get_ticker_by_id(stock_id)
-
+    for ticker, name, threshold, alerted, last_alerted in subscriptions:
         # If is alerted, point out
         if alerted:
             ticker = f"🚨 {ticker}"
-        
-        embed.add_field(name=ticker, value=f"Notification Threshold: {threshold}%", inline=False)
+
+        value = f"{name}\nNotification Threshold: {threshold}%" if name else f"Notification Threshold: {threshold}%"
+        embed.add_field(name=ticker, value=value, inline=False)
 
     await ctx.send(embed=embed)
 
-@tasks.loop(minutes=1)
+@bot.command()
+async def rule(ctx, arg, *condition):
+    '''Get notified when a condition on a stock becomes true (e.g. !rule AAPL sma20 crosses above sma50).'''
+    server_id = ctx.message.guild.id
+    ticker = stock_db.get_ticker_by_name(arg)
+    if not ticker:
+        await ctx.send(f"❌ Ticker symbol for '{arg}' not found.")
+        return
+    try:
+        parsed = alert_rules.parse_rule(" ".join(condition))
+    except ValueError as e:
+        await ctx.send(f"❌ {e}\nExamples: {alert_rules.RULE_HELP}")
+        return
+
+    plan = await db.run(server_plan_db.get_server_plan, server_id)
+    max_rules = FREE_PLAN_MAX_ALERT_RULES if not plan or plan[0] == "Free" else PRO_PLAN_MAX_ALERT_RULES
+    rule_id, created = await db.run(alert_rule_db.insert_rule, server_id, ticker, parsed.text, max_rules)
+    if rule_id is None:
+        await ctx.send(f"❌ You have reached the maximum number of alert rules ({max_rules}) for your current plan ({plan[0] if plan else 'Free'}). Please upgrade your plan to add more rules.")
+    elif not created:
+        await ctx.send(f"⚠️ Rule #{rule_id} already notifies when **{ticker}** `{parsed.text}`.")
+    else:
+        await ctx.send(f"✅ Rule #{rule_id}: notifications when **{ticker}** `{parsed.text}`.")
+
+@bot.command()
+async def rules(ctx):
+    '''List the alert rules of this server.'''
+    server_id = ctx.message.guild.id
+    server_rules = await db.run(alert_rule_db.get_server_rules, server_id)
+    if not server_rules:
+        await ctx.send(f"ℹ️ No alert rules on this server. Add one with `!rule <ticker> <condition>`, e.g. {alert_rules.RULE_HELP}")
+        return
+
+    by_ticker = {}
+    for rule_id, ticker, text, alerted, last_alerted in server_rules:
+        by_ticker.setdefault(ticker, []).append(f"#{rule_id} `{text}`" + (" 🚨" if alerted else ""))
+    tickers = sorted(by_ticker)
+    n_pages = -(len(tickers) // -RULES_TICKERS_PER_PAGE)  # Ceiling division
+
+    def build_embed(page_number):
+        title = "📏 Alert Rules" + (f" (Page {page_number}/{n_pages})" if n_pages > 1 else "")
+        embed = discord.Embed(title=title, color=discord.Color.blue())
+        for ticker in tickers[RULES_TICKERS_PER_PAGE * (page_number - 1): RULES_TICKERS_PER_PAGE * page_number]:
+            embed.add_field(name=ticker, value="\n".join(by_ticker[ticker])[:500], inline=False)
+        embed.set_footer(text="Remove a rule with !unrule <id>")
+        return embed
+
+    next_page_reaction = "▶️"
+    page = 1
+    cur_message = await ctx.send(embed=build_embed(page))
+    if n_pages > 1:
+        await cur_message.add_reaction(next_page_reaction)
+
+    def check(reaction, user):
+        return user == ctx.author and reaction.message.id == cur_message.id and str(reaction.emoji) == next_page_reaction
+
+    page += 1
+    while page <= n_pages:
+        try:
+            await bot.wait_for("reaction_add", check=check, timeout=RULES_PAGE_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            try:
+                await cur_message.clear_reactions()
+            except discord.HTTPException:
+                # Clearing other users' reactions needs Manage Messages; at least drop our own
+                await cur_message.remove_reaction(next_page_reaction, bot.user)
+            return
+        cur_message = await ctx.send(embed=build_embed(page))
+        if page < n_pages:
+            await cur_message.add_reaction(next_page_reaction)
+        page += 1
+
+@bot.command()
+async def unrule(ctx, *rule_ids):
+    '''Remove alert rules by id (see !rules).'''
+    server_id = ctx.message.guild.id
+    ids = [int(rule_id.lstrip("#")) for rule_id in rule_ids if rule_id.lstrip("#").isdigit()]
+    if not ids:
+        await ctx.send("❌ Usage: `!unrule <id> ...` (ids are shown by `!rules`)")
+        return
+    deleted = await db.run(alert_rule_db.delete_rules, server_id, ids)
+    if not deleted:
+        await ctx.send("❌ No rule with that id on this server.")
+        return
+    await ctx.send("🗑️ Removed " + ", ".join(f"#{rule_id} **{ticker}** `{text}`" for rule_id, ticker, text in deleted))
+
+async def get_alert_channel(guild):
+    '''Return the guild's stock alert channel from its stored id, creating it only if there is none.'''
+    channel_id = server_db.get_alert_channel_id(guild.id)
+    channel = guild.get_channel(channel_id) if channel_id else None
+    if channel:
+        return channel
+    return await ensure_alert_channel(guild)
+
+async def ensure_alert_channel(guild):
+    '''Find or create the guild's stock alert channel and store its id.'''
+    channel = discord.utils.get(guild.text_channels, name=STOCKS_ALERT_CHANNEL_NAME)
+    if not channel:
+        # Create read-only channel for stock alerts
+        overwrites = {
+            guild.default_role: discord.PermissionOverwrite(send_messages=False, view_channel=True),
+            guild.me: discord.PermissionOverwrite(send_messages=True, view_channel=True)
+        }
+        channel = await guild.create_text_channel(STOCKS_ALERT_CHANNEL_NAME, overwrites=overwrites)
+
+        await channel.send("📈 Stock price alerts are now active!")
+        logger.info(f"Created channel: {STOCKS_ALERT_CHANNEL_NAME} in server: {guild.name} ({guild.id})")
+    await db.run(server_db.set_alert_channel_id, guild.id, channel.id)
+    return channel
+
+# Identifies this process in the alert shard lease table
+ALERT_WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+def build_alert_embed(ticker, price, percent_change, threshold):
+    embed = discord.Embed(
+        title=f"🚨 **{ticker}** Price Alert!",
+        description=f"The price of **{ticker}** has changed by {percent_change:.2f}% which is above your set threshold of {threshold}%.",
+        color=discord.Color.green() if percent_change >= 0 else discord.Color.red()
+    )
+    embed.set_footer(text="Data provided by Yahoo Finance (yfinance)")
+    embed.add_field(name=ticker, value=f"Price: {price:.2f} USD\nChange: {percent_change:.2f}%", inline=False)
+    return embed
+
+def build_rule_embed(ticker, rule, value, target):
+    embed = discord.Embed(
+        title=f"📏 **{ticker}** Rule Alert!",
+        description=f"**{ticker}** matched your rule `{rule}`.",
+        color=discord.Color.orange()
+    )
+    embed.set_footer(text="Data provided by Yahoo Finance (yfinance)")
+    embed.add_field(name=ticker, value=f"Value: {value:,.2f}\nCompared with: {target:,.2f}", inline=False)
+    return embed
+
+ALERT_INTERVAL_SECONDS = 60
+_last_tick_started = None
+poll_schedule = market_hours.PollSchedule()
+
+@tasks.loop(seconds=ALERT_INTERVAL_SECONDS)
 async def check_stock_percent_changes():
     '''Check stock price changes for all watched stocks and notify servers if thresholds are crossed.'''
+    global _last_tick_started
+
+    started = time.monotonic()
+    if _last_tick_started is not None:
+        # tasks.loop never overlaps ticks, it silently drops the ones that should have started meanwhile
+        missed = max(0, int((started - _last_tick_started) // ALERT_INTERVAL_SECONDS) - 1)
+        if missed > 0:
+            metrics.alert_ticks_skipped.inc(amount=missed)
+            logger.warning(f"{missed} alert tick(s) were skipped because the previous tick ran late")
+    _last_tick_started = started
+
+    yfinance_calls_before = metrics.yfinance_calls.total()
+    result = {"subscriptions": 0, "tickers": 0, "alerts_sent": 0, "send_failures": 0}
+    # Counted for this tick only, so statements from commands running meanwhile are left out
+    with db.count_queries() as tick_db_stats:
+        try:
+            await run_alert_tick(result)
+        finally:
+            elapsed = time.monotonic() - started
+            yfinance_calls = metrics.yfinance_calls.total() - yfinance_calls_before
+            db_queries = tick_db_stats["queries"]
+            db_seconds = tick_db_stats["query_seconds"]
+
+            metrics.alert_ticks.inc()
+            metrics.alert_tick_seconds.observe(elapsed)
+            metrics.alert_tick_last_seconds.set(elapsed)
+            metrics.alert_tick_yfinance_calls.set(yfinance_calls)
+            metrics.alert_tick_db_queries.set(db_queries)
+            metrics.alert_tick_db_seconds.set(db_seconds)
+
+            logger.info(
+                f"Alert tick: wall_time={elapsed:.2f}s subscriptions={result['subscriptions']} tickers={result['tickers']} "
+                f"yfinance_calls={yfinance_calls} db_queries={db_queries} db_time={db_seconds:.3f}s "
+                f"alerts_sent={result['alerts_sent']} send_failures={result['send_failures']}"
+            )
+            if elapsed > ALERT_INTERVAL_SECONDS:
+                metrics.alert_tick_overruns.inc()
+                logger.warning(f"Alert tick took {elapsed:.1f}s, longer than its {ALERT_INTERVAL_SECONDS}s interval")
+
+
+async def run_alert_tick(result):
+    '''One pass of the alert check; fills result with counts for the tick log.'''
+    # One query for every subscription on the shards we hold a lease for, so no subscription is checked by two workers
+    subscriptions = await load_owned_subscriptions()
+    result["subscriptions"] = len(subscriptions)
+    if not subscriptions:
+        return
+
+    # Each ticker is fetched once per tick, however many guilds watch it
+    tickers = {row[2] for row in subscriptions}
+    if market_hours.ALERT_MARKET_HOURS:
+        # Closed markets get one evaluation after the bell and are then left alone until they reopen
+        tickers = set(poll_schedule.due(tickers))
+        if not tickers:
+            return
+        subscriptions = [row for row in subscriptions if row[2] in tickers]
+    try:
+        quotes = await market_data.get_quotes(sorted(tickers))
+    except market_data.MarketDataTimeout as e:
+        logger.warning(f"Skipping alert tick: {e}")
+        return
+    # Tickers without a quote (delisted, no data) count as polled too, so closed markets do not retry them every tick
+    poll_schedule.mark_polled(tickers)
+    result["tickers"] = len(quotes)
+
+    to_alert, to_reset = alert_engine.evaluate(subscriptions, quotes)
+    alerted_ids = await deliver_alerts(to_alert, to_reset)
+    result["alerts_sent"] += len(alerted_ids)
+    result["send_failures"] += len(to_alert) - len(alerted_ids)
+
+
+async def deliver_alerts(to_alert, to_reset):
+    '''Send alert messages through the dispatcher and persist alert state in one batch. Returns the subscription ids marked alerted.'''
+    # Reset alert state for prices that went back within threshold
+    changes = [(int(subscription_id), False) for subscription_id in to_reset["subscription_id"]]
+    alerted_ids = await send_to_guilds(
+        to_alert, "subscription_id", lambda row: build_alert_embed(row.ticker, row.lastPrice, row.percent_change, row.threshold))
+    changes.extend((subscription_id, True) for subscription_id in alerted_ids)
+    await db.run(subscribed_stock_db.apply_alert_states, changes)
+    return alerted_ids
+
+
+async def send_to_guilds(to_alert, id_column, build_embed):
+    '''Send one embed per row to its guild's alert channel, all guilds concurrently. Returns the ids of the rows delivered.'''
+    guild_rows = []
+    for server_id, rows in to_alert.groupby("server_id"):
+        guild = bot.get_guild(int(server_id))
+        if guild:
+            guild_rows.append((guild, rows))
+    channels = await asyncio.gather(*(get_alert_channel(guild) for guild, _ in guild_rows), return_exceptions=True)
+
+    batches = []
+    for (guild, rows), channel in zip(guild_rows, channels):
+        if isinstance(channel, discord.HTTPException):
+            logger.warning(f"Could not get alert channel in server {guild.id}: {channel}")
+            continue
+        if isinstance(channel, BaseException):
+            raise channel
+        embeds = [build_embed(row) for row in rows.itertuples(index=False)]
+        batches.append((rows, dispatcher.send(channel, embeds)))
+
+    # Every guild is sent to concurrently; state is only written once the sends have settled
+    delivered_ids = []
+    for (rows, _), delivered in zip(batches, await asyncio.gather(*(send for _, send in batches))):
+        # Failed sends stay unalerted so the next evaluation retries them
+        delivered_ids.extend(int(row_id) for row_id, sent in zip(rows[id_column], delivered) if sent)
+    return delivered_ids
+
+
+async def claim_owned_shards(report=True):
+    '''Claim (or renew) our shard leases and return the shard ids this worker evaluates.'''
+    shard_ids = await db.run(alert_lease_db.claim_shards, ALERT_WORKER_ID, SHARD_IDS, ALERT_LEASE_SECONDS)
+    if report:
+        if len(shard_ids) < len(SHARD_IDS):
+            logger.warning(f"Shards {sorted(set(SHARD_IDS) - set(shard_ids))} are leased by another worker, skipping them")
+        unleased = await db.run(alert_lease_db.get_unleased_shards, SHARD_COUNT)
+        if unleased:
+            logger.warning(f"No alert worker holds shards {unleased}; their subscriptions are not being checked")
+    return shard_ids
+
+
+async def load_owned_subscriptions():
+    '''Claim our shard leases and return the subscriptions on them for guilds this bot is in.'''
+    shard_ids = await claim_owned_shards()
+    if not shard_ids:
+        return []
+
+    guild_ids = {guild.id for guild in bot.guilds}
+    return [row for row in await db.run(subscribed_stock_db.get_all_subscriptions, SHARD_COUNT, shard_ids) if row[1] in guild_ids]
+
+
+async def load_owned_rules():
+    '''Alert rules on our shards for guilds this bot is in (the subscription loader reports lease problems).'''
+    shard_ids = await claim_owned_shards(report=False)
+    if not shard_ids:
+        return []
+
+    guild_ids = {guild.id for guild in bot.guilds}
+    return [row for row in await db.run(alert_rule_db.get_all_rules, SHARD_COUNT, shard_ids) if row[1] in guild_ids]
+
+
+# Compiled rule plan, reused across ticks while the stored rules are unchanged
+rule_plan = None
+rule_schedule = market_hours.PollSchedule()
+
+@tasks.loop(seconds=ALERT_INTERVAL_SECONDS)
+async def check_alert_rules():
+    '''Evaluate condition-based alert rules (!rule) and notify servers whose rules became true.'''
+    global rule_plan
+
+    started = time.monotonic()
+    rule_rows = await load_owned_rules()
+    if not rule_rows:
+        return
+    rule_plan = alert_rules.compile_rules(rule_rows, rule_plan)
+
+    tickers = set(rule_plan.tickers)
+    if market_hours.ALERT_MARKET_HOURS:
+        tickers = set(rule_schedule.due(tickers))
+        if not tickers:
+            return
+    # One quote per ticker (shared with the threshold alerts through the cache) and one batched history load
+    history_tickers = sorted(tickers.intersection(rule_plan.history_tickers))
+    try:
+        quotes, histories = await asyncio.gather(
+            market_data.get_quotes(sorted(tickers)),
+            market_data.get_histories(history_tickers, rule_plan.period) if history_tickers else asyncio.sleep(0, {}))
+    except market_data.MarketDataTimeout as e:
+        logger.warning(f"Skipping rule tick: {e}")
+        return
+    rule_schedule.mark_polled(tickers)
+
+    # Tickers that were not due have no data, so their rules keep their state
+    to_alert, to_reset = rule_plan.evaluate(histories, quotes)
+    changes = [(int(rule_id), False) for rule_id in to_reset["rule_id"]]
+    alerted_ids = await send_to_guilds(
+        to_alert, "rule_id", lambda row: build_rule_embed(row.ticker, row.rule, row.value, row.target))
+    changes.extend((rule_id, True) for rule_id in alerted_ids)
+    await db.run(alert_rule_db.apply_rule_states, changes)
+    logger.info(f"Rule tick: wall_time={time.monotonic() - started:.2f}s rules={len(rule_plan)} tickers={len(quotes)} "
+                f"alerts_sent={len(alerted_ids)} send_failures={len(to_alert) - len(alerted_ids)}")
+
+
+# Set when ALERT_PRICE_SOURCE is stream/replay; replaces the minute loop
+stream_engine = None
+
+async def start_alert_engine():
+    '''Start alert evaluation with the configured price source.'''
+    global stream_engine
+    # Rules read daily history and quotes on their own minute loop, whatever the price source
+    if not check_alert_rules.is_running():
+        check_alert_rules.start()
+    if price_stream.ALERT_PRICE_SOURCE == "poll":
+        if not check_stock_percent_changes.is_running():
+            check_stock_percent_changes.start()
+        return
+    if stream_engine is None:
+        stream_engine = price_stream.StreamingAlertEngine(
+            price_stream.create_source(), load_owned_subscriptions, deliver_alerts)
+        await stream_engine.start()
+        logger.info(f"Alert engine running on the {price_stream.ALERT_PRICE_SOURCE} price source")
+
+def notify_subscriptions_changed():
+    '''Let the streaming engine pick up !watch / !unwatch changes right away.'''
+    if stream_engine is not None:
+        stream_engine.request_resync()
+
 
-    logger.info("Checking stock price changes...")
-
-    for guild in bot.guilds:
-        server_id = guild.id
-        subscribed_stocks = subscribed_stock_db.get_subscribed_stocks(server_id)
-
-        # If stock alert channel does not exist, create it
-        channel = discord.utils.get(guild.text_channels, name=STOCKS_ALERT_CHANNEL_NAME)
-        if not channel:
-            # Create read-only channel for stock alerts
-            overwrites = {
-                guild.default_role: discord.PermissionOverwrite(send_messages=False, view_channel=True),
-                guild.me: discord.PermissionOverwrite(send_messages=True, view_channel=True)
-            }
-            channel = await guild.create_text_channel(STOCKS_ALERT_CHANNEL_NAME, overwrites=overwrites)
-            
-            await channel.send("📈 Stock price alerts are now active!")
-            logger.info(f"Created channel: {STOCKS_ALERT_CHANNEL_NAME} in server: {guild.name} ({guild.id})")
-
-        for stock_id, threshold, alerted, last_alerted in subscribed_stocks:
-            ticker = stock_db.get_ticker_by_id(stock_id)
-            stock = yf.Ticker(ticker)
-            info = stock.fast_info
-            price = info.get("lastPrice", None)
-            prev_close = info.get("previousClose", None)
-
-            percent_change = round(((price - prev_close) / prev_close) * 100, 2)
-            if abs(percent_change) >= threshold:
-                if not alerted:
-                    embed = discord.Embed(
-                        title=f"🚨 **{ticker}** Price Alert!",
-                        description=f"The price of **{ticker}** has changed by {percent_change:.2f}% which is above your set threshold of {threshold}%.",
-                        color=discord.Color.green() if percent_change >= 0 else discord.Color.red()
-                    )
-                    embed.set_footer(text="Data provided by Yahoo Finance (yfinance)")
-                    embed.add_field(name=ticker, value=f"Price: {price:.2f} USD\nChange: {percent_change:.2f}%", inline=False)
-                    cur_message = await channel.send(embed=embed)
-                    subscribed_stock_db.mark_stock_as_alerted(server_id, ticker)
-            else: # Reset alert state if price goes back within threshold
-                if alerted:
-                    subscribed_stock_db.reset_stock_alert(server_id, ticker)
\ No newline at end of file
+@check_stock_percent_changes.after_loop
+async def release_alert_shards():
+    '''Hand our shards back immediately on shutdown instead of waiting for the leases to expire.'''
+    await db.run(alert_lease_db.release_shards, ALERT_WORKER_ID)
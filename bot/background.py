@@ -0,0 +1,52 @@
+# Background maintenance loops (cache warm-up and refresh)
+from discord.ext import tasks
+from .config import logger
+from . import market_data
+
+import database_services.identity_map as identity_map
+import database_services.server_db as server_db
+import database_services.server_plan_db as server_plan_db
+import database_services.stock_db as stock_db
+from database_services import db
+
+
+async def warm_caches():
+    '''Load in-memory lookup structures before commands start using them.'''
+    index = await db.run(stock_db.load_stock_index)
+    logger.info(f"Loaded stock index with {len(index)} tickers")
+    servers = await db.run(identity_map.load_servers)
+    logger.info(f"Loaded internal ids for {servers} servers")
+    plans = await db.run(server_plan_db.load_plan_cache)
+    logger.info(f"Loaded plans for {plans} servers")
+    channels = await db.run(server_db.load_alert_channels)
+    logger.info(f"Loaded alert channels for {channels} servers")
+
+
+@tasks.loop(seconds=30)
+async def refresh_stock_index():
+    '''Reload the ticker/name index when utils/init_db.py signals that the stock table changed.'''
+    try:
+        if await db.run(stock_db.refresh_stock_index_if_changed):
+            logger.info(f"Reloaded stock index ({len(stock_db.get_stock_index())} tickers)")
+    except Exception as e:
+        logger.warning(f"Stock index refresh failed, will retry: {e}")
+
+
+@tasks.loop(minutes=10)
+async def log_cache_stats():
+    '''Log market data cache hit rates so TTLs can be tuned.'''
+    stats = market_data.cache_stats()
+    summary = ", ".join(
+        f"{kind}: {counters['hits']} hits/{counters['misses']} misses/{counters['coalesced']} coalesced"
+        for kind, counters in stats["kinds"].items()
+    )
+    logger.info(f"Market data cache ({stats['entries']} entries, {stats['bytes'] / 1024 / 1024:.1f} MB) - {summary}")
+
+
+@tasks.loop(minutes=5)
+async def refresh_plan_cache():
+    '''Reload every server plan so changes written by other bot processes reach this one.'''
+    try:
+        await db.run(server_plan_db.load_plan_cache)
+    except Exception as e:
+        logger.warning(f"Plan cache refresh failed, will retry: {e}")
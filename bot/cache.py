@@ -0,0 +1,182 @@
+# In-process TTL + LRU cache with single-flight request coalescing
+import asyncio
+import pickle
+import time
+from collections import Counter, OrderedDict
+
+
+def estimate_size(value):
+    ''' Approximate memory footprint of a cached value in bytes '''
+    memory_usage = getattr(value, "memory_usage", None)
+    if callable(memory_usage):  # pandas DataFrame / Series
+        usage = memory_usage(deep=True)
+        return int(usage.sum()) if hasattr(usage, "sum") else int(usage)
+    try:
+        return len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return 1024
+
+
+class TTLCache:
+    ''' Async cache keyed by tuples whose second element is the data kind.
+
+    Each kind has its own TTL; entries are evicted least-recently-used first once the
+    total estimated size exceeds max_bytes. Concurrent misses for the same key share one fetch.
+    '''
+
+    def __init__(self, ttls, max_bytes):
+        self.ttls = ttls
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = Counter()
+        self.misses = Counter()
+        self.coalesced = Counter()
+        self.evictions = Counter()
+        self._entries = OrderedDict()  # key -> (expires_at, value, size)
+        self._inflight = {}  # key -> asyncio.Future
+
+    def _kind(self, key):
+        return key[1]
+
+    def get(self, key):
+        ''' Return a fresh cached value or None (does not count as a hit or miss) '''
+        entry = self._entries.get(key)
+        if entry and entry[0] > time.monotonic():
+            self._entries.move_to_end(key)
+            return entry[1]
+        return None
+
+    def put(self, key, value):
+        if value is None:
+            return
+        ttl = self.ttls.get(self._kind(key), 0)
+        if ttl <= 0:
+            return
+        self._remove(key)
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            return
+        self._entries[key] = (time.monotonic() + ttl, value, size)
+        self.size += size
+        while self.size > self.max_bytes:
+            evicted_key, (_, _, evicted_size) = self._entries.popitem(last=False)
+            self.size -= evicted_size
+            self.evictions[self._kind(evicted_key)] += 1
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry:
+            self.size -= entry[2]
+
+    async def get_or_fetch(self, key, fetch):
+        ''' Return the cached value for key, or await fetch() once for all concurrent callers '''
+        while True:
+            value = self.get(key)
+            if value is not None:
+                self.hits[self._kind(key)] += 1
+                return value
+
+            inflight = self._inflight.get(key)
+            if inflight is None:
+                break
+            self.coalesced[self._kind(key)] += 1
+            try:
+                return await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                if not inflight.cancelled():
+                    raise  # we were cancelled ourselves
+                # The fetching caller was cancelled, not us: fetch again (or join whoever already did)
+
+        self.misses[self._kind(key)] += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await fetch()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # mark retrieved when nobody else was waiting
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+        self.put(key, value)
+        future.set_result(value)
+        return value
+
+    async def get_or_fetch_many(self, keys, fetch_many):
+        ''' Batched variant: fetch_many(missing_keys) returns {key: value} for the keys it could load '''
+        results = {}
+        waiting = {}
+        missing = []
+        for key in dict.fromkeys(keys):
+            value = self.get(key)
+            if value is not None:
+                self.hits[self._kind(key)] += 1
+                results[key] = value
+            elif key in self._inflight:
+                self.coalesced[self._kind(key)] += 1
+                waiting[key] = self._inflight[key]
+            else:
+                self.misses[self._kind(key)] += 1
+                missing.append(key)
+
+        loop = asyncio.get_running_loop()
+        futures = {key: loop.create_future() for key in missing}
+        self._inflight.update(futures)
+        try:
+            fetched = await fetch_many(missing) if missing else {}
+        except BaseException as e:
+            for future in futures.values():
+                if isinstance(e, asyncio.CancelledError):
+                    future.cancel()
+                else:
+                    future.set_exception(e)
+                    future.exception()
+            raise
+        finally:
+            for key in missing:
+                self._inflight.pop(key, None)
+
+        for key, future in futures.items():
+            value = fetched.get(key)
+            if value is not None:
+                self.put(key, value)
+                results[key] = value
+            future.set_result(value)
+
+        retry = []
+        for key, future in waiting.items():
+            try:
+                value = await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if future.cancelled():  # the fetching caller was cancelled, not us: fetch it ourselves
+                    retry.append(key)
+                    continue
+                raise
+            except Exception:
+                continue
+            if value is not None:
+                results[key] = value
+        if retry:
+            results.update(await self.get_or_fetch_many(retry, fetch_many))
+        return results
+
+    def stats(self):
+        ''' Hit/miss/coalesced/eviction counters per kind plus current size '''
+        kinds = set(self.ttls) | set(self.hits) | set(self.misses)
+        return {
+            "entries": len(self._entries),
+            "bytes": self.size,
+            "kinds": {
+                kind: {
+                    "hits": self.hits[kind],
+                    "misses": self.misses[kind],
+                    "coalesced": self.coalesced[kind],
+                    "evictions": self.evictions[kind],
+                }
+                for kind in sorted(kinds)
+            },
+        }
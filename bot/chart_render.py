@@ -0,0 +1,64 @@
+# Chart rendering for the chart process pool. Imports only matplotlib so spawned workers stay free of the bot's
+# Discord client, command modules and log files
+import matplotlib
+import matplotlib.dates as mdates
+import matplotlib.style
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from io import BytesIO
+
+
+def build_plot( data: list , title: str, x_label: str, y_label: str, line_labels:list, line_colors: list, overlays: list = ()):
+    ''' Build a matplotlib plot from given data; overlays are (x, y, label, color) lines drawn thin and unfilled'''
+    # Create chart with the object-oriented Agg API (no pyplot global figure state)
+    with matplotlib.rc_context(matplotlib.style.library["dark_background"]):
+        fig = Figure(figsize=(9, 4))
+        FigureCanvasAgg(fig)
+        ax = fig.subplots()
+        _draw_plot(fig, ax, data, title, x_label, y_label, line_labels, line_colors, overlays)
+
+        # Save to buffer
+        buffer = BytesIO()
+        fig.savefig(buffer, format="png", dpi=150)
+    buffer.seek(0)
+
+    return buffer
+
+def render_plot_png(*args):
+    ''' build_plot returning raw PNG bytes (picklable result for the chart process pool) '''
+    return build_plot(*args).getvalue()
+
+def _draw_plot(fig, ax, data, title, x_label, y_label, line_labels, line_colors, overlays=()):
+    index = 0
+
+    ax.set_title(title, fontsize=14, weight="bold", color="white")
+    ax.set_ylabel(y_label, fontsize=12, color="white")
+    ax.set_xlabel(x_label, fontsize=12, color="white")
+    y_min = min([min(y) for x,y in data])
+    # y_min = min([min(v for v in y if v) for x, y in data])
+    for x,y in data:
+        line_color = line_colors[index]
+        ax.plot(x, y, color=line_color, linewidth=2, label=line_labels[index])
+        ax.fill_between(x, y, y_min, color=line_color, alpha=0.1)
+        index += 1
+
+    for x, y, label, color in overlays:
+        ax.plot(x, y, color=color, linewidth=1.2, linestyle="--", label=label)
+
+    if len(data) + len(overlays) > 1:
+        ax.legend()
+    # Format x-axis
+    ax.xaxis.set_major_locator(mdates.AutoDateLocator())
+    ax.xaxis.set_major_formatter(mdates.DateFormatter("%b %d"))
+    fig.autofmt_xdate(rotation=30)
+
+    # Aesthetics
+    ax.spines["top"].set_visible(False)
+    ax.spines["right"].set_visible(False)
+    ax.spines["left"].set_color("gray")
+    ax.spines["bottom"].set_color("gray")
+    ax.tick_params(axis="x", colors="gray")
+    ax.tick_params(axis="y", colors="gray")
+    ax.grid(color="gray", linestyle="--", linewidth=0.5, alpha=0.3)
+
+    fig.tight_layout()
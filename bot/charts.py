@@ -0,0 +1,43 @@
+# Chart rendering service: PNGs are rendered in worker processes and cached by the data they show
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from .cache import TTLCache
+from .chart_render import render_plot_png
+from . import market_data
+
+CHART_WORKERS = int(os.getenv("CHART_WORKERS", 2))
+# Charts live as long as the history they were drawn from
+CHART_CACHE_TTL = float(os.getenv("CACHE_TTL_CHART", market_data.CACHE_TTLS["history"]))
+CHART_CACHE_MAX_MB = float(os.getenv("CHART_CACHE_MAX_MB", 32))
+
+chart_cache = TTLCache({"chart": CHART_CACHE_TTL}, int(CHART_CACHE_MAX_MB * 1024 * 1024))
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        # spawn keeps the workers free of the bot's threads and event loop state; launched with `python -m bot`,
+        # workers import only bot.chart_render (spawn never re-imports a package's __main__)
+        _executor = ProcessPoolExecutor(max_workers=CHART_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _executor
+
+
+def chart_key(tickers, period, chart_type, histories):
+    ''' Cache key for a chart: the tickers, period, chart type and timestamp of the newest bar shown '''
+    data_timestamp = max(hist.index[-1] for hist in histories)
+    return (tuple(tickers), "chart", period, chart_type, str(data_timestamp))
+
+
+async def render_chart(key, data, title, x_label, y_label, line_labels, line_colors, overlays=()):
+    ''' Return a PNG buffer for the chart, rendering it in the process pool only on a cache miss '''
+    async def render():
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_get_executor(), render_plot_png,
+                                          data, title, x_label, y_label, line_labels, line_colors, overlays)
+
+    png = await chart_cache.get_or_fetch(key, render)
+    return BytesIO(png)
@@ -0,0 +1,52 @@
+# Vectorised comparison statistics for several price series over a shared date index
+import pandas as pd
+
+
+def align_closes(histories):
+    ''' Close prices as one frame (a column per ticker) on the union of trading days.
+
+    Days where one market was closed carry its previous close forward; the leading days before every
+    series has started are dropped so all columns share a first row.
+    '''
+    closes = pd.concat({ticker: hist["Close"] for ticker, hist in histories.items()}, axis=1)
+    return closes.sort_index().ffill().dropna()
+
+
+def normalized_returns(closes):
+    ''' Cumulative return in percent since the first shared day '''
+    return (closes / closes.iloc[0] - 1) * 100
+
+
+def daily_returns(closes):
+    return closes.pct_change().dropna(how="all")
+
+
+def correlation(closes):
+    ''' Correlation matrix of daily returns '''
+    return daily_returns(closes).corr()
+
+
+def betas(closes, benchmark):
+    ''' Beta of every column against the benchmark column: cov(r, r_b) / var(r_b) '''
+    returns = daily_returns(closes)
+    return returns.cov()[benchmark] / returns[benchmark].var()
+
+
+def max_drawdowns(closes):
+    ''' Largest peak-to-trough fall of each column, in percent (negative) '''
+    return (closes / closes.cummax() - 1).min() * 100
+
+
+def summarize(histories, benchmark=None):
+    ''' All comparison statistics for {ticker: history frame}; returns a dict of frames/series '''
+    closes = align_closes(histories)
+    returns = normalized_returns(closes)
+    return {
+        "closes": closes,
+        "returns": returns,
+        "total_return": returns.iloc[-1],
+        "volatility": daily_returns(closes).std() * (252 ** 0.5) * 100,
+        "max_drawdown": max_drawdowns(closes),
+        "correlation": correlation(closes),
+        "beta": betas(closes, benchmark) if benchmark else None,
+    }
@@ -1,141 +1,219 @@
 
+import asyncio
 import discord
 from discord.ext import commands
-import yfinance as yf
 import matplotlib.dates as mdates
 from .config import bot, logger
-from .helpers import build_plot, round_large_number
+from .helpers import round_large_number
+from . import market_data, charts, comparison_engine, history_store
 
 import database_services.server_plan_db as server_plan_db
 import database_services.stock_db as stock_db
+from database_services import db
+
+
+# Most tickers in one !compare (the benchmark comes on top)
+COMPARE_MAX_TICKERS = 10
+COMPARE_PERIODS = set(history_store.PERIOD_DAYS) | set(history_store.PERIOD_BARS) | {"ytd", "max"}
+BENCHMARK_ALIASES = {"SP500": "^GSPC", "S&P500": "^GSPC", "SPX": "^GSPC", "NASDAQ": "^IXIC", "DOW": "^DJI"}
+BENCHMARK_NAMES = {"^GSPC": "S&P 500", "^IXIC": "NASDAQ", "^DJI": "Dow Jones"}
+LINE_COLORS = ["#1f77b4", "#ff7f0e", "#2ca02c", "#d62728", "#9467bd", "#8c564b",
+               "#e377c2", "#bcbd22", "#17becf", "#7f7f7f", "#ffffff"]
+
+
+def parse_compare_args(args):
+    '''Split "AAPL MSFT vs SP500 6mo" into (symbols, period, benchmark symbol or None).
+
+    A bare period word is only read as the last token (or anywhere as period=6mo), and not at all when that would
+    leave nothing to compare, so tickers such as MAX stay usable.
+    '''
+    tokens, period = [], None
+    for token in args:
+        if token.lower().startswith("period="):
+            period = token.split("=", 1)[1].lower()
+        else:
+            tokens.append(token)
+
+    def split(tokens):
+        symbols, benchmark = [], None
+        remaining = iter(tokens)
+        for token in remaining:
+            if token.lower() == "vs":
+                benchmark = next(remaining, None)
+            else:
+                symbols.append(token)
+        return symbols, benchmark
+
+    if period is None and tokens and tokens[-1].lower() in COMPARE_PERIODS and (len(tokens) < 2 or tokens[-2].lower() != "vs"):
+        symbols, benchmark = split(tokens[:-1])
+        if len(symbols) + (1 if benchmark else 0) >= 2:
+            return symbols, tokens[-1].lower(), benchmark
+    symbols, benchmark = split(tokens)
+    return symbols, period or "1y", benchmark
+
+
+def resolve_benchmark(symbol):
+    '''Index symbols (^GSPC) and aliases (SP500) are used as-is, anything else goes through the stock lookup.'''
+    alias = BENCHMARK_ALIASES.get(symbol.upper())
+    if alias:
+        return alias
+    if symbol.startswith("^"):
+        return symbol.upper()
+    return stock_db.get_ticker_by_name(symbol)
+
+
+def _correlation_table(correlation, labels):
+    '''Correlation matrix as a monospace table, or None if it does not fit in an embed field.'''
+    width = max(len(label) for label in labels) + 1
+    header = " " * width + "".join(f"{label[:6]:>7}" for label in labels)
+    rows = [f"{label:<{width}}" + "".join(f"{value:>7.2f}" for value in correlation.loc[ticker])
+            for ticker, label in zip(correlation.index, labels)]
+    table = "```\n" + "\n".join([header] + rows) + "\n```"
+    return table if len(table) <= 1024 else None
+
+
+def _info_lines(tickers, infos, key, fmt):
+    lines = [f"{ticker}: {fmt(info[key])}" if info.get(key) is not None else f"{ticker}: N/A"
+             for ticker, info in zip(tickers, infos)]
+    return "\n".join(lines)
+
+
+async def send_comparison(ctx, tickers, benchmark, period, fundamentals=True):
+    '''Fetch every series in one batch, compute the comparison statistics and send them with one chart.'''
+    series = tickers + ([benchmark] if benchmark and benchmark not in tickers else [])
+    labels = [BENCHMARK_NAMES.get(ticker, ticker) for ticker in series]
+
+    # Company info comes from the shared cache; a ticker whose info fails just shows N/A
+    histories, *infos = await asyncio.gather(
+        market_data.get_histories(series, period),
+        *(market_data.get_info(ticker) for ticker in (tickers if fundamentals else [])),
+        return_exceptions=True)
+    if isinstance(histories, BaseException):
+        raise histories
+    infos = [info if isinstance(info, dict) else {} for info in infos]
+    for ticker, label in zip(series, labels):
+        hist = histories.get(ticker)
+        if hist is None or hist.empty:
+            await ctx.send(f"❌ No historical data found for **{label}** with period `{period}`.")
+            return
 
+    stats = comparison_engine.summarize({ticker: histories[ticker] for ticker in series}, benchmark)
+    returns = stats["returns"]
+    if len(returns) < 2:
+        await ctx.send(f"❌ Not enough overlapping history to compare these tickers over `{period}`.")
+        return
 
-@bot.command()
-async def compare(ctx, arg1, arg2, period="1y"):
-    '''PAID COMMAND. Compare historical stock data for two given ticker symbols and period (default: 1 month).'''
-
-    # Check if server has a paid plan
-    server_id = ctx.message.guild.id
-    plan = server_plan_db.get_server_plan(server_id)
+    x = mdates.date2num(returns.index.to_pydatetime())
+    data = [(x, returns[ticker].values) for ticker in series]
+    title = " vs ".join(labels)
+    key = charts.chart_key(series, period, "return", [histories[ticker] for ticker in series])
+    buffer = await charts.render_chart(key, data, f"{title} - Last {period}", "Date", "Return (%)",
+                                       labels, LINE_COLORS[:len(series)])
+
+    embed = discord.Embed(
+        title=f"📊 {title} Comparison"[:256],
+        description=f"Returns since {returns.index[0]:%b %d, %Y}, aligned on shared trading days",
+        color=0x1f77b4
+    )
+    # Set footer
+    embed.set_footer(text="Data provided by Yahoo Finance (yfinance)")
+
+    def lines(values, fmt):
+        return "\n".join(f"{label}: {fmt.format(values[ticker])}" for ticker, label in zip(series, labels))
+
+    embed.add_field(name="📈 Return", value=lines(stats["total_return"], "{:+.2f}%"), inline=True)
+    embed.add_field(name="📉 Max Drawdown", value=lines(stats["max_drawdown"], "{:.2f}%"), inline=True)
+    embed.add_field(name="〰️ Volatility (ann.)", value=lines(stats["volatility"], "{:.2f}%"), inline=True)
+    if benchmark:
+        benchmark_label = BENCHMARK_NAMES.get(benchmark, benchmark)
+        embed.add_field(name=f"β vs {benchmark_label}", value="\n".join(
+            f"{label}: {stats['beta'][ticker]:.2f}" for ticker, label in zip(series, labels) if ticker != benchmark), inline=True)
+
+    if fundamentals:
+        embed.add_field(name="🏦 Market Cap", value=_info_lines(tickers, infos, "marketCap", lambda v: f"${round_large_number(v)}"), inline=True)
+        embed.add_field(name="📊 Trailing P/E", value=_info_lines(tickers, infos, "trailingPE", lambda v: f"{v:.2f}"), inline=True)
+        embed.add_field(name="💰 Dividend Yield", value=_info_lines(tickers, infos, "dividendYield", lambda v: f"{v:.2f}%"), inline=True)
+        embed.add_field(name="📈 Beta (Yahoo)", value=_info_lines(tickers, infos, "beta", lambda v: f"{v:.2f}"), inline=True)
+
+    table = _correlation_table(stats["correlation"], labels)
+    if table is None:
+        # Too many series for a full matrix: correlation with the benchmark (or first ticker) only
+        anchor = benchmark or series[0]
+        table = "\n".join(f"{label}: {stats['correlation'].loc[ticker, anchor]:.2f}"
+                           for ticker, label in zip(series, labels) if ticker != anchor)
+    embed.add_field(name="🔗 Correlation (daily returns)", value=table, inline=False)
+
+    file = discord.File(buffer, filename="chart.png")
+    embed.set_image(url="attachment://chart.png")
+    await ctx.send(file=file, embed=embed)
+
+
+async def _require_pro(ctx):
+    plan = await db.run(server_plan_db.get_server_plan, ctx.message.guild.id)
     if not plan or plan[0] != "PRO":
         await ctx.send("❌ This command is available for PRO plan subscribers only. Please upgrade your plan to access this feature.")
+        return False
+    return True
+
+
+@bot.command()
+async def compare(ctx, *args):
+    '''PAID COMMAND. Compare up to 10 tickers, optionally against a benchmark (e.g. !compare AAPL MSFT NVDA vs SP500 1y).'''
+    if not await _require_pro(ctx):
         return
 
-    ticker1 = stock_db.get_ticker_by_name(arg1)
-    ticker2 = stock_db.get_ticker_by_name(arg2)
-    if not ticker1:
-        await ctx.send(f"❌ Ticker symbol for '{arg1}' not found.")
+    symbols, period, benchmark_symbol = parse_compare_args(args)
+    if period not in COMPARE_PERIODS:
+        await ctx.send(f"❌ Unknown period '{period}'. Use one of: {', '.join(sorted(COMPARE_PERIODS))}.")
         return
-    if not ticker2:
-        await ctx.send(f"❌ Ticker symbol for '{arg2}' not found.")
+    if len(symbols) > COMPARE_MAX_TICKERS:
+        await ctx.send(f"❌ You can compare at most {COMPARE_MAX_TICKERS} tickers at once.")
         return
 
-    try:
-        stock1 = yf.Ticker(ticker1)
-        stock2 = yf.Ticker(ticker2)
-        hist1 = stock1.history(period=period)
-        hist2 = stock2.history(period=period)
-
-        if hist1.empty:
-            await ctx.send(f"❌ No historical data found for **{ticker1}** with period `{period}`.")
+    tickers = []
+    for symbol in symbols:
+        ticker = stock_db.get_ticker_by_name(symbol)
+        if not ticker:
+            await ctx.send(f"❌ Ticker symbol for '{symbol}' not found.")
             return
-        if hist2.empty:
-            await ctx.send(f"❌ No historical data found for **{ticker2}** with period `{period}`.")
+        if ticker not in tickers:
+            tickers.append(ticker)
+
+    benchmark = None
+    if benchmark_symbol:
+        benchmark = resolve_benchmark(benchmark_symbol)
+        if not benchmark:
+            await ctx.send(f"❌ Benchmark '{benchmark_symbol}' not found.")
             return
 
-        # Prepare data
-        x1 = mdates.date2num(hist1.index.to_pydatetime())
-        y1 = hist1["Close"].values
-        x2 = mdates.date2num(hist2.index.to_pydatetime())
-        y2 = hist2["Close"].values
-        buffer = build_plot([(x1, y1), (x2, y2)], 
-        f"{ticker1} vs {ticker2} - Last {period}", "Date", "Price (USD)", [ticker1, ticker2], ["#1f77b4", "#ff7f0e"])
-        # create embed
-        embed = discord.Embed(
-            title=f"📊 {ticker1} vs {ticker2} Comparison",
-            description=f"Comparison of **{ticker1}** and **{ticker2}**",
-            color=0x1f77b4
-        )
-        # Set footer
-        embed.set_footer(text="Data provided by Yahoo Finance (yfinance)")
-        # Compare key metrics
-        info1 = stock1.info
-        info2 = stock2.info
-        market_cap1 = info1.get("marketCap", None)
-        market_cap2 = info2.get("marketCap", None)
-        pe1 = info1.get("trailingPE", None)
-        pe2 = info2.get("trailingPE", None)
-        dividend_yield1 = info1.get("dividendYield", 0)
-        dividend_yield2 = info2.get("dividendYield", 0)
-        beta1 = info1.get("beta", None)
-        beta2 = info2.get("beta", None)
-        embed.add_field(name="🏦 Market Cap", value=f"{ticker1}: ${round_large_number(market_cap1)}\n{ticker2}: ${round_large_number(market_cap2)}" if market_cap1 and market_cap2 else "N/A", inline=True)
-        embed.add_field(name="📊 Trailing P/E", value=f"{ticker1}: {pe1:.2f}\n{ticker2}: {pe2:.2f}" if pe1 and pe2 else "N/A", inline=True)
-        embed.add_field(name="💰 Dividend Yield", value=f"{ticker1}: {dividend_yield1:.2f}%\n{ticker2}: {dividend_yield2:.2f}%", inline=True)
-        embed.add_field(name="📈 Beta", value=f"{ticker1}: {beta1:.2f}\n{ticker2}: {beta2:.2f}" if beta1 and beta2 else "N/A", inline=True)
-        
-
-        file = discord.File(buffer, filename="chart.png")
-        embed.set_image(url="attachment://chart.png")
-        await ctx.send(file=file, embed=embed)
+    if len(tickers) + (1 if benchmark and benchmark not in tickers else 0) < 2:
+        await ctx.send("❌ Usage: `!compare <ticker1> <ticker2> ... [vs <benchmark>] [period]`")
+        return
+
+    try:
+        await send_comparison(ctx, tickers, benchmark, period)
+    except market_data.MarketDataTimeout:
+        raise
     except Exception as e:
+        logger.warning(f"Comparison of {tickers} failed: {e}")
         await ctx.send(f"⚠️ Error generating comparison chart: {str(e)}")
 
 # Function to compare stock against s&p 500
 @bot.command()
 async def compare_sp500(ctx, arg, period="1y"):
     '''PAID COMMAND. Compare historical stock data for a given ticker symbol against S&P 500 index and period (default: 1 year).'''
-
-    # Check if server has a paid plan
-    server_id = ctx.message.guild.id
-    plan = server_plan_db.get_server_plan(server_id)
-    if not plan or plan[0] != "PRO":
-        await ctx.send("❌ This command is available for PRO plan subscribers only. Please upgrade your plan to access this feature.")
+    if not await _require_pro(ctx):
         return
 
     ticker = stock_db.get_ticker_by_name(arg)
-    sp500_ticker = "^GSPC"  # Yahoo Finance ticker for S&P 500
     if not ticker:
         await ctx.send(f"❌ Ticker symbol for '{arg}' not found.")
         return
 
     try:
-        stock = yf.Ticker(ticker)
-        sp500 = yf.Ticker(sp500_ticker)
-        hist_stock = stock.history(period=period)
-        hist_sp500 = sp500.history(period=period)
-
-        if hist_stock.empty:
-            await ctx.send(f"❌ No historical data found for **{ticker}** with period `{period}`.")
-            return
-        if hist_sp500.empty:
-            await ctx.send(f"❌ No historical data found for S&P 500 with period `{period}`.")
-            return
-
-        # Prepare data
-        x_stock = mdates.date2num(hist_stock.index.to_pydatetime())
-        x_sp500 = mdates.date2num(hist_sp500.index.to_pydatetime())
-        # Normalize both series to 100 at the start
-        y_stock = (hist_stock["Close"].values / hist_stock["Close"].values[0] - 1) * 100
-        y_sp500 = (hist_sp500["Close"].values / hist_sp500["Close"].values[0] - 1) * 100
-
-        sp_return = round(y_sp500[-1],2)
-        stock_return = round(y_stock[-1],2)
-
-        embed = discord.Embed(
-            title=f"📊 {ticker} vs S&P 500 Comparison",
-            description=f"Comparison of **{ticker}** and **S&P 500**",
-            color=0x1f77b4
-        )
-        # Set footer
-        embed.set_footer(text="Data provided by Yahoo Finance (yfinance)")
-        # Compare returns
-        embed.add_field(name="S&P 500 Return", value=f"{sp_return}%", inline=True)
-        embed.add_field(name=f"{ticker} Return", value=f"{stock_return}%", inline=True)
-        buffer = build_plot([(x_stock, y_stock), (x_sp500, y_sp500)], 
-        f"{ticker} vs S&P 500 - Last {period}", "Date", "Return (%)", [ticker, "S&P 500"], ["#1f77b4", "#ff7f0e"])
-        file = discord.File(buffer, filename="chart.png")
-        embed.set_image(url="attachment://chart.png")
-        await ctx.send(file=file, embed=embed)
+        await send_comparison(ctx, [ticker], "^GSPC", period, fundamentals=False)
+    except market_data.MarketDataTimeout:
+        raise
     except Exception as e:
-        await ctx.send(f"⚠️ Error generating comparison chart: {str(e)}")
\ No newline at end of file
+        logger.warning(f"Comparison of {ticker} with the S&P 500 failed: {e}")
+        await ctx.send(f"⚠️ Error generating comparison chart: {str(e)}")
@@ -9,26 +9,43 @@ load_dotenv()
 
 token = os.getenv("DISCORD_TOKEN")
 
-handler = logging.FileHandler(filename='discord.log', encoding="utf-8", mode="w")
 intents = discord.Intents.default()
 intents.message_content = True
 intents.members = True
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('aurelius.log'),  # Your app logs
-        logging.StreamHandler()  # Also print to console
-    ]
-)
 logger = logging.getLogger('aurelius')
 
+
+def setup_logging():
+    ''' Configure app logging and return discord.py's log handler; only the entry point calls it, so chart workers never truncate discord.log '''
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler('aurelius.log'),  # Your app logs
+            logging.StreamHandler()  # Also print to console
+        ]
+    )
+    return logging.FileHandler(filename='discord.log', encoding="utf-8", mode="w")
+
+# Sharding: run several processes, each connecting the Discord shards listed in SHARD_IDS (e.g. "0,1")
+# and evaluating alerts only for guilds on those shards
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", 1))
+SHARD_IDS = [int(shard) for shard in os.getenv("SHARD_IDS", ",".join(str(i) for i in range(SHARD_COUNT))).split(",") if shard.strip()]
+
 # Shared bot instance
-bot = commands.Bot(command_prefix='!', intents=intents, help_command=None)
+if SHARD_COUNT > 1:
+    bot = commands.AutoShardedBot(command_prefix='!', intents=intents, help_command=None,
+                                  shard_count=SHARD_COUNT, shard_ids=SHARD_IDS)
+else:
+    bot = commands.Bot(command_prefix='!', intents=intents, help_command=None)
 
 # Constants
 STOCKS_ALERT_CHANNEL_NAME = "stock-alerts"
 FREE_PLAN_MAX_WATCHED_STOCKS = int(os.getenv("FREE_PLAN_MAX_WATCHED_STOCKS", 5))
 PRO_PLAN_MAX_WATCHED_STOCKS = int(os.getenv("PRO_PLAN_MAX_WATCHED_STOCKS", 50))
-NEWS_PER_PAGE = 5
\ No newline at end of file
+FREE_PLAN_MAX_ALERT_RULES = int(os.getenv("FREE_PLAN_MAX_ALERT_RULES", 3))
+PRO_PLAN_MAX_ALERT_RULES = int(os.getenv("PRO_PLAN_MAX_ALERT_RULES", 50))
+NEWS_PER_PAGE = 5
+# Seconds an alert shard lease stays valid without renewal (must exceed the alert interval)
+ALERT_LEASE_SECONDS = int(os.getenv("ALERT_LEASE_SECONDS", 180))
\ No newline at end of file
@@ -0,0 +1,125 @@
+# Outbound alert messages: queued, sent concurrently and kept under Discord's rate limits
+import asyncio
+import os
+import random
+import time
+import discord
+from .config import logger
+from . import metrics
+
+# Channels sent to at the same time
+ALERT_SENDERS = int(os.getenv("ALERT_SENDERS", 16))
+# Bot-wide messages per second (Discord allows 50 requests/s; leave room for commands)
+ALERT_GLOBAL_RATE = float(os.getenv("ALERT_GLOBAL_RATE", 40))
+# Messages per channel every 5 seconds
+ALERT_CHANNEL_RATE = float(os.getenv("ALERT_CHANNEL_RATE", 5))
+ALERT_SEND_RETRIES = int(os.getenv("ALERT_SEND_RETRIES", 3))
+ALERT_SEND_BACKOFF = float(os.getenv("ALERT_SEND_BACKOFF", 1))
+
+
+class RateLimiter:
+    ''' Token bucket allowing `rate` acquisitions every `per` seconds, with bursts up to `rate` '''
+
+    def __init__(self, rate, per=1.0):
+        self.capacity = rate
+        self.tokens = rate
+        self.fill_rate = rate / per
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.fill_rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.fill_rate)
+
+
+def _is_retryable(error):
+    if isinstance(error, discord.HTTPException):
+        return error.status == 429 or error.status >= 500
+    return isinstance(error, (OSError, asyncio.TimeoutError))
+
+
+class AlertDispatcher:
+    ''' A queue of per-channel batches drained by a bounded set of sender tasks.
+
+    Messages for one channel go out in order under its own limit; different channels are sent
+    concurrently, all sharing the bot-wide limit. send() resolves once every message is delivered or given up on.
+    '''
+
+    def __init__(self, senders=ALERT_SENDERS, global_rate=ALERT_GLOBAL_RATE, channel_rate=ALERT_CHANNEL_RATE,
+                 retries=ALERT_SEND_RETRIES, backoff=ALERT_SEND_BACKOFF):
+        self.senders = senders
+        self.global_limiter = RateLimiter(global_rate)
+        self.channel_rate = channel_rate
+        self.channel_limiters = {}  # channel id -> RateLimiter
+        self.retries = retries
+        self.backoff = backoff
+        self._queue = None
+        self._workers = []
+
+    def _ensure_workers(self):
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        self._workers = [worker for worker in self._workers if not worker.done()]
+        while len(self._workers) < self.senders:
+            self._workers.append(asyncio.create_task(self._worker()))
+
+    async def send(self, channel, embeds):
+        ''' Queue embeds for one channel; returns a delivered flag per embed '''
+        self._ensure_workers()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((channel, embeds, future))
+        return await future
+
+    async def _worker(self):
+        while True:
+            channel, embeds, future = await self._queue.get()
+            try:
+                results = []
+                for embed in embeds:
+                    results.append(await self._send_one(channel, embed))
+                if not future.done():
+                    future.set_result(results)
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            finally:
+                self._queue.task_done()
+
+    async def _send_one(self, channel, embed):
+        limiter = self.channel_limiters.get(channel.id)
+        if limiter is None:
+            limiter = self.channel_limiters[channel.id] = RateLimiter(self.channel_rate, 5)
+
+        for attempt in range(self.retries + 1):
+            await limiter.acquire()
+            await self.global_limiter.acquire()
+            send_started = time.monotonic()
+            error = None
+            try:
+                await channel.send(embed=embed)
+            except (discord.HTTPException, OSError, asyncio.TimeoutError) as e:
+                error = e
+            # Observed before any backoff so the histogram only holds time spent in the Discord call
+            metrics.discord_send_latency.observe(time.monotonic() - send_started)
+            if error is not None:
+                if not _is_retryable(error) or attempt == self.retries:
+                    logger.warning(f"Failed to send alert to channel {channel.id} in server {channel.guild.id}: {error}")
+                    metrics.alert_send_failures.inc()
+                    return False
+                metrics.alert_send_retries.inc()
+                # Exponential backoff with jitter so a burst of failures does not retry in lockstep
+                await asyncio.sleep(self.backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+                continue
+            metrics.alerts_sent.inc()
+            return True
+        return False
+
+
+dispatcher = AlertDispatcher()
@@ -1,8 +1,12 @@
 import discord
 from discord.ext import commands
-from .config import bot, logger
+from .config import bot, logger, STOCKS_ALERT_CHANNEL_NAME
+from . import alerts
 
+import database_services.server_db as server_db
 import database_services.server_plan_db as server_plan_db
+import database_services.subscribed_stock_db as subscribed_stock_db
+from database_services import db
 
 
 @bot.event
@@ -18,7 +22,7 @@ async def on_entitlement_create(entitlement):
     user_id = int(entitlement.user_id)
     entitlement_id = int(entitlement.id)
 
-    server_plan_db.create_entitlement(guild_id, user_id, entitlement_id, plan_name)
+    await db.run(server_plan_db.create_entitlement, guild_id, user_id, entitlement_id, plan_name)
     logger.info(f"Applied entitlement: Guild {guild_id}, User {user_id}, Plan {plan_name}")
 
 @bot.event
@@ -37,16 +41,17 @@ async def on_entitlement_update(entitlement):
     # Check if the entitlement is still active
     if entitlement.deleted:
         logger.warning(f"Entitlement {entitlement_id} is deleted. Revoking plan for Guild {guild_id}.")
-        server_plan_db.remove_entitlement(guild_id, entitlement_id)
+        await db.run(server_plan_db.remove_entitlement, guild_id, entitlement_id)
     else: # Update/Renewal
-        current_plan = server_plan_db.get_server_plan(guild_id)
+        # The stored plan, even past end_date, so a late renewal is still recognised as one
+        current_plan = await db.run(server_plan_db.get_server_plan, guild_id, include_lapsed=True)
         if current_plan and current_plan[0] == plan_name:
             # Same plan, just a renewal
             logger.info(f"Renewing {plan_name} plan for Guild {guild_id}.")
-            server_plan_db.renew_entitlement(guild_id, entitlement_id)
+            await db.run(server_plan_db.renew_entitlement, guild_id, entitlement_id)
         else:
             # Plan change
-            server_plan_db.create_entitlement(guild_id, user_id, entitlement_id, plan_name)
+            await db.run(server_plan_db.create_entitlement, guild_id, user_id, entitlement_id, plan_name)
             logger.info(f"Changed entitlement: Guild {guild_id}, User {user_id}, Plan {plan_name}")
 
 
@@ -56,7 +61,30 @@ async def on_entitlement_delete(entitlement):
     guild_id = int(entitlement.guild_id)
     entitlement_id = int(entitlement.id)
 
-    server_plan_db.remove_entitlement(guild_id, entitlement_id)
+    await db.run(server_plan_db.remove_entitlement, guild_id, entitlement_id)
     logger.info(f"Revoked entitlement: Guild {guild_id}, Entitlement ID {entitlement_id}")
 
+@bot.event
+async def on_guild_channel_delete(channel):
+    '''Forget a deleted alert channel, recreating it right away if the server still watches stocks.'''
+    guild = channel.guild
+    if server_db.get_alert_channel_id(guild.id) != channel.id:
+        return
+    await db.run(server_db.set_alert_channel_id, guild.id, None)
+    logger.info(f"Alert channel deleted in server: {guild.name} ({guild.id})")
+    if await db.run(subscribed_stock_db.get_subscribed_stocks, guild.id):
+        try:
+            await alerts.ensure_alert_channel(guild)
+        except discord.HTTPException as e:
+            logger.warning(f"Could not recreate alert channel in server {guild.id}: {e}")
+
+@bot.event
+async def on_guild_channel_update(before, after):
+    '''Adopt a text channel renamed to the alert channel name when the server has none stored.'''
+    if not isinstance(after, discord.TextChannel) or after.name != STOCKS_ALERT_CHANNEL_NAME:
+        return
+    current = after.guild.get_channel(server_db.get_alert_channel_id(after.guild.id) or 0)
+    if current is None:
+        await db.run(server_db.set_alert_channel_id, after.guild.id, after.id)
+
 # Events are registered when this module is imported
\ No newline at end of file
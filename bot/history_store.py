@@ -0,0 +1,165 @@
+# Local daily OHLCV store: serves history from Postgres and only asks Yahoo for bars newer than the last stored date
+import datetime
+import pandas as pd
+import yfinance as yf
+from .config import logger
+from . import metrics
+from .indicators import IndicatorSet, INDICATOR_COLUMNS
+
+import database_services.history_db as history_db
+
+HISTORY_COLUMNS = ["Open", "High", "Low", "Close", "Volume"]
+# Earliest date requested for period="max"
+MAX_START = datetime.date(1900, 1, 1)
+# Calendar days looked back for each yfinance period string
+PERIOD_DAYS = {"1mo": 31, "3mo": 92, "6mo": 183, "1y": 366, "2y": 731, "5y": 1827, "10y": 3653}
+# Periods expressed in trading days (yfinance returns the last N daily bars)
+PERIOD_BARS = {"1d": 1, "5d": 5}
+# Extra calendar days downloaded before a new window so its first bars already have warmed-up indicators (SMA 50)
+INDICATOR_WARMUP_DAYS = 120
+
+
+def period_start(period, today):
+    ''' First calendar date covered by a yfinance period string, or None if the store cannot serve it '''
+    if period in PERIOD_DAYS:
+        return today - datetime.timedelta(days=PERIOD_DAYS[period])
+    if period in PERIOD_BARS:
+        # Enough calendar days to contain N trading days across a long weekend
+        return today - datetime.timedelta(days=PERIOD_BARS[period] * 2 + 4)
+    if period == "ytd":
+        return datetime.date(today.year, 1, 1)
+    if period == "max":
+        return MAX_START
+    return None
+
+
+def _to_bars(hist):
+    ''' Convert a yfinance history frame to (date, open, high, low, close, volume) rows '''
+    bars = []
+    for timestamp, row in hist[HISTORY_COLUMNS].dropna(subset=["Close"]).iterrows():
+        volume = row["Volume"]
+        bars.append((timestamp.date(), float(row["Open"]), float(row["High"]), float(row["Low"]),
+                     float(row["Close"]), int(volume) if pd.notna(volume) else None))
+    return bars
+
+
+def _to_frame(rows):
+    frame = pd.DataFrame(rows, columns=["Date"] + HISTORY_COLUMNS + INDICATOR_COLUMNS)
+    frame["Date"] = pd.to_datetime(frame["Date"])
+    frame[INDICATOR_COLUMNS] = frame[INDICATOR_COLUMNS].astype(float)
+    return frame.set_index("Date")
+
+
+def _has_corporate_action(hist):
+    ''' Splits and dividends retroactively change adjusted prices, so stored bars must be refetched '''
+    for column in ("Stock Splits", "Dividends"):
+        if column in hist and (hist[column].fillna(0) != 0).any():
+            return True
+    return False
+
+
+def _download(ticker, start, period=None):
+    stock = yf.Ticker(ticker)
+    with metrics.track_yfinance("history"):
+        return stock.history(period=period) if period else stock.history(start=start)
+
+
+def _download_many(tickers, start, period=None):
+    ''' One bulk request for several tickers; returns ticker -> frame (empty when Yahoo had nothing) '''
+    kwargs = {"period": period} if period else {"start": start}
+    with metrics.track_yfinance("download"):
+        data = yf.download(sorted(tickers), group_by="ticker", actions=True, auto_adjust=True,
+                           progress=False, threads=True, **kwargs)
+    frames = {}
+    for ticker in tickers:
+        try:
+            frames[ticker] = data[ticker].dropna(how="all")
+        except (KeyError, TypeError):
+            frames[ticker] = pd.DataFrame(columns=HISTORY_COLUMNS)
+    return frames
+
+
+def _refresh_indicators(tickers, recompute, today):
+    ''' Advance each ticker's saved indicator state over the bars stored since, and write the values next to the bars.
+
+    Only bars before today advance the saved state; today's bar may still be an intraday partial, so its values are
+    computed from a copy and the bar is applied again (final) on the next top-up.
+    '''
+    states = history_db.get_indicator_states(tickers)
+    after = {ticker: states[ticker][0] if ticker in states and ticker not in recompute else datetime.date.min
+             for ticker in tickers}
+    rows, saved_states = [], []
+    for ticker, bars in history_db.get_bars_after(after).items():
+        resume = after[ticker] != datetime.date.min
+        indicators = IndicatorSet.from_state(states[ticker][1]) if resume else IndicatorSet()
+        as_of = after[ticker]
+        for day, high, low, close in bars:
+            if day < today:
+                values = indicators.update(high, low, close)
+                as_of = day
+            else:
+                values = indicators.copy().update(high, low, close)
+            rows.append((ticker, day, *values))
+        saved_states.append((ticker, as_of, indicators.state()))
+    history_db.save_indicators(rows, saved_states)
+
+
+def load_histories(tickers, period):
+    ''' Daily OHLCV history for several tickers, with one Yahoo request per group of tickers needing the same window '''
+    tickers = sorted(set(tickers))
+    today = datetime.date.today()
+    start = period_start(period, today)
+    if start is None:
+        # Unusual period strings go straight to Yahoo
+        return _download_many(tickers, None, period=period)
+
+    stored_ranges = history_db.get_history_ranges(tickers)
+
+    # Nothing stored that reaches back far enough: one full download for the requested window (plus indicator warm-up)
+    missing = [ticker for ticker in tickers if ticker not in stored_ranges or stored_ranges[ticker][0] > start]
+    if missing:
+        download_start = max(start - datetime.timedelta(days=INDICATOR_WARMUP_DAYS), MAX_START)
+        for ticker, hist in _download_many(missing, download_start, period="max" if start == MAX_START else None).items():
+            if not hist.empty:
+                history_db.save_bars(ticker, _to_bars(hist), download_start, today)
+    # Older bars were added or prices were re-adjusted: indicators must be recomputed from the first stored bar
+    recompute = set(missing)
+
+    # Refresh from the last stored bar (it may have been an intraday partial) onwards, one request per top-up date
+    by_covered_to = {}
+    for ticker in tickers:
+        if ticker not in missing:
+            by_covered_to.setdefault(stored_ranges[ticker][1], []).append(ticker)
+    for covered_to, group in by_covered_to.items():
+        for ticker, delta in _download_many(group, covered_to).items():
+            # An empty or failed download leaves the range where it was, so the next load asks for those days again
+            if delta.empty:
+                continue
+            covered_from = stored_ranges[ticker][0]
+            if _has_corporate_action(delta[delta.index.date > covered_to]):
+                logger.info(f"Corporate action for {ticker}, refetching stored history from {covered_from}")
+                full = _download(ticker, covered_from, period="max" if covered_from == MAX_START else None)
+                if full.empty:
+                    # Never swap the stored history for nothing; the corporate action is retried on the next load
+                    logger.warning(f"Refetch for {ticker} came back empty, keeping the stored history")
+                    continue
+                history_db.save_bars(ticker, _to_bars(full), covered_from, today, replace=True)
+                recompute.add(ticker)
+            else:
+                history_db.save_bars(ticker, _to_bars(delta), covered_from, today)
+
+    _refresh_indicators(tickers, recompute, today)
+
+    bars = history_db.get_bars_many(tickers, start)
+    frames = {}
+    for ticker in tickers:
+        frame = _to_frame(bars.get(ticker, []))
+        if period in PERIOD_BARS:
+            frame = frame.tail(PERIOD_BARS[period])
+        frames[ticker] = frame
+    return frames
+
+
+def load_history(ticker, period):
+    ''' Daily OHLCV history for a ticker and yfinance period, topping up the local store incrementally '''
+    return load_histories([ticker], period)[ticker]
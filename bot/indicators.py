@@ -0,0 +1,163 @@
+# Daily technical indicators computed incrementally: each one keeps a small rolling state that is advanced
+# one bar at a time in O(1), so new bars never require recomputing the whole window
+from collections import deque
+
+# Columns stored next to the OHLCV bars in stock_history (and returned in history frames), in update() order
+INDICATOR_COLUMNS = ["sma_20", "sma_50", "ema_12", "ema_26", "rsi_14", "bb_upper", "bb_middle", "bb_lower", "atr_14"]
+
+
+class SMA:
+    ''' Simple moving average over the last `period` values, kept as a window plus a running sum '''
+    def __init__(self, period, window=()):
+        self.period = period
+        self.window = deque(window, maxlen=period)
+        # Re-summed on load so float drift of the running sum never outlives a process
+        self.total = sum(self.window)
+
+    def update(self, value):
+        if len(self.window) == self.period:
+            self.total -= self.window[0]
+        self.window.append(value)
+        self.total += value
+        return self.total / self.period if len(self.window) == self.period else None
+
+    def state(self):
+        return {"window": list(self.window)}
+
+
+class Smoother:
+    ''' Exponential smoothing seeded with the simple average of the first `period` values.
+
+    alpha=2/(period+1) gives the usual EMA, alpha=1/period gives Wilder's smoothing (RSI, ATR).
+    '''
+    def __init__(self, period, alpha, value=None, count=0, seed=0.0):
+        self.period = period
+        self.alpha = alpha
+        self.value = value
+        self.count = count
+        self.seed = seed
+
+    def update(self, x):
+        if self.value is not None:
+            self.value += (x - self.value) * self.alpha
+            return self.value
+        self.count += 1
+        self.seed += x
+        if self.count == self.period:
+            self.value = self.seed / self.period
+        return self.value
+
+    def state(self):
+        return {"value": self.value, "count": self.count, "seed": self.seed}
+
+
+def ema(period, **state):
+    return Smoother(period, 2 / (period + 1), **state)
+
+
+def wilder(period, **state):
+    return Smoother(period, 1 / period, **state)
+
+
+class RSI:
+    ''' Relative strength index with Wilder-smoothed average gains and losses '''
+    def __init__(self, period, prev_close=None, gains=None, losses=None):
+        self.period = period
+        self.prev_close = prev_close
+        self.gains = wilder(period, **(gains or {}))
+        self.losses = wilder(period, **(losses or {}))
+
+    def update(self, close):
+        prev_close, self.prev_close = self.prev_close, close
+        if prev_close is None:
+            return None
+        change = close - prev_close
+        gain = self.gains.update(max(change, 0.0))
+        loss = self.losses.update(max(-change, 0.0))
+        if gain is None:
+            return None
+        return 100.0 if loss == 0 else 100 - 100 / (1 + gain / loss)
+
+    def state(self):
+        return {"prev_close": self.prev_close, "gains": self.gains.state(), "losses": self.losses.state()}
+
+
+class Bollinger:
+    ''' Bollinger bands: SMA ± width population standard deviations, from running sums of x and x² '''
+    def __init__(self, period, width, window=()):
+        self.period = period
+        self.width = width
+        self.window = deque(window, maxlen=period)
+        self.total = sum(self.window)
+        self.total_sq = sum(value * value for value in self.window)
+
+    def update(self, value):
+        if len(self.window) == self.period:
+            old = self.window[0]
+            self.total -= old
+            self.total_sq -= old * old
+        self.window.append(value)
+        self.total += value
+        self.total_sq += value * value
+        if len(self.window) < self.period:
+            return None, None, None
+        mean = self.total / self.period
+        # Clamp the float error of the running sums so a flat window gives zero width instead of a domain error
+        std = max(self.total_sq / self.period - mean * mean, 0.0) ** 0.5
+        return mean + self.width * std, mean, mean - self.width * std
+
+    def state(self):
+        return {"window": list(self.window)}
+
+
+class ATR:
+    ''' Average true range with Wilder smoothing '''
+    def __init__(self, period, prev_close=None, ranges=None):
+        self.period = period
+        self.prev_close = prev_close
+        self.ranges = wilder(period, **(ranges or {}))
+
+    def update(self, high, low, close):
+        true_range = high - low
+        if self.prev_close is not None:
+            true_range = max(true_range, abs(high - self.prev_close), abs(low - self.prev_close))
+        self.prev_close = close
+        return self.ranges.update(true_range)
+
+    def state(self):
+        return {"prev_close": self.prev_close, "ranges": self.ranges.state()}
+
+
+class IndicatorSet:
+    ''' Every stored indicator for one ticker; state() is JSON-serialisable and from_state() resumes it '''
+    def __init__(self, state=None):
+        state = state or {}
+        self.sma_20 = SMA(20, **state.get("sma_20", {}))
+        self.sma_50 = SMA(50, **state.get("sma_50", {}))
+        self.ema_12 = ema(12, **state.get("ema_12", {}))
+        self.ema_26 = ema(26, **state.get("ema_26", {}))
+        self.rsi_14 = RSI(14, **state.get("rsi_14", {}))
+        self.bollinger = Bollinger(20, 2, **state.get("bollinger", {}))
+        self.atr_14 = ATR(14, **state.get("atr_14", {}))
+
+    @classmethod
+    def from_state(cls, state):
+        return cls(state)
+
+    def update(self, high, low, close):
+        ''' Advance every indicator by one daily bar; returns the values in INDICATOR_COLUMNS order (None while warming up) '''
+        if high is None or low is None or high != high or low != low:
+            # Yahoo occasionally leaves High/Low empty; a NaN would poison the smoothed state (and is not valid JSON)
+            high = low = close
+        upper, middle, lower = self.bollinger.update(close)
+        return (self.sma_20.update(close), self.sma_50.update(close), self.ema_12.update(close),
+                self.ema_26.update(close), self.rsi_14.update(close), upper, middle, lower,
+                self.atr_14.update(high, low, close))
+
+    def state(self):
+        return {"sma_20": self.sma_20.state(), "sma_50": self.sma_50.state(), "ema_12": self.ema_12.state(),
+                "ema_26": self.ema_26.state(), "rsi_14": self.rsi_14.state(), "bollinger": self.bollinger.state(),
+                "atr_14": self.atr_14.state()}
+
+    def copy(self):
+        return IndicatorSet(self.state())
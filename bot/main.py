@@ -1,28 +1,54 @@
 import discord
 from discord.ext import commands
 import logging
-from .config import bot, logger, token, handler
+from .config import bot, logger, token, setup_logging
 import database_services.server_db as server_db
+from database_services import db
+from .market_data import MarketDataTimeout
 
 # Import all modules to register their commands and events
-from . import alerts, stock, comparisons, events
+from . import alerts, stock, comparisons, events, background, metrics
 
 @bot.event
 async def on_ready():
     logger.info(f"{bot.user.name} is ready")
-    alerts.check_stock_percent_changes.start()
+    await background.warm_caches()
+    await metrics.start_server()
+    if not background.refresh_stock_index.is_running():
+        background.refresh_stock_index.start()
+    if not background.log_cache_stats.is_running():
+        background.log_cache_stats.start()
+    if not background.refresh_plan_cache.is_running():
+        background.refresh_plan_cache.start()
+    await alerts.start_alert_engine()
 
 @bot.event
 async def on_message(message):
     if message.author == bot.user: return # Do not answer yourself
     await bot.process_commands(message)
     
+@bot.event
+async def on_command_error(ctx, error):
+    # Commands without their own error handling still get a friendly message when Yahoo is slow
+    original = getattr(error, "original", error)
+    if isinstance(original, MarketDataTimeout):
+        await ctx.send(f"⚠️ {original}")
+        return
+    if isinstance(error, commands.CommandNotFound):
+        return
+    logger.error(f"Error in command {ctx.command}: {error}", exc_info=original)
+
 @bot.event
 async def on_guild_join(guild):
     # When the bot joins a new server, ensure the server is in the database
     server_id = guild.id
     server_name = guild.name
-    server_db.insert_server(server_id, server_name)
+    await db.run(server_db.insert_server, server_id, server_name)
+    # Set the alert channel up once here so the alert loop never has to look for it
+    try:
+        await alerts.ensure_alert_channel(guild)
+    except discord.HTTPException as e:
+        logger.warning(f"Could not create alert channel in server {guild.id}: {e}")
 
 @bot.command()
 async def hello(ctx):
@@ -41,19 +67,26 @@ async def help(ctx):
     embed.add_field(name="!hello", value="Greet the bot.", inline=False)
     embed.add_field(name="!stock <ticker> [period]", value="Fetch live stock price, change %, market cap for a given ticker symbol and period (default: 1 month).", inline=False)
     embed.add_field(name="!info <ticker>", value="Fetch company information (description, sector, CEO, etc.) for a given ticker symbol.", inline=False)
-    embed.add_field(name="!chart <ticker> [period]", value="Fetch historical stock data for a given ticker symbol and period (default: 1 month).", inline=False)
-    embed.add_field(name="!watch <ticker> [threshold]", value="Watch a stock and get notified when its price changes by a certain percentage (default: 10%).", inline=False)
-    embed.add_field(name="!unwatch <ticker>", value="Stop watching a stock.", inline=False)
+    embed.add_field(name="!chart <ticker> [period] [overlays...]", value="Fetch historical stock data for a given ticker symbol and period (default: 1 month). Overlays: sma20, sma50, ema12, ema26, bb.", inline=False)
+    embed.add_field(name="!watch <ticker>[:threshold] ...", value="Watch one or more stocks and get notified when their price changes by a certain percentage (default: 10%). Attach a CSV of tickers and thresholds to import a watchlist.", inline=False)
+    embed.add_field(name="!unwatch <ticker> ...", value="Stop watching one or more stocks.", inline=False)
     embed.add_field(name="!unwatchall", value="Stop watching all stocks.", inline=False)
     embed.add_field(name="!list", value="List all watched stocks for this server.", inline=False)
+    embed.add_field(name="!rule <ticker> <condition>", value="Get notified when a condition becomes true, e.g. `price > 200`, `sma20 crosses above sma50`, `volume > 3x`, `change 5d < -10%`.", inline=False)
+    embed.add_field(name="!rules", value="List the alert rules of this server.", inline=False)
+    embed.add_field(name="!unrule <id> ...", value="Remove alert rules by id.", inline=False)
     embed.add_field(name="!news <ticker>", value="Fetch latest news articles for a given ticker symbol.", inline=False)
     embed.add_field(name="!metrics <ticker>", value="Fetch key financial metrics for a given ticker symbol.", inline=False)
-    embed.add_field(name="!compare <ticker1> <ticker2> [period]", value="Compare historical stock data for two given ticker symbols and period (default: 1 year).", inline=False)
+    embed.add_field(name="!compare <ticker1> <ticker2> ... [vs <benchmark>] [period]", value="Compare returns, volatility, drawdown, correlation and key metrics of up to 10 tickers, optionally against a benchmark such as SP500 or ^IXIC (default period: 1 year). The period goes last, or anywhere as period=6mo.", inline=False)
     embed.add_field(name="!compare_sp500 <ticker> [period]", value="Compare historical stock data for a given ticker symbol against S&P 500 index and period (default: 1 year).", inline=False)
     embed.add_field(name="!help", value="Show this help information.", inline=False)
 
     await ctx.send(embed=embed)
 
 
+def run():
+    bot.run(token, log_handler=setup_logging(), log_level=logging.DEBUG)
+
+
 if __name__ == "__main__":
-    bot.run(token, log_handler=handler, log_level=logging.DEBUG)
\ No newline at end of file
+    run()
\ No newline at end of file
@@ -0,0 +1,203 @@
+# Market data access (Yahoo Finance)
+# yfinance is blocking, so every call made from the event loop goes through a bounded thread pool with a timeout.
+import asyncio
+import contextvars
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+import yfinance as yf
+from .config import logger
+from .cache import TTLCache
+from . import history_store, metrics
+
+# Number of symbols requested per bulk download call
+QUOTE_CHUNK_SIZE = int(os.getenv("QUOTE_CHUNK_SIZE", 100))
+# Maximum number of concurrent Yahoo requests
+MARKET_DATA_WORKERS = int(os.getenv("MARKET_DATA_WORKERS", 8))
+# Seconds to wait for a single Yahoo call before giving up
+MARKET_DATA_TIMEOUT = float(os.getenv("MARKET_DATA_TIMEOUT", 15))
+# Seconds to wait for a full bulk quote refresh in the alert loop
+QUOTES_TIMEOUT = float(os.getenv("QUOTES_TIMEOUT", 45))
+
+FAST_INFO_KEYS = ("lastPrice", "previousClose", "marketCap", "currency")
+
+# Seconds each kind of data stays fresh in the shared cache
+CACHE_TTLS = {
+    "quote": float(os.getenv("CACHE_TTL_QUOTE", 30)),
+    "fast_info": float(os.getenv("CACHE_TTL_FAST_INFO", 30)),
+    "info": float(os.getenv("CACHE_TTL_INFO", 3600)),
+    "history": float(os.getenv("CACHE_TTL_HISTORY", 900)),
+    "news": float(os.getenv("CACHE_TTL_NEWS", 600)),
+}
+CACHE_MAX_MB = float(os.getenv("MARKET_DATA_CACHE_MAX_MB", 64))
+
+cache = TTLCache(CACHE_TTLS, int(CACHE_MAX_MB * 1024 * 1024))
+
+_executor = ThreadPoolExecutor(max_workers=MARKET_DATA_WORKERS, thread_name_prefix="market-data")
+
+
+class MarketDataTimeout(Exception):
+    ''' Raised when Yahoo Finance does not answer within the configured timeout '''
+
+    def __init__(self, description, timeout):
+        super().__init__(f"Yahoo Finance did not respond in time ({description}, {timeout:.0f}s). Please try again later.")
+
+
+def _quote_from_frame(data, ticker):
+    ''' Extract last price and previous close for a ticker from a bulk download frame '''
+    if data is None or data.empty:
+        return None
+    try:
+        closes = data[ticker]["Close"].dropna()
+    except KeyError:
+        return None
+    if len(closes) < 2:
+        return None
+    return {"lastPrice": float(closes.iloc[-1]), "previousClose": float(closes.iloc[-2])}
+
+
+def _fast_info_quote(ticker):
+    ''' Fetch a single quote through fast_info (used as fallback for bulk misses) '''
+    try:
+        with metrics.track_yfinance("fast_info"):
+            info = yf.Ticker(ticker).fast_info
+            price = info.get("lastPrice", None)
+            prev_close = info.get("previousClose", None)
+    except Exception as e:
+        logger.warning(f"Failed to fetch quote for {ticker}: {e}")
+        return None
+    if price is None or prev_close is None:
+        return None
+    return {"lastPrice": price, "previousClose": prev_close}
+
+
+def fetch_quotes(tickers):
+    ''' Fetch last price and previous close for many tickers, one bulk request per chunk of unique symbols.
+
+    Returns a dict mapping ticker -> {"lastPrice", "previousClose"}. Tickers with no data are omitted.
+    '''
+    unique_tickers = sorted(set(tickers))
+    quotes = {}
+
+    for start in range(0, len(unique_tickers), QUOTE_CHUNK_SIZE):
+        chunk = unique_tickers[start:start + QUOTE_CHUNK_SIZE]
+        try:
+            with metrics.track_yfinance("download"):
+                data = yf.download(chunk, period="5d", interval="1d", group_by="ticker",
+                                   auto_adjust=False, progress=False, threads=True)
+        except Exception as e:
+            logger.warning(f"Bulk quote download failed for {len(chunk)} tickers: {e}")
+            data = None
+
+        for ticker in chunk:
+            quote = _quote_from_frame(data, ticker)
+            if quote:
+                quotes[ticker] = quote
+
+    # Symbols the bulk endpoint did not return (e.g. too new to have two daily bars)
+    for ticker in unique_tickers:
+        if ticker not in quotes:
+            quote = _fast_info_quote(ticker)
+            if quote:
+                quotes[ticker] = quote
+
+    return quotes
+
+
+async def run(func, *args, timeout=MARKET_DATA_TIMEOUT, **kwargs):
+    ''' Run a blocking market data call on the worker pool, cancelling the wait after `timeout` seconds '''
+    loop = asyncio.get_running_loop()
+    # Carry context variables (db.count_queries) into the thread: history loads query the local store
+    context = contextvars.copy_context()
+    future = loop.run_in_executor(_executor, functools.partial(context.run, func, *args, **kwargs))
+    try:
+        return await asyncio.wait_for(future, timeout)
+    except asyncio.TimeoutError:
+        description = getattr(func, "__name__", repr(func))
+        logger.warning(f"Market data call {description}{args} timed out after {timeout}s")
+        raise MarketDataTimeout(description, timeout) from None
+
+
+def _fetch_fast_info(ticker):
+    # fast_info is lazy, so resolve the fields we need inside the worker thread
+    with metrics.track_yfinance("fast_info"):
+        info = yf.Ticker(ticker).fast_info
+        return {key: info.get(key, None) for key in FAST_INFO_KEYS}
+
+
+def _fetch_info(ticker):
+    with metrics.track_yfinance("info"):
+        return yf.Ticker(ticker).get_info()
+
+
+def _fetch_history(ticker, period):
+    return history_store.load_history(ticker, period)
+
+
+def _fetch_news(ticker):
+    with metrics.track_yfinance("news"):
+        return yf.Ticker(ticker).news
+
+
+async def get_fast_info(ticker):
+    ''' Live price fields (lastPrice, previousClose, marketCap, currency) for a ticker '''
+    info = await cache.get_or_fetch((ticker, "fast_info"), lambda: run(_fetch_fast_info, ticker))
+    # A fresh fast_info also answers the alert loop's quote lookup
+    if info.get("lastPrice") is not None and info.get("previousClose") is not None and cache.get((ticker, "quote")) is None:
+        cache.put((ticker, "quote"), {"lastPrice": info["lastPrice"], "previousClose": info["previousClose"]})
+    return info
+
+
+async def get_info(ticker):
+    ''' Full company info dict for a ticker '''
+    return await cache.get_or_fetch((ticker, "info"), lambda: run(_fetch_info, ticker))
+
+
+async def get_history(ticker, period):
+    ''' Daily OHLCV history with the stored indicator columns for a ticker over a yfinance period string (e.g. "1mo", "1y") '''
+    return await cache.get_or_fetch((ticker, "history", period), lambda: run(_fetch_history, ticker, period))
+
+
+async def get_histories(tickers, period):
+    ''' History for several tickers at once; tickers missing from the cache share one batched download '''
+    async def fetch_missing(keys):
+        frames = await run(history_store.load_histories, [ticker for ticker, _, _ in keys], period)
+        return {(ticker, "history", period): frame for ticker, frame in frames.items()}
+
+    results = await cache.get_or_fetch_many([(ticker, "history", period) for ticker in tickers], fetch_missing)
+    return {ticker: frame for (ticker, _, _), frame in results.items()}
+
+
+async def get_news(ticker):
+    ''' Latest news items for a ticker '''
+    return await cache.get_or_fetch((ticker, "news"), lambda: run(_fetch_news, ticker))
+
+
+async def get_quotes(tickers):
+    ''' Bulk quotes for many tickers (see fetch_quotes); only tickers missing from the cache hit Yahoo '''
+    async def fetch_missing(keys):
+        quotes = await run(fetch_quotes, [ticker for ticker, _ in keys], timeout=QUOTES_TIMEOUT)
+        return {(ticker, "quote"): quote for ticker, quote in quotes.items()}
+
+    results = await cache.get_or_fetch_many([(ticker, "quote") for ticker in tickers], fetch_missing)
+    return {ticker: quote for (ticker, _), quote in results.items()}
+
+
+def cache_stats():
+    ''' Hit/miss counters of the shared market data cache '''
+    return cache.stats()
+
+
+def _cache_collector():
+    stats = cache.stats()
+    samples = {}
+    for kind, counters in stats["kinds"].items():
+        for result in ("hits", "misses", "coalesced", "evictions"):
+            samples[(("kind", "result"), (kind, result))] = counters[result]
+    return [
+        ("aurelius_market_data_cache_requests_total", "counter", "Market data cache lookups by kind and result", samples),
+        ("aurelius_market_data_cache_bytes", "gauge", "Estimated size of the market data cache", {((), ()): stats["bytes"]}),
+    ]
+
+
+metrics.register_collector(_cache_collector)
@@ -0,0 +1,182 @@
+# Exchange trading sessions and the per-ticker polling schedule for alerts
+import os
+from datetime import date, datetime, time, timedelta, timezone
+from functools import lru_cache
+from zoneinfo import ZoneInfo
+
+# Skip quote polling for tickers whose exchange is closed (0 polls around the clock)
+ALERT_MARKET_HOURS = os.getenv("ALERT_MARKET_HOURS", "1") != "0"
+# Seconds after the bell before the single closing evaluation, so Yahoo has settled on the close
+MARKET_CLOSE_DELAY_SECONDS = float(os.getenv("MARKET_CLOSE_DELAY_SECONDS", 300))
+# Optional slow poll while closed (pre/post market moves); 0 disables
+OFF_HOURS_POLL_SECONDS = float(os.getenv("OFF_HOURS_POLL_SECONDS", 0))
+
+
+def _nth_weekday(year, month, weekday, n):
+    ''' n-th weekday (0=Monday) of a month; n=-1 is the last one '''
+    if n > 0:
+        first = date(year, month, 1)
+        return first + timedelta(days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+    last = date(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)
+    return last - timedelta(days=(last.weekday() - weekday) % 7)
+
+
+def _easter(year):
+    ''' Gregorian Easter Sunday (anonymous algorithm) '''
+    a, b, c = year % 19, year // 100, year % 100
+    d, e = b // 4, b % 4
+    g = (8 * b + 13) // 25
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = c // 4, c % 4
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return date(year, month, day + 1)
+
+
+def _observed(day):
+    ''' Saturday holidays are observed on Friday, Sunday holidays on Monday '''
+    if day.weekday() == 5:
+        return day - timedelta(days=1)
+    if day.weekday() == 6:
+        return day + timedelta(days=1)
+    return day
+
+
+def us_holidays(year):
+    ''' NYSE/NASDAQ full-day closures '''
+    holidays = {
+        _nth_weekday(year, 1, 0, 3),    # Martin Luther King Jr. Day
+        _nth_weekday(year, 2, 0, 3),    # Washington's Birthday
+        _easter(year) - timedelta(days=2),  # Good Friday
+        _nth_weekday(year, 5, 0, -1),   # Memorial Day
+        _observed(date(year, 7, 4)),    # Independence Day
+        _nth_weekday(year, 9, 0, 1),    # Labor Day
+        _nth_weekday(year, 11, 3, 4),   # Thanksgiving
+        _observed(date(year, 12, 25)),  # Christmas
+    }
+    # New Year's Day on a Saturday is not moved back into the previous year
+    if date(year, 1, 1).weekday() != 5:
+        holidays.add(_observed(date(year, 1, 1)))
+    if year >= 2022:
+        holidays.add(_observed(date(year, 6, 19)))  # Juneteenth
+    return holidays
+
+
+def us_early_closes(year):
+    ''' NYSE/NASDAQ 1pm closes: eve of Independence Day, day after Thanksgiving, Christmas Eve '''
+    early = {_nth_weekday(year, 11, 3, 4) + timedelta(days=1)}
+    for day in (date(year, 7, 3), date(year, 12, 24)):
+        if day.weekday() < 4:  # Friday eves are the observed holiday instead when the holiday falls on Saturday
+            early.add(day)
+    return early - us_holidays(year)
+
+
+class Exchange:
+    ''' A trading venue: local session hours plus holiday and early close rules by year '''
+
+    def __init__(self, code, tz, open_time, close_time, holidays=None, early_closes=None, early_close_time=None,
+                 always_open=False):
+        self.code = code
+        self.tz = ZoneInfo(tz)
+        self.open_time = open_time
+        self.close_time = close_time
+        self.holidays = holidays or (lambda year: set())
+        self.early_closes = early_closes or (lambda year: set())
+        self.early_close_time = early_close_time
+        self.always_open = always_open
+
+    @lru_cache(maxsize=64)
+    def _calendar(self, year):
+        return self.holidays(year), self.early_closes(year)
+
+    def session(self, day):
+        ''' (open, close) as aware datetimes for a local date, or None when the exchange does not trade '''
+        holidays, early_closes = self._calendar(day.year)
+        if day.weekday() >= 5 or day in holidays:
+            return None
+        close_time = self.early_close_time if day in early_closes else self.close_time
+        return (datetime.combine(day, self.open_time, self.tz), datetime.combine(day, close_time, self.tz))
+
+    def is_open(self, now):
+        if self.always_open:
+            return True
+        session = self.session(now.astimezone(self.tz).date())
+        return session is not None and session[0] <= now < session[1]
+
+    def last_close(self, now):
+        ''' Close of the most recent session that ended at or before now '''
+        if self.always_open:
+            return None
+        day = now.astimezone(self.tz).date()
+        for _ in range(14):
+            session = self.session(day)
+            if session and session[1] <= now:
+                return session[1]
+            day -= timedelta(days=1)
+        return None
+
+
+EXCHANGES = {}
+
+
+def register_exchange(exchange, suffixes=()):
+    ''' Add a venue; tickers ending in any of the Yahoo suffixes (".L", ".TO", ...) are scheduled on it '''
+    EXCHANGES[exchange.code] = exchange
+    for suffix in suffixes:
+        SUFFIX_EXCHANGES[suffix] = exchange.code
+
+
+SUFFIX_EXCHANGES = {}
+# Listings without a Yahoo suffix are US equities; NYSE and NASDAQ share one calendar
+DEFAULT_EXCHANGE = "XNYS"
+
+register_exchange(Exchange("XNYS", "America/New_York", time(9, 30), time(16), us_holidays, us_early_closes, time(13)))
+register_exchange(Exchange("XNAS", "America/New_York", time(9, 30), time(16), us_holidays, us_early_closes, time(13)))
+# Holiday rules are not modelled for these yet; they only skip nights and weekends
+register_exchange(Exchange("XLON", "Europe/London", time(8), time(16, 30)), [".L"])
+register_exchange(Exchange("XTSE", "America/Toronto", time(9, 30), time(16)), [".TO", ".V"])
+register_exchange(Exchange("CRYPTO", "UTC", time(0), time(0), always_open=True), ["-USD"])
+
+
+def exchange_for(ticker):
+    for suffix, code in SUFFIX_EXCHANGES.items():
+        if ticker.endswith(suffix):
+            return EXCHANGES[code]
+    return EXCHANGES[DEFAULT_EXCHANGE]
+
+
+class PollSchedule:
+    ''' Decides per ticker whether the alert loop should fetch a quote this tick.
+
+    Open market: every tick. After the bell: one closing evaluation once MARKET_CLOSE_DELAY_SECONDS
+    have passed. Otherwise closed: nothing, or one poll every OFF_HOURS_POLL_SECONDS if set.
+    '''
+
+    def __init__(self, close_delay=MARKET_CLOSE_DELAY_SECONDS, off_hours_interval=OFF_HOURS_POLL_SECONDS):
+        self.close_delay = timedelta(seconds=close_delay)
+        self.off_hours_interval = timedelta(seconds=off_hours_interval)
+        self.last_polled = {}  # ticker -> aware datetime of the last successful quote
+
+    def should_poll(self, ticker, now=None):
+        now = now or datetime.now(timezone.utc)
+        exchange = exchange_for(ticker)
+        if exchange.is_open(now):
+            return True
+        last_polled = self.last_polled.get(ticker)
+        last_close = exchange.last_close(now)
+        if last_close is not None and now >= last_close + self.close_delay:
+            if last_polled is None or last_polled < last_close + self.close_delay:
+                return True
+        if self.off_hours_interval and (last_polled is None or now - last_polled >= self.off_hours_interval):
+            return True
+        return False
+
+    def due(self, tickers, now=None):
+        now = now or datetime.now(timezone.utc)
+        return [ticker for ticker in tickers if self.should_poll(ticker, now)]
+
+    def mark_polled(self, tickers, now=None):
+        now = now or datetime.now(timezone.utc)
+        for ticker in tickers:
+            self.last_polled[ticker] = now
@@ -0,0 +1,183 @@
+# Minimal Prometheus-style metrics, served as text on a local port
+import asyncio
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from .config import logger
+
+from database_services import db
+
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", 9108))
+
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_registry = []
+_collectors = []  # callables returning extra (name, type, help, {labels: value}) samples at scrape time
+_lock = threading.Lock()
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{value}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name, self.help, self.labels = name, help_text, tuple(labels)
+        self.values = {}
+        _registry.append(self)
+
+    def inc(self, *label_values, amount=1):
+        with _lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def total(self):
+        with _lock:
+            return sum(self.values.values())
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for label_values, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {value}")
+        return lines
+
+
+class Gauge(Counter):
+    def set(self, value, *label_values):
+        with _lock:
+            self.values[label_values] = value
+
+    def render(self):
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labels = name, help_text, tuple(labels)
+        self.buckets = tuple(buckets)
+        self.series = {}  # label values -> [bucket counts..., +Inf count], sum
+        _registry.append(self)
+
+    def observe(self, value, *label_values):
+        with _lock:
+            counts, total = self.series.get(label_values, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect_left(self.buckets, value)] += 1
+            self.series[label_values] = (counts, total + value)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for label_values, (counts, total) in sorted(self.series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                labels = _format_labels(self.labels + ("le",), label_values + (bound,))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labels, label_values)
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+def register_collector(collector):
+    _collectors.append(collector)
+
+
+def render():
+    ''' All metrics in the Prometheus text exposition format '''
+    lines = []
+    with _lock:
+        for metric in _registry:
+            lines.extend(metric.render())
+    for collector in _collectors:
+        for name, metric_type, help_text, samples in collector():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for (label_names, label_values), value in samples.items():
+                lines.append(f"{name}{_format_labels(label_names, label_values)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+# Market data
+yfinance_calls = Counter("aurelius_yfinance_calls_total", "Yahoo Finance calls made", ["operation", "status"])
+yfinance_latency = Histogram("aurelius_yfinance_call_seconds", "Yahoo Finance call latency", ["operation"])
+
+# Alert loop
+alert_tick_seconds = Histogram("aurelius_alert_tick_seconds", "Wall time of one alert tick",
+                               buckets=(0.5, 1, 2.5, 5, 10, 20, 30, 45, 60, 90, 120, 300))
+alert_tick_last_seconds = Gauge("aurelius_alert_tick_last_seconds", "Wall time of the most recent alert tick")
+alert_ticks = Counter("aurelius_alert_ticks_total", "Alert ticks run")
+alert_tick_overruns = Counter("aurelius_alert_tick_overruns_total", "Alert ticks that took longer than their interval")
+alert_ticks_skipped = Counter("aurelius_alert_ticks_skipped_total", "Alert ticks that never started because a previous one ran late")
+alert_tick_yfinance_calls = Gauge("aurelius_alert_tick_yfinance_calls", "Yahoo Finance calls made while the most recent alert tick ran")
+alert_tick_db_queries = Gauge("aurelius_alert_tick_db_queries", "Database statements run by the most recent alert tick")
+alert_tick_db_seconds = Gauge("aurelius_alert_tick_db_seconds", "Database time spent by the most recent alert tick")
+alerts_sent = Counter("aurelius_alerts_sent_total", "Alert messages delivered")
+alert_send_failures = Counter("aurelius_alert_send_failures_total", "Alert messages that failed to send")
+alert_send_retries = Counter("aurelius_alert_send_retries_total", "Alert message sends retried after a transient error")
+discord_send_latency = Histogram("aurelius_discord_send_seconds", "Latency of Discord channel.send for alerts")
+
+
+@contextmanager
+def track_yfinance(operation):
+    ''' Count and time one Yahoo Finance request '''
+    started = time.perf_counter()
+    status = "error"
+    try:
+        yield
+        status = "ok"
+    finally:
+        yfinance_calls.inc(operation, status)
+        yfinance_latency.observe(time.perf_counter() - started, operation)
+
+
+def _db_collector():
+    stats = dict(db.stats)
+    return [
+        ("aurelius_db_queries_total", "counter", "Database statements executed", {((), ()): stats["queries"]}),
+        ("aurelius_db_query_seconds_total", "counter", "Time spent executing database statements", {((), ()): stats["query_seconds"]}),
+        ("aurelius_db_reconnects_total", "counter", "Broken pooled connections replaced", {((), ()): stats["reconnects"]}),
+    ]
+
+
+register_collector(_db_collector)
+
+
+async def _handle(reader, writer):
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), 5)
+        # Drain the headers, we only serve one resource
+        while (await asyncio.wait_for(reader.readline(), 5)) not in (b"\r\n", b"\n", b""):
+            pass
+        path = request_line.split()[1].decode() if len(request_line.split()) > 1 else "/"
+        if path.split("?")[0] in ("/", "/metrics"):
+            body, status = render().encode(), "200 OK"
+        else:
+            body, status = b"not found\n", "404 Not Found"
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+_server = None
+
+
+async def start_server():
+    ''' Serve /metrics on METRICS_HOST:METRICS_PORT (local only by default) '''
+    global _server
+    if _server is not None or METRICS_PORT <= 0:
+        return
+    _server = await asyncio.start_server(_handle, METRICS_HOST, METRICS_PORT)
+    logger.info(f"Serving metrics on http://{METRICS_HOST}:{METRICS_PORT}/metrics")
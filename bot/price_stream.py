@@ -0,0 +1,244 @@
+# Push-based price sources for the alert engine (alternative to minute polling)
+import asyncio
+import json
+from collections import deque
+import os
+import yfinance as yf
+from .config import logger
+from . import alert_engine
+
+# poll (minute loop), stream (Yahoo websocket) or replay (recorded ticks from ALERT_REPLAY_FILE)
+ALERT_PRICE_SOURCE = os.getenv("ALERT_PRICE_SOURCE", "poll")
+ALERT_REPLAY_FILE = os.getenv("ALERT_REPLAY_FILE", "")
+# Replay speed multiplier; 0 replays as fast as possible
+ALERT_REPLAY_SPEED = float(os.getenv("ALERT_REPLAY_SPEED", 0))
+# Seconds between full subscription resyncs (also renews shard leases)
+STREAM_RESYNC_SECONDS = float(os.getenv("STREAM_RESYNC_SECONDS", 60))
+
+
+def quote_from_message(message):
+    ''' Normalise a streamed tick to (ticker, {"lastPrice", "previousClose"}) or None '''
+    ticker = message.get("id")
+    price = message.get("price")
+    prev_close = message.get("previous_close")
+    if prev_close in (None, 0) and price is not None and message.get("change_percent") is not None:
+        # Some feeds only carry the change; recover the previous close from it
+        prev_close = price / (1 + message["change_percent"] / 100)
+    if not ticker or price is None or not prev_close:
+        return None
+    return ticker, {"lastPrice": float(price), "previousClose": float(prev_close)}
+
+
+class PriceSource:
+    ''' A push source calls on_tick(message) for every price update of the subscribed tickers '''
+
+    async def set_tickers(self, tickers):
+        raise NotImplementedError
+
+    async def run(self, on_tick):
+        raise NotImplementedError
+
+    async def reconnect(self):
+        pass
+
+    async def close(self):
+        pass
+
+
+class YahooStreamSource(PriceSource):
+    ''' Yahoo Finance websocket streamer (yfinance AsyncWebSocket) '''
+
+    def __init__(self):
+        self.tickers = set()
+        self.websocket = yf.AsyncWebSocket(verbose=False)
+
+    async def set_tickers(self, tickers):
+        tickers = set(tickers)
+        added, removed = tickers - self.tickers, self.tickers - tickers
+        if removed:
+            await self.websocket.unsubscribe(sorted(removed))
+        if added:
+            await self.websocket.subscribe(sorted(added))
+        self.tickers = tickers
+
+    async def run(self, on_tick):
+        await self.websocket.listen(on_tick)
+
+    async def reconnect(self):
+        # A new connection has no subscriptions, so subscribe the current set again
+        try:
+            await self.websocket.close()
+        except Exception:
+            pass
+        self.websocket = yf.AsyncWebSocket(verbose=False)
+        if self.tickers:
+            await self.websocket.subscribe(sorted(self.tickers))
+
+    async def close(self):
+        await self.websocket.close()
+
+
+class ReplaySource(PriceSource):
+    ''' Replays recorded ticks from a JSON-lines file ({"id", "price", "previous_close", "time"} per line) for offline testing '''
+
+    def __init__(self, path, speed=ALERT_REPLAY_SPEED):
+        self.path = path
+        self.speed = speed
+        self.tickers = set()
+
+    async def set_tickers(self, tickers):
+        self.tickers = set(tickers)
+
+    async def run(self, on_tick):
+        previous_time = None
+        with open(self.path, encoding="utf-8") as recording:
+            for line in recording:
+                if not line.strip():
+                    continue
+                message = json.loads(line)
+                tick_time = message.get("time")
+                if self.speed > 0 and previous_time is not None and tick_time is not None:
+                    await asyncio.sleep(max(0, (tick_time - previous_time) / self.speed))
+                previous_time = tick_time
+                if message.get("id") in self.tickers:
+                    await on_tick(message)
+                else:
+                    await asyncio.sleep(0)
+
+
+def create_source(mode=ALERT_PRICE_SOURCE):
+    if mode == "stream":
+        return YahooStreamSource()
+    if mode == "replay":
+        return ReplaySource(ALERT_REPLAY_FILE)
+    raise ValueError(f"Unknown streaming price source: {mode}")
+
+
+class StreamingAlertEngine:
+    ''' Evaluates alert thresholds as prices arrive instead of once a minute.
+
+    load_subscriptions() returns rows like subscribed_stock_db.get_all_subscriptions();
+    deliver(to_alert, to_reset) sends alerts and persists alert state, returning the ids it marked alerted.
+    '''
+
+    def __init__(self, source, load_subscriptions, deliver):
+        self.source = source
+        self.load_subscriptions = load_subscriptions
+        self.deliver = deliver
+        self.by_ticker = {}  # ticker -> alert_engine.ThresholdIndex
+        self._resync_requested = asyncio.Event()
+        # Subscription ids handed to deliver() and not yet confirmed; later ticks leave them alone
+        self._in_flight = set()
+        # ticker -> deliveries waiting for that ticker's worker, which runs them in tick order
+        self._pending = {}
+        self._workers = {}
+        # States confirmed while a resync reads the database, which that read may predate
+        self._recent_confirms = []
+        self._tasks = []
+
+    def request_resync(self):
+        ''' Reload subscriptions soon (called after !watch / !unwatch) '''
+        self._resync_requested.set()
+
+    async def resync(self):
+        recent = {}
+        self._recent_confirms.append(recent)
+        try:
+            subscriptions = await self.load_subscriptions()
+        finally:
+            self._recent_confirms.remove(recent)
+        rows_by_ticker = {}
+        for row in subscriptions:
+            if row[0] in recent:
+                row = row[:4] + (recent[row[0]],) + row[5:]
+            rows_by_ticker.setdefault(row[2], []).append(row)
+        # Deliveries still in flight confirm into these indexes when they finish
+        self.by_ticker = {ticker: alert_engine.ThresholdIndex(rows) for ticker, rows in rows_by_ticker.items()}
+        await self.source.set_tickers(self.by_ticker)
+        logger.info(f"Streaming alerts for {len(self.by_ticker)} tickers ({len(subscriptions)} subscriptions)")
+
+    async def on_tick(self, message):
+        ''' Evaluate a tick right away and queue its sends, so a slow delivery never holds up the stream '''
+        parsed = quote_from_message(message)
+        if not parsed:
+            return
+        ticker, quote = parsed
+        index = self.by_ticker.get(ticker)
+        if not index:
+            return
+        # Only subscriptions whose state flips are touched, however many guilds watch the ticker
+        alert_rows, reset_rows = index.update(alert_engine.percent_change(quote))
+        alert_rows = [row for row in alert_rows if row[0] not in self._in_flight]
+        reset_rows = [row for row in reset_rows if row[0] not in self._in_flight]
+        if not alert_rows and not reset_rows:
+            return
+        self._in_flight.update(row[0] for row in alert_rows + reset_rows)
+        self._pending.setdefault(ticker, deque()).append((alert_rows, reset_rows, quote))
+        if ticker not in self._workers:
+            self._workers[ticker] = asyncio.create_task(self._deliver_pending(ticker))
+
+    async def _deliver_pending(self, ticker):
+        # One worker per ticker with queued sends; it exits once the queue is drained
+        pending = self._pending[ticker]
+        try:
+            while pending:
+                alert_rows, reset_rows, quote = pending.popleft()
+                try:
+                    alerted_ids = await self.deliver(alert_engine.to_frame(alert_rows, quote),
+                                                     alert_engine.to_frame(reset_rows, quote))
+                    self._confirm(ticker, alerted_ids, True)
+                    self._confirm(ticker, [row[0] for row in reset_rows], False)
+                except Exception as e:
+                    # Unconfirmed rows stay exceptions of the index and are retried on the next tick
+                    logger.warning(f"Streaming alert delivery for {ticker} failed: {e}")
+                finally:
+                    self._in_flight.difference_update(row[0] for row in alert_rows + reset_rows)
+        finally:
+            del self._pending[ticker]
+            del self._workers[ticker]
+
+    def _confirm(self, ticker, subscription_ids, alerted):
+        # The index may have been swapped by a resync since the tick; confirm into the current one
+        index = self.by_ticker.get(ticker)
+        if index:
+            index.confirm(subscription_ids, alerted)
+        for recent in self._recent_confirms:
+            recent.update(dict.fromkeys(subscription_ids, alerted))
+
+    async def _resync_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._resync_requested.wait(), STREAM_RESYNC_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._resync_requested.clear()
+            try:
+                await self.resync()
+            except Exception as e:
+                logger.warning(f"Streaming subscription resync failed, will retry: {e}")
+
+    async def _listen_loop(self):
+        while True:
+            try:
+                await self.source.run(self.on_tick)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Price stream disconnected, reconnecting: {e}")
+            if isinstance(self.source, ReplaySource):
+                logger.info("Replay finished")
+                return
+            await asyncio.sleep(5)
+            try:
+                await self.source.reconnect()
+            except Exception as e:
+                logger.warning(f"Price stream reconnect failed: {e}")
+
+    async def start(self):
+        await self.resync()
+        self._tasks = [asyncio.create_task(self._resync_loop()), asyncio.create_task(self._listen_loop())]
+
+    async def stop(self):
+        for task in self._tasks + list(self._workers.values()):
+            task.cancel()
+        await self.source.close()
@@ -1,12 +1,25 @@
+import asyncio
 import discord
 from discord.ext import commands
-import yfinance as yf
 import matplotlib.dates as mdates
+import pandas as pd
 from .config import bot, logger, NEWS_PER_PAGE
-from .helpers import build_plot, round_large_number, shorten_description
+from .helpers import round_large_number, shorten_description
+from . import market_data, charts
 
 import database_services.server_plan_db as server_plan_db
 import database_services.stock_db as stock_db
+from database_services import db
+
+# !chart overlays: name -> [(indicator column, legend label, color)], read from the indicators stored with the bars
+CHART_OVERLAYS = {
+    "sma20": [("sma_20", "SMA 20", "#ff7f0e")],
+    "sma50": [("sma_50", "SMA 50", "#2ca02c")],
+    "ema12": [("ema_12", "EMA 12", "#e377c2")],
+    "ema26": [("ema_26", "EMA 26", "#bcbd22")],
+    "bb": [("bb_upper", "Bollinger Upper", "#9467bd"), ("bb_middle", "Bollinger Middle", "#8c564b"),
+           ("bb_lower", "Bollinger Lower", "#9467bd")],
+}
 
 
 @bot.command()
@@ -18,8 +31,7 @@ async def stock(ctx, arg, period="1mo"):
         await ctx.send(f"❌ Ticker symbol for '{arg}' not found.")
         return
 
-    stock = yf.Ticker(ticker)
-    info = stock.fast_info
+    info, hist = await asyncio.gather(market_data.get_fast_info(ticker), market_data.get_history(ticker, period))
     price = info.get("lastPrice", None)
     prev_close = info.get("previousClose", None)
     market_cap = round_large_number(info.get("marketCap", 0))
@@ -38,15 +50,22 @@ async def stock(ctx, arg, period="1mo"):
     embed.add_field(name="🏦 Market Cap", value=f"${market_cap}", inline=True)
     embed.set_footer(text="Data provided by Yahoo Finance (yfinance)")
 
-    hist = stock.history(period=period)
     if hist.empty:
         await ctx.send(f"❌ No historical data found for **{ticker}** with period `{period}`.")
         return
 
+    # Latest precomputed daily indicators stored with the bars
+    latest = hist.iloc[-1]
+    indicator_lines = [f"{label}: {latest[column]:.2f}" for column, label in
+                       (("rsi_14", "RSI 14"), ("sma_50", "SMA 50"), ("atr_14", "ATR 14")) if pd.notna(latest.get(column))]
+    if indicator_lines:
+        embed.add_field(name="📐 Indicators", value="\n".join(indicator_lines), inline=True)
+
     line_color="#1f77b4"
     x = mdates.date2num(hist.index.to_pydatetime())
     y = hist["Close"].values
-    buffer = build_plot([(x,y)], f"{ticker} - Last 1 Month", "Date", "Price (USD)", [ticker], [line_color])
+    key = charts.chart_key([ticker], period, "dashboard", [hist])
+    buffer = await charts.render_chart(key, [(x,y)], f"{ticker} - Last 1 Month", "Date", "Price (USD)", [ticker], [line_color])
     file = discord.File(buffer, filename="chart.png")
     embed.set_image(url="attachment://chart.png")
     await ctx.send(file=file, embed=embed)
@@ -60,8 +79,7 @@ async def info(ctx, arg):
         await ctx.send(f"❌ Ticker symbol for '{arg}' not found.")
         return
 
-    stock = yf.Ticker(ticker)
-    info = stock.info
+    info = await market_data.get_info(ticker)
     description = info['longBusinessSummary']
     sector = info.get('sector', 'N/A')
     industry = info.get('industry', 'N/A')
@@ -95,17 +113,26 @@ async def info(ctx, arg):
 
 
 @bot.command()
-async def chart(ctx, arg, period="1mo"):
-    '''Fetch historical stock data for a given ticker symbol and period (default: 1 month).'''
+async def chart(ctx, arg, period="1mo", *overlays):
+    '''Fetch historical stock data for a given ticker symbol and period (default: 1 month), with optional indicator overlays (sma20, sma50, ema12, ema26, bb).'''
 
     ticker = stock_db.get_ticker_by_name(arg)
     if not ticker:
         await ctx.send(f"❌ Ticker symbol for '{arg}' not found.")
         return
 
+    if period.lower() in CHART_OVERLAYS:
+        # !chart AAPL sma20: overlays without a period keep the default period
+        overlays = (period,) + overlays
+        period = "1mo"
+    overlays = [overlay.lower() for overlay in overlays]
+    unknown = [overlay for overlay in overlays if overlay not in CHART_OVERLAYS]
+    if unknown:
+        await ctx.send(f"❌ Unknown overlay '{unknown[0]}'. Available: {', '.join(CHART_OVERLAYS)}.")
+        return
+
     try:
-        stock = yf.Ticker(ticker)
-        hist = stock.history(period=period)
+        hist = await market_data.get_history(ticker, period)
 
         if hist.empty:
             await ctx.send(f"❌ No historical data found for **{ticker}** with period `{period}`.")
@@ -115,7 +142,10 @@ async def chart(ctx, arg, period="1mo"):
         line_color="#1f77b4"
         x = mdates.date2num(hist.index.to_pydatetime())
         y = hist["Close"].values
-        buffer = build_plot([(x,y)], f"{ticker} - Last {period}", "Date", "Price (USD)", [ticker], [line_color])
+        lines = [(x, hist[column].values, label, color)
+                 for overlay in overlays for column, label, color in CHART_OVERLAYS[overlay] if column in hist]
+        key = charts.chart_key([ticker], period, "+".join(["price"] + overlays), [hist])
+        buffer = await charts.render_chart(key, [(x,y)], f"{ticker} - Last {period}", "Date", "Price (USD)", [ticker], [line_color], lines)
         file = discord.File(buffer, filename="chart.png")
 
         await ctx.send(file=file)
@@ -133,8 +163,7 @@ async def news(ctx, arg):
         await ctx.send(f"❌ Ticker symbol for '{arg}' not found.")
         return
     
-    stock = yf.Ticker(ticker)
-    news_items = stock.news
+    news_items = await market_data.get_news(ticker)
     n_pages = -(len(news_items) // -NEWS_PER_PAGE)  # Ceiling division
    
     if not news_items:
@@ -192,8 +221,7 @@ async def metrics(ctx, arg):
     if not ticker:
         await ctx.send(f"❌ Ticker symbol for '{arg}' not found.")
         return
-    stock = yf.Ticker(ticker)
-    info = stock.get_info()
+    info = await market_data.get_info(ticker)
     if not info:
         await ctx.send(f"❌ No financial metrics found for '{ticker}'.")
         return
@@ -201,7 +229,7 @@ async def metrics(ctx, arg):
 
     # If server has PRO plan, show advanced metrics
     server_id = ctx.message.guild.id
-    plan = server_plan_db.get_server_plan(server_id)
+    plan = await db.run(server_plan_db.get_server_plan, server_id)
 
     ev = round(float(info.get("enterpriseValue", 0)), 2)
     trailing_pe = round(float(info.get("trailingPE", 0)), 2)
@@ -0,0 +1,36 @@
+from . import db
+
+
+def claim_shards(owner, shard_ids, lease_seconds):
+    # Take or renew the lease for each shard unless another live worker holds it; returns the shards we own
+    with db.transaction() as cursor:
+        cursor.execute('''
+            INSERT INTO alert_shard_lease (shard_id, owner, expires_at)
+            SELECT shard_id, %s, NOW() + %s * INTERVAL '1 second'
+            FROM unnest(%s::int[]) AS shard_id
+            ON CONFLICT (shard_id) DO UPDATE
+            SET owner = EXCLUDED.owner, expires_at = EXCLUDED.expires_at
+            WHERE alert_shard_lease.owner = EXCLUDED.owner OR alert_shard_lease.expires_at < NOW()
+            RETURNING shard_id
+        ''', (owner, lease_seconds, list(shard_ids)))
+        results = cursor.fetchall()
+    return sorted(row[0] for row in results)
+
+
+def release_shards(owner):
+    with db.transaction() as cursor:
+        cursor.execute('DELETE FROM alert_shard_lease WHERE owner = %s', (owner,))
+
+
+def get_unleased_shards(shard_count):
+    # Shards no live worker is evaluating (their subscriptions are currently skipped)
+    with db.transaction() as cursor:
+        cursor.execute('''
+            SELECT g.shard FROM generate_series(0, %s - 1) AS g(shard)
+            WHERE NOT EXISTS (
+                SELECT 1 FROM alert_shard_lease l
+                WHERE l.shard_id = g.shard AND l.expires_at >= NOW()
+            )
+        ''', (shard_count,))
+        results = cursor.fetchall()
+    return [row[0] for row in results]
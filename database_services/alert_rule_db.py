@@ -0,0 +1,74 @@
+from psycopg2.extras import execute_values
+from . import db
+from . import server_db
+from . import stock_db
+
+
+def insert_rule(discord_server_id, ticker, rule, max_rules):
+    # Returns (rule_id, created); rule_id is None when the server already has max_rules rules
+    server_id = server_db.get_server_internal_id(discord_server_id)
+    stock_id = stock_db.get_stock_internal_id(ticker)
+
+    with db.transaction() as cursor:
+        # Serialise rule inserts per server so concurrent commands cannot overshoot the limit
+        cursor.execute('SELECT id FROM server WHERE id = %s FOR UPDATE', (server_id,))
+        cursor.execute('SELECT id FROM alert_rule WHERE server_id = %s AND stock_id = %s AND rule = %s', (server_id, stock_id, rule))
+        existing = cursor.fetchone()
+        if existing:
+            return existing[0], False
+        cursor.execute('SELECT COUNT(*) FROM alert_rule WHERE server_id = %s', (server_id,))
+        if cursor.fetchone()[0] >= max_rules:
+            return None, False
+        cursor.execute('INSERT INTO alert_rule (server_id, stock_id, rule) VALUES (%s, %s, %s) RETURNING id', (server_id, stock_id, rule))
+        return cursor.fetchone()[0], True
+
+def get_server_rules(discord_server_id):
+    with db.transaction() as cursor:
+        cursor.execute('''
+            SELECT ar.id, st.ticker, ar.rule, ar.alerted, ar.last_alerted
+            FROM alert_rule ar
+            JOIN server s ON ar.server_id = s.id
+            JOIN stock st ON ar.stock_id = st.id
+            WHERE s.server_id = %s
+            ORDER BY st.ticker, ar.id
+        ''', (discord_server_id,))
+        results = cursor.fetchall()
+    return results  # List of (rule_id, ticker, rule, alerted, last_alerted) tuples
+
+def delete_rules(discord_server_id, rule_ids):
+    with db.transaction() as cursor:
+        cursor.execute('''
+            DELETE FROM alert_rule ar
+            USING server s, stock st
+            WHERE ar.server_id = s.id AND ar.stock_id = st.id
+            AND s.server_id = %s AND ar.id = ANY(%s)
+            RETURNING ar.id, st.ticker, ar.rule
+        ''', (discord_server_id, list(rule_ids)))
+        deleted = sorted(cursor.fetchall())
+    return deleted  # (rule_id, ticker, rule) of the removed rules; ids of other servers are ignored
+
+def get_all_rules(shard_count=1, shard_ids=(0,)):
+    # Only guilds on the given Discord shards: shard = (guild_id >> 22) % shard_count
+    with db.transaction() as cursor:
+        cursor.execute('''
+            SELECT ar.id, s.server_id, st.ticker, ar.rule, ar.alerted, ar.last_alerted
+            FROM alert_rule ar
+            JOIN server s ON ar.server_id = s.id
+            JOIN stock st ON ar.stock_id = st.id
+            WHERE ((s.server_id >> 22) %% %s) = ANY(%s)
+        ''', (shard_count, list(shard_ids)))
+        results = cursor.fetchall()
+    return results  # List of (rule_id, discord_server_id, ticker, rule, alerted, last_alerted) tuples
+
+def apply_rule_states(changes):
+    # changes: list of (rule_id, alerted) pairs, written in a single UPDATE
+    if not changes:
+        return
+    with db.transaction() as cursor:
+        execute_values(cursor, '''
+            UPDATE alert_rule ar
+            SET alerted = v.alerted,
+                last_alerted = CASE WHEN v.alerted THEN NOW() ELSE NULL END
+            FROM (VALUES %s) AS v(id, alerted)
+            WHERE ar.id = v.id
+        ''', changes, template='(%s, %s::boolean)', page_size=len(changes))
@@ -0,0 +1,189 @@
+import psycopg2
+import psycopg2.extensions
+import psycopg2.pool
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+load_dotenv()  # Load environment variables from .env file
+
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", 1))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", 10))
+# Connections idle for longer than this are pinged before being handed out
+DB_HEALTHCHECK_INTERVAL = float(os.getenv("DB_HEALTHCHECK_INTERVAL", 30))
+DB_CONNECT_RETRIES = int(os.getenv("DB_CONNECT_RETRIES", 3))
+
+_pool = None
+_pool_lock = threading.Lock()
+# Bounds checkouts so callers wait for a free connection instead of getting a PoolError
+_checkout_slots = threading.BoundedSemaphore(DB_POOL_MAX_SIZE)
+_last_used = {}
+
+# Process-wide statement counters, read by the bot's metrics endpoint
+stats = {"queries": 0, "query_seconds": 0.0, "reconnects": 0}
+_stats_lock = threading.Lock()
+# Counters of the current count_queries() block, if any; db.run carries it into the worker thread
+_scoped_stats = contextvars.ContextVar("db_scoped_stats", default=None)
+
+
+class _CountingCursor(psycopg2.extensions.cursor):
+    ''' Cursor that records how many statements run and how long they take '''
+
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            _record(time.perf_counter() - started)
+
+    def executemany(self, query, vars_list):
+        started = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            _record(time.perf_counter() - started)
+
+
+def _record(seconds):
+    scoped = _scoped_stats.get()
+    with _stats_lock:
+        stats["queries"] += 1
+        stats["query_seconds"] += seconds
+        if scoped is not None:
+            scoped["queries"] += 1
+            scoped["query_seconds"] += seconds
+
+
+@contextmanager
+def count_queries():
+    ''' Yield {"queries", "query_seconds"} counting only the statements of this task, its child tasks and their db.run calls '''
+    scoped = {"queries": 0, "query_seconds": 0.0}
+    token = _scoped_stats.set(scoped)
+    try:
+        yield scoped
+    finally:
+        _scoped_stats.reset(token)
+
+# Async callers run service functions here; sized to the pool so workers never wait on each other
+_executor = ThreadPoolExecutor(max_workers=DB_POOL_MAX_SIZE, thread_name_prefix="db")
+
+
+def _connection_params():
+    return dict(
+        dbname=os.getenv("POSTGRES_DB"),
+        user=os.getenv("POSTGRES_USER"),
+        password=os.getenv("POSTGRES_PASSWORD"),
+        host=os.getenv("POSTGRES_HOST"),
+        port='5432'
+    )
+
+
+def get_pool():
+    ''' Return the process-wide connection pool, creating it on first use '''
+    global _pool
+    if _pool is None or _pool.closed:
+        with _pool_lock:
+            if _pool is None or _pool.closed:
+                _pool = psycopg2.pool.ThreadedConnectionPool(
+                    DB_POOL_MIN_SIZE,
+                    DB_POOL_MAX_SIZE,
+                    **_connection_params()
+                )
+    return _pool
+
+
+def _is_healthy(conn):
+    if conn.closed:
+        return False
+    if time.monotonic() - _last_used.get(id(conn), 0) < DB_HEALTHCHECK_INTERVAL:
+        return True
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+
+def _discard(conn):
+    with _stats_lock:
+        stats["reconnects"] += 1
+    _last_used.pop(id(conn), None)
+    get_pool().putconn(conn, close=True)
+
+
+def _checkout():
+    ''' Get a healthy connection from the pool, replacing broken ones '''
+    last_error = None
+    for attempt in range(DB_CONNECT_RETRIES):
+        try:
+            conn = get_pool().getconn()
+        except psycopg2.OperationalError as e:
+            # Database unreachable, back off before reconnecting
+            last_error = e
+            time.sleep(min(2 ** attempt, 10))
+            continue
+        if _is_healthy(conn):
+            return conn
+        _discard(conn)
+    raise psycopg2.OperationalError(f"Could not get a healthy database connection: {last_error}")
+
+
+@contextmanager
+def transaction():
+    ''' Yield a cursor on a pooled connection; commits on success and rolls back on error '''
+    _checkout_slots.acquire()
+    try:
+        conn = _checkout()
+        broken = False
+        try:
+            with conn.cursor(cursor_factory=_CountingCursor) as cursor:
+                yield cursor
+            conn.commit()
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            if broken or conn.closed:
+                _discard(conn)
+            else:
+                _last_used[id(conn)] = time.monotonic()
+                get_pool().putconn(conn)
+    finally:
+        _checkout_slots.release()
+
+
+def listen(channel):
+    ''' Open a dedicated autocommit connection subscribed to a NOTIFY channel (LISTEN is per session, so it stays out of the pool) '''
+    conn = psycopg2.connect(**_connection_params())
+    conn.autocommit = True
+    with conn.cursor() as cursor:
+        cursor.execute(f'LISTEN {channel}')
+    return conn
+
+
+async def run(func, *args, **kwargs):
+    ''' Async variant of any database service function: runs it on the DB worker pool '''
+    loop = asyncio.get_running_loop()
+    # run_in_executor does not carry context variables into the thread (count_queries relies on them)
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(_executor, functools.partial(context.run, func, *args, **kwargs))
+
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None and not _pool.closed:
+            _pool.closeall()
+        _pool = None
+        _last_used.clear()
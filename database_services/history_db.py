@@ -0,0 +1,113 @@
+from psycopg2.extras import Json, execute_values
+from . import db
+
+
+def get_history_range(ticker):
+    with db.transaction() as cursor:
+        cursor.execute('SELECT covered_from, covered_to FROM stock_history_range WHERE ticker = %s', (ticker,))
+        result = cursor.fetchone()
+    return result  # Returns (covered_from, covered_to) or None if nothing is stored
+
+
+def get_history_ranges(tickers):
+    with db.transaction() as cursor:
+        cursor.execute('SELECT ticker, covered_from, covered_to FROM stock_history_range WHERE ticker = ANY(%s)', (list(tickers),))
+        results = cursor.fetchall()
+    return {ticker: (covered_from, covered_to) for ticker, covered_from, covered_to in results}  # ticker -> (covered_from, covered_to)
+
+
+def get_bars(ticker, start_date):
+    with db.transaction() as cursor:
+        cursor.execute('''
+            SELECT date, open, high, low, close, volume,
+                   sma_20, sma_50, ema_12, ema_26, rsi_14, bb_upper, bb_middle, bb_lower, atr_14
+            FROM stock_history
+            WHERE ticker = %s AND date >= %s
+            ORDER BY date
+        ''', (ticker, start_date))
+        results = cursor.fetchall()
+    return results  # List of (date, open, high, low, close, volume, *indicators) tuples
+
+
+def get_bars_many(tickers, start_date):
+    with db.transaction() as cursor:
+        cursor.execute('''
+            SELECT ticker, date, open, high, low, close, volume,
+                   sma_20, sma_50, ema_12, ema_26, rsi_14, bb_upper, bb_middle, bb_lower, atr_14
+            FROM stock_history
+            WHERE ticker = ANY(%s) AND date >= %s
+            ORDER BY ticker, date
+        ''', (list(tickers), start_date))
+        results = cursor.fetchall()
+    bars = {}
+    for row in results:
+        bars.setdefault(row[0], []).append(row[1:])
+    return bars  # ticker -> list of (date, open, high, low, close, volume, *indicators) tuples
+
+
+def save_bars(ticker, bars, covered_from, covered_to, replace=False):
+    # bars: list of (date, open, high, low, close, volume); replace drops previously stored bars first
+    with db.transaction() as cursor:
+        if replace:
+            cursor.execute('DELETE FROM stock_history WHERE ticker = %s', (ticker,))
+            cursor.execute('DELETE FROM stock_history_range WHERE ticker = %s', (ticker,))
+            cursor.execute('DELETE FROM stock_indicator_state WHERE ticker = %s', (ticker,))
+        if bars:
+            execute_values(cursor, '''
+                INSERT INTO stock_history (ticker, date, open, high, low, close, volume)
+                VALUES %s
+                ON CONFLICT (ticker, date) DO UPDATE
+                SET open = EXCLUDED.open, high = EXCLUDED.high, low = EXCLUDED.low,
+                    close = EXCLUDED.close, volume = EXCLUDED.volume
+            ''', [(ticker, *bar) for bar in bars], page_size=1000)
+        cursor.execute('''
+            INSERT INTO stock_history_range (ticker, covered_from, covered_to)
+            VALUES (%s, %s, %s)
+            ON CONFLICT (ticker) DO UPDATE
+            SET covered_from = LEAST(stock_history_range.covered_from, EXCLUDED.covered_from),
+                covered_to = GREATEST(stock_history_range.covered_to, EXCLUDED.covered_to)
+        ''', (ticker, covered_from, covered_to))
+
+
+def get_indicator_states(tickers):
+    with db.transaction() as cursor:
+        cursor.execute('SELECT ticker, as_of, state FROM stock_indicator_state WHERE ticker = ANY(%s)', (list(tickers),))
+        results = cursor.fetchall()
+    return {ticker: (as_of, state) for ticker, as_of, state in results}  # ticker -> (as_of, state dict)
+
+
+def get_bars_after(after_by_ticker):
+    # after_by_ticker: ticker -> date; returns the bars strictly after that date for every ticker in one query
+    if not after_by_ticker:
+        return {}
+    with db.transaction() as cursor:
+        results = execute_values(cursor, '''
+            SELECT h.ticker, h.date, h.high, h.low, h.close
+            FROM stock_history h
+            JOIN (VALUES %s) AS s (ticker, after) ON h.ticker = s.ticker AND h.date > s.after
+            ORDER BY h.ticker, h.date
+        ''', list(after_by_ticker.items()), template="(%s, %s::date)", fetch=True)
+    bars = {}
+    for row in results:
+        bars.setdefault(row[0], []).append(row[1:])
+    return bars  # ticker -> list of (date, high, low, close) tuples
+
+
+def save_indicators(rows, states):
+    # rows: list of (ticker, date, *indicators); states: list of (ticker, as_of, state dict)
+    with db.transaction() as cursor:
+        if rows:
+            execute_values(cursor, '''
+                UPDATE stock_history h
+                SET sma_20 = v.sma_20, sma_50 = v.sma_50, ema_12 = v.ema_12, ema_26 = v.ema_26, rsi_14 = v.rsi_14,
+                    bb_upper = v.bb_upper, bb_middle = v.bb_middle, bb_lower = v.bb_lower, atr_14 = v.atr_14
+                FROM (VALUES %s) AS v (ticker, date, sma_20, sma_50, ema_12, ema_26, rsi_14,
+                                       bb_upper, bb_middle, bb_lower, atr_14)
+                WHERE h.ticker = v.ticker AND h.date = v.date
+            ''', rows, template="(%s, %s::date" + ", %s::float8" * 9 + ")", page_size=1000)
+        if states:
+            execute_values(cursor, '''
+                INSERT INTO stock_indicator_state (ticker, as_of, state)
+                VALUES %s
+                ON CONFLICT (ticker) DO UPDATE SET as_of = EXCLUDED.as_of, state = EXCLUDED.state
+            ''', [(ticker, as_of, Json(state)) for ticker, as_of, state in states])
@@ -0,0 +1,46 @@
+from . import db
+
+# discord server id -> server.id
+_server_ids = {}
+# ticker -> stock.id and back
+_stock_ids = {}
+_tickers = {}
+
+
+def load_servers():
+    with db.transaction() as cursor:
+        cursor.execute('SELECT server_id, id FROM server')
+        results = cursor.fetchall()
+    _server_ids.clear()
+    _server_ids.update(results)
+    return len(_server_ids)
+
+
+def load_stocks(rows):
+    # rows: iterable of (id, ticker, ...) as loaded for the stock index
+    stock_ids = {row[1]: row[0] for row in rows}
+    _stock_ids.clear()
+    _stock_ids.update(stock_ids)
+    _tickers.clear()
+    _tickers.update({stock_id: ticker for ticker, stock_id in stock_ids.items()})
+
+
+def get_server_id(discord_server_id):
+    return _server_ids.get(discord_server_id)
+
+
+def remember_server(discord_server_id, server_id):
+    _server_ids[discord_server_id] = server_id
+
+
+def get_stock_id(ticker):
+    return _stock_ids.get(ticker)
+
+
+def get_ticker(stock_id):
+    return _tickers.get(stock_id)
+
+
+def remember_stock(ticker, stock_id):
+    _stock_ids[ticker] = stock_id
+    _tickers[stock_id] = ticker
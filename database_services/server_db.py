@@ -1,6 +1,7 @@
-import psycopg2
 import os
 from dotenv import load_dotenv
+from . import db
+from . import identity_map
 from . import plan_db
 from . import server_plan_db
 
@@ -8,38 +9,59 @@ load_dotenv()  # Load environment variables from .env file
 
 DISCORD_FREE_PLAN_NAME=os.getenv("DISCORD_FREE_PLAN_NAME", "Free")
 
-conn = psycopg2.connect(
-    dbname=os.getenv("POSTGRES_DB"),
-    user=os.getenv("POSTGRES_USER"),
-    password=os.getenv("POSTGRES_PASSWORD"),
-    host=os.getenv("POSTGRES_HOST"),
-    port='5432'
-)
+# discord server id -> alert channel id, mirrors server.alert_channel_id
+_alert_channels = {}
+
 
 def insert_server(discord_server_id, server_name):
-    cursor = conn.cursor()
-    # Check if server already exists
-    cursor.execute('SELECT id FROM server WHERE server_id = %s', (discord_server_id,))
-    if cursor.fetchone():
-        cursor.close()
-        return  # Server already exists
-
-    # Insert new server
-    cursor.execute('INSERT INTO server (server_id, server_name) VALUES (%s, %s) RETURNING id', (discord_server_id, server_name))
-    server_id = cursor.fetchone()[0]
-    
-    # Insert initial plan as 'Free'
+    with db.transaction() as cursor:
+        # Check if server already exists
+        cursor.execute('SELECT id FROM server WHERE server_id = %s', (discord_server_id,))
+        existing = cursor.fetchone()
+        if existing:
+            identity_map.remember_server(discord_server_id, existing[0])
+            return  # Server already exists
+
+        # Insert new server
+        cursor.execute('INSERT INTO server (server_id, server_name) VALUES (%s, %s) RETURNING id', (discord_server_id, server_name))
+        server_id = cursor.fetchone()[0]
+    identity_map.remember_server(discord_server_id, server_id)
+
+    # Insert initial plan as 'Free' (server row must be committed first)
     server_plan_db.insert_server_plan(discord_server_id, DISCORD_FREE_PLAN_NAME)
-    
-    conn.commit()
-    cursor.close()
 
 
 def get_server_internal_id(discord_server_id):
-    cursor = conn.cursor()
-    cursor.execute('SELECT id FROM server WHERE server_id = %s', (discord_server_id,))
-    result = cursor.fetchone()
-    cursor.close()
+    server_id = identity_map.get_server_id(discord_server_id)
+    if server_id is not None:
+        return server_id
+
+    with db.transaction() as cursor:
+        cursor.execute('SELECT id FROM server WHERE server_id = %s', (discord_server_id,))
+        result = cursor.fetchone()
+    if result:
+        identity_map.remember_server(discord_server_id, result[0])
     return result[0] if result else None
 
 
+def load_alert_channels():
+    with db.transaction() as cursor:
+        cursor.execute('SELECT server_id, alert_channel_id FROM server WHERE alert_channel_id IS NOT NULL')
+        results = cursor.fetchall()
+    _alert_channels.clear()
+    _alert_channels.update(results)
+    return len(_alert_channels)
+
+
+def get_alert_channel_id(discord_server_id):
+    return _alert_channels.get(discord_server_id)
+
+
+def set_alert_channel_id(discord_server_id, channel_id):
+    # channel_id None forgets the channel (e.g. it was deleted)
+    with db.transaction() as cursor:
+        cursor.execute('UPDATE server SET alert_channel_id = %s WHERE server_id = %s', (channel_id, discord_server_id))
+    if channel_id is None:
+        _alert_channels.pop(discord_server_id, None)
+    else:
+        _alert_channels[discord_server_id] = channel_id
@@ -1,53 +1,103 @@
 import psycopg2
-import os
-from dotenv import load_dotenv
+import threading
+from . import db
+from . import identity_map
+from .stock_index import StockIndex
 
-load_dotenv()  # Load environment variables from .env file
+# Channel notified by utils/init_db.py whenever the stock table is (re)loaded
+STOCK_UNIVERSE_CHANNEL = "stock_universe_changed"
+
+_index = None
+_index_lock = threading.Lock()
+_listen_conn = None
+
+
+def load_stock_index():
+    ''' (Re)load the in-memory ticker/name index from the stock table '''
+    global _index
+    with db.transaction() as cursor:
+        cursor.execute('SELECT id, ticker, name FROM stock')
+        rows = cursor.fetchall()
+    index = StockIndex(rows)
+    identity_map.load_stocks(rows)
+    with _index_lock:
+        _index = index
+    return index
+
+
+def get_stock_index():
+    index = _index
+    if index is None:
+        with _index_lock:
+            index = _index
+        if index is None:
+            index = load_stock_index()
+    return index
+
+
+def refresh_stock_index_if_changed():
+    ''' Reload the index when a stock universe change notification arrived since the last call. Returns True if reloaded. '''
+    global _listen_conn
+    try:
+        if _listen_conn is None or _listen_conn.closed:
+            _listen_conn = db.listen(STOCK_UNIVERSE_CHANNEL)
+            # Anything may have changed while we were not listening
+            load_stock_index()
+            return True
+        _listen_conn.poll()
+    except psycopg2.Error:
+        if _listen_conn is not None:
+            _listen_conn.close()
+        _listen_conn = None
+        raise
+
+    if not _listen_conn.notifies:
+        return False
+    _listen_conn.notifies.clear()
+    load_stock_index()
+    return True
 
-conn = psycopg2.connect(
-    dbname=os.getenv("POSTGRES_DB"),
-    user=os.getenv("POSTGRES_USER"),
-    password=os.getenv("POSTGRES_PASSWORD"),
-    host=os.getenv("POSTGRES_HOST"),
-    port='5432'
-)
 
 def get_ticker_by_name(company_name):
-    cursor = conn.cursor()
-    # First check if the input is already a ticker
-    cursor.execute('SELECT ticker FROM stock WHERE ticker = %s', (company_name.upper(),))
-    result = cursor.fetchone()
-    if result:
-        result = result[0]
-        cursor.close()
-        return result
+    # Exact ticker, exact company name, then partial company name (all case-insensitive), served from memory
+    return get_stock_index().lookup(company_name)
 
-    # If not, search by exact company name match (case-insensitive)
-    cursor.execute('SELECT ticker FROM stock WHERE name ILIKE %s', (company_name,))
-    result = cursor.fetchone()
+
+def get_stock_internal_id(ticker):
+    stock_id = identity_map.get_stock_id(ticker)
+    if stock_id is not None:
+        return stock_id
+
+    with db.transaction() as cursor:
+        cursor.execute('SELECT id FROM stock WHERE ticker = %s', (ticker,))
+        result = cursor.fetchone()
     if result:
-        cursor.close()
-        return result[0]
-        
-    # If still not found, search by partial company name match (case-insensitive)
-    cursor.execute('SELECT ticker FROM stock WHERE name ILIKE %s', (f'%{company_name}%',))
-    result = cursor.fetchone()
-    cursor.close()
+        identity_map.remember_stock(ticker, result[0])
     return result[0] if result else None
 
 
-def get_stock_internal_id(ticker):
-    cursor = conn.cursor()
-    cursor.execute('SELECT id FROM stock WHERE ticker = %s', (ticker,))
-    result = cursor.fetchone()
-    cursor.close()
-    return result[0] if result else None
+def get_stock_internal_ids(tickers):
+    # ticker -> stock.id for many tickers; only the ones missing from the identity map cost a (single) query
+    stock_ids = {ticker: identity_map.get_stock_id(ticker) for ticker in tickers}
+    missing = [ticker for ticker, stock_id in stock_ids.items() if stock_id is None]
+    if missing:
+        with db.transaction() as cursor:
+            cursor.execute('SELECT ticker, id FROM stock WHERE ticker = ANY(%s)', (missing,))
+            results = cursor.fetchall()
+        for ticker, stock_id in results:
+            identity_map.remember_stock(ticker, stock_id)
+            stock_ids[ticker] = stock_id
+    return {ticker: stock_id for ticker, stock_id in stock_ids.items() if stock_id is not None}
 
 
 def get_ticker_by_id(stock_id):
-    cursor = conn.cursor()
-    cursor.execute('SELECT ticker FROM stock WHERE id = %s', (stock_id,))
-    result = cursor.fetchone()
-    cursor.close()
-    return result[0] if result else None
+    ticker = identity_map.get_ticker(stock_id)
+    if ticker is not None:
+        return ticker
 
+    with db.transaction() as cursor:
+        cursor.execute('SELECT ticker FROM stock WHERE id = %s', (stock_id,))
+        result = cursor.fetchone()
+    if result:
+        identity_map.remember_stock(result[0], stock_id)
+    return result[0] if result else None
@@ -0,0 +1,86 @@
+from bisect import bisect_left
+from collections import defaultdict
+
+
+def normalize_name(name):
+    ''' Case-fold and collapse whitespace so lookups behave like ILIKE '''
+    return " ".join(name.casefold().split())
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class StockIndex:
+    ''' In-memory ticker/name resolution over the stock table.
+
+    Lower ids win ties, which mirrors the SEC file order the table was loaded in (largest companies first).
+    '''
+
+    def __init__(self, rows):
+        # rows: iterable of (id, ticker, name)
+        self.by_ticker = {}
+        self.by_name = {}
+        self.names = {}
+        self.trigrams = defaultdict(set)
+        sorted_names = []
+
+        for stock_id, ticker, name in sorted(rows):
+            self.by_ticker[ticker] = stock_id
+            if not name:
+                continue
+            normalized = normalize_name(name)
+            self.names[stock_id] = (normalized, ticker)
+            self.by_name.setdefault(normalized, ticker)
+            sorted_names.append((normalized, stock_id))
+            for trigram in _trigrams(normalized):
+                self.trigrams[trigram].add(stock_id)
+
+        sorted_names.sort()
+        self.sorted_names = [name for name, _ in sorted_names]
+        self.sorted_ids = [stock_id for _, stock_id in sorted_names]
+
+    def __len__(self):
+        return len(self.by_ticker)
+
+    def lookup(self, query):
+        ''' Resolve a ticker or company name to a ticker: exact ticker, exact name, then partial name '''
+        query = query.strip()
+        if not query:
+            return None
+        if query.upper() in self.by_ticker:
+            return query.upper()
+
+        normalized = normalize_name(query)
+        if normalized in self.by_name:
+            return self.by_name[normalized]
+
+        stock_id = self._partial_match(normalized)
+        return self.names[stock_id][1] if stock_id is not None else None
+
+    def _partial_match(self, normalized):
+        if len(normalized) < 3:
+            return self._prefix_match(normalized)
+
+        # Intersect trigram posting lists, smallest first, then confirm the substring
+        postings = sorted((self.trigrams.get(t, set()) for t in _trigrams(normalized)), key=len)
+        if not postings[0]:
+            return None
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            candidates &= posting
+            if not candidates:
+                return None
+        matches = [stock_id for stock_id in candidates if normalized in self.names[stock_id][0]]
+        return min(matches) if matches else None
+
+    def _prefix_match(self, normalized):
+        start = bisect_left(self.sorted_names, normalized)
+        end = start
+        while end < len(self.sorted_names) and self.sorted_names[end].startswith(normalized):
+            end += 1
+        if start == end:
+            # Too short for trigrams and no prefix hit: fall back to a substring scan
+            matches = [stock_id for stock_id, (name, _) in self.names.items() if normalized in name]
+            return min(matches) if matches else None
+        return min(self.sorted_ids[start:end])
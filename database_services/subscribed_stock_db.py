@@ -1,82 +1,157 @@
-import psycopg2
-import os
-from dotenv import load_dotenv
+from psycopg2.extras import execute_values
+from . import db
 from . import server_db
 from . import stock_db
 
-load_dotenv()  # Load environment variables from .env file
-
-conn = psycopg2.connect(
-    dbname=os.getenv("POSTGRES_DB"),
-    user=os.getenv("POSTGRES_USER"),
-    password=os.getenv("POSTGRES_PASSWORD"),
-    host=os.getenv("POSTGRES_HOST"),
-    port='5432'
-)
 
 def insert_server_stock(discord_server_id, ticker, threshold):
-    cursor = conn.cursor()
     server_id = server_db.get_server_internal_id(discord_server_id)
     stock_id = stock_db.get_stock_internal_id(ticker)
 
-    cursor.execute('INSERT INTO subscribed_stock (server_id, stock_id, threshold) VALUES (%s, %s, %s)', (server_id, stock_id, threshold))
-    conn.commit()
-    cursor.close()
+    with db.transaction() as cursor:
+        cursor.execute('INSERT INTO subscribed_stock (server_id, stock_id, threshold) VALUES (%s, %s, %s)', (server_id, stock_id, threshold))
 
 def get_subscribed_stocks(discord_server_id):
-    cursor = conn.cursor()
     server_id = server_db.get_server_internal_id(discord_server_id)
 
-    cursor.execute('SELECT stock_id, threshold, alerted, last_alerted FROM subscribed_stock WHERE server_id = %s', (server_id,))
-    results = cursor.fetchall()
-    cursor.close()
+    with db.transaction() as cursor:
+        cursor.execute('SELECT stock_id, threshold, alerted, last_alerted FROM subscribed_stock WHERE server_id = %s', (server_id,))
+        results = cursor.fetchall()
     return results  # List of (stock_id, threshold, alerted, last_alerted) tuples
 
 
+def get_server_subscriptions(discord_server_id):
+    with db.transaction() as cursor:
+        cursor.execute('''
+            SELECT st.ticker, st.name, ss.threshold, ss.alerted, ss.last_alerted
+            FROM subscribed_stock ss
+            JOIN server s ON ss.server_id = s.id
+            JOIN stock st ON ss.stock_id = st.id
+            WHERE s.server_id = %s
+            ORDER BY st.ticker
+        ''', (discord_server_id,))
+        results = cursor.fetchall()
+    return results  # List of (ticker, name, threshold, alerted, last_alerted) tuples
+
+
+def upsert_server_stocks(discord_server_id, thresholds, max_stocks):
+    # Watch many stocks (or change their thresholds) in one transaction, enforcing the plan limit once.
+    # thresholds: {ticker: threshold}. Returns {"added": [(ticker, threshold)], "updated": [(ticker, old, new)],
+    # "unchanged": [(ticker, threshold)], "limit": [ticker]}; new stocks past the limit are not added
+    server_id = server_db.get_server_internal_id(discord_server_id)
+    stock_ids = stock_db.get_stock_internal_ids(thresholds)
+    result = {"added": [], "updated": [], "unchanged": [], "limit": []}
+
+    with db.transaction() as cursor:
+        # Serialise watches per server so concurrent commands cannot overshoot the limit
+        cursor.execute('SELECT id FROM server WHERE id = %s FOR UPDATE', (server_id,))
+        cursor.execute('SELECT stock_id, threshold FROM subscribed_stock WHERE server_id = %s', (server_id,))
+        existing = dict(cursor.fetchall())
+
+        free_slots = max_stocks - len(existing)
+        rows = []
+        for ticker, threshold in thresholds.items():
+            stock_id = stock_ids.get(ticker)
+            if stock_id is None:
+                continue
+            previous = existing.get(stock_id)
+            if previous is None:
+                if free_slots <= 0:
+                    result["limit"].append(ticker)
+                    continue
+                free_slots -= 1
+                result["added"].append((ticker, threshold))
+            elif float(previous) == float(threshold):
+                result["unchanged"].append((ticker, previous))
+                continue
+            else:
+                result["updated"].append((ticker, previous, threshold))
+            rows.append((server_id, stock_id, threshold))
+
+        if rows:
+            execute_values(cursor, '''
+                INSERT INTO subscribed_stock (server_id, stock_id, threshold)
+                VALUES %s
+                ON CONFLICT (server_id, stock_id) DO UPDATE
+                SET threshold = EXCLUDED.threshold, alerted = FALSE, last_alerted = NULL
+            ''', rows, page_size=len(rows))
+    return result
+
+
 def update_server_stock_threshold(discord_server_id, ticker, new_threshold):
-    cursor = conn.cursor()
     server_id = server_db.get_server_internal_id(discord_server_id)
     stock_id = stock_db.get_stock_internal_id(ticker)
 
-    cursor.execute('UPDATE subscribed_stock SET threshold = %s, alerted = FALSE, last_alerted = NULL WHERE server_id = %s AND stock_id = %s', (new_threshold, server_id, stock_id))
-    conn.commit()
-    cursor.close()
+    with db.transaction() as cursor:
+        cursor.execute('UPDATE subscribed_stock SET threshold = %s, alerted = FALSE, last_alerted = NULL WHERE server_id = %s AND stock_id = %s', (new_threshold, server_id, stock_id))
 
 
 def delete_server_stock(discord_server_id, ticker):
-    cursor = conn.cursor()
     server_id = server_db.get_server_internal_id(discord_server_id)
     stock_id = stock_db.get_stock_internal_id(ticker)
 
-    cursor.execute('DELETE FROM subscribed_stock WHERE server_id = %s AND stock_id = %s', (server_id, stock_id))
-    conn.commit()
-    cursor.close()
+    with db.transaction() as cursor:
+        cursor.execute('DELETE FROM subscribed_stock WHERE server_id = %s AND stock_id = %s', (server_id, stock_id))
+
+def delete_server_stocks(discord_server_id, tickers):
+    with db.transaction() as cursor:
+        cursor.execute('''
+            DELETE FROM subscribed_stock ss
+            USING server s, stock st
+            WHERE ss.server_id = s.id AND ss.stock_id = st.id
+            AND s.server_id = %s AND st.ticker = ANY(%s)
+            RETURNING st.ticker
+        ''', (discord_server_id, list(tickers)))
+        deleted = sorted(row[0] for row in cursor.fetchall())
+    return deleted  # Tickers that were being watched and are now removed
 
 def delete_server_stocks_from_server(discord_server_id):
-    cursor = conn.cursor()
-    server_id = server_db.get_server_internal_id(discord_server_id)
-
-    cursor.execute('DELETE FROM subscribed_stock WHERE server_id = %s RETURNING stock_id', (server_id,))
-    stocks = cursor.fetchall()
-    conn.commit()
-    cursor.close()
-    return stocks
+    with db.transaction() as cursor:
+        cursor.execute('''
+            DELETE FROM subscribed_stock ss
+            USING server s, stock st
+            WHERE ss.server_id = s.id AND ss.stock_id = st.id AND s.server_id = %s
+            RETURNING st.ticker
+        ''', (discord_server_id,))
+        tickers = sorted(row[0] for row in cursor.fetchall())
+    return tickers  # Tickers that were unwatched
 
 def mark_stock_as_alerted(discord_server_id, ticker):
-    cursor = conn.cursor()
     server_id = server_db.get_server_internal_id(discord_server_id)
     stock_id = stock_db.get_stock_internal_id(ticker)
 
-    cursor.execute('UPDATE subscribed_stock SET alerted = TRUE, last_alerted = NOW() WHERE server_id = %s AND stock_id = %s', (server_id, stock_id))
-    conn.commit()
-    cursor.close()
+    with db.transaction() as cursor:
+        cursor.execute('UPDATE subscribed_stock SET alerted = TRUE, last_alerted = NOW() WHERE server_id = %s AND stock_id = %s', (server_id, stock_id))
 
 def reset_stock_alert(discord_server_id, ticker):
-    cursor = conn.cursor()
     server_id = server_db.get_server_internal_id(discord_server_id)
     stock_id = stock_db.get_stock_internal_id(ticker)
 
-    cursor.execute('UPDATE subscribed_stock SET alerted = FALSE, last_alerted = NULL WHERE server_id = %s AND stock_id = %s', (server_id, stock_id))
-    conn.commit()
-    cursor.close()
-
+    with db.transaction() as cursor:
+        cursor.execute('UPDATE subscribed_stock SET alerted = FALSE, last_alerted = NULL WHERE server_id = %s AND stock_id = %s', (server_id, stock_id))
+
+def get_all_subscriptions(shard_count=1, shard_ids=(0,)):
+    # Only guilds on the given Discord shards: shard = (guild_id >> 22) % shard_count
+    with db.transaction() as cursor:
+        cursor.execute('''
+            SELECT ss.id, s.server_id, st.ticker, ss.threshold, ss.alerted, ss.last_alerted
+            FROM subscribed_stock ss
+            JOIN server s ON ss.server_id = s.id
+            JOIN stock st ON ss.stock_id = st.id
+            WHERE ((s.server_id >> 22) %% %s) = ANY(%s)
+        ''', (shard_count, list(shard_ids)))
+        results = cursor.fetchall()
+    return results  # List of (subscription_id, discord_server_id, ticker, threshold, alerted, last_alerted) tuples
+
+def apply_alert_states(changes):
+    # changes: list of (subscription_id, alerted) pairs, written in a single UPDATE
+    if not changes:
+        return
+    with db.transaction() as cursor:
+        execute_values(cursor, '''
+            UPDATE subscribed_stock ss
+            SET alerted = v.alerted,
+                last_alerted = CASE WHEN v.alerted THEN NOW() ELSE NULL END
+            FROM (VALUES %s) AS v(id, alerted)
+            WHERE ss.id = v.id
+        ''', changes, template='(%s, %s::boolean)', page_size=len(changes))
@@ -2,4 +2,4 @@
 
 set -e
 python3 utils/init_db.py
-python3 -m bot.main
\ No newline at end of file
+python3 -m bot
\ No newline at end of file
@@ -0,0 +1,85 @@
+# Run with: python -m unittest discover tests
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+from bot import price_stream
+
+# (id, server_id, ticker, threshold, alerted, last_alerted)
+SUBSCRIPTIONS = [(1, 10, "AAPL", 5.0, False, None), (2, 10, "MSFT", 5.0, False, None), (3, 11, "MSFT", 20.0, False, None)]
+
+
+def write_ticks(ticks):
+    recording = tempfile.NamedTemporaryFile("w", suffix=".jsonl", delete=False)
+    with recording:
+        for ticker, price in ticks:
+            recording.write(json.dumps({"id": ticker, "price": price, "previous_close": 100.0}) + "\n")
+    return recording.name
+
+
+class StreamingAlertEngineTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        # ticker -> event its deliveries wait for, like a guild stuck in a rate-limit backoff
+        self.gates = {"AAPL": asyncio.Event()}
+        self.delivered = []
+
+        async def load_subscriptions():
+            return SUBSCRIPTIONS
+
+        async def deliver(to_alert, to_reset):
+            for ticker in set(to_alert["ticker"]) & set(self.gates):
+                await self.gates[ticker].wait()
+            self.delivered.extend((row.ticker, row.subscription_id) for row in to_alert.itertuples())
+            return [int(row_id) for row_id in to_alert["subscription_id"]]
+
+        self.deliver = deliver
+        self.load_subscriptions = load_subscriptions
+
+    async def replay(self, engine, ticks):
+        ''' Feed recorded ticks through a ReplaySource; returns once every tick was handled, not delivered '''
+        path = write_ticks(ticks)
+        self.addCleanup(os.remove, path)
+        engine.source = price_stream.ReplaySource(path, speed=0)
+        await engine.source.set_tickers(engine.by_ticker)
+        await asyncio.wait_for(engine.source.run(engine.on_tick), 1)
+
+    async def test_slow_delivery_does_not_hold_up_other_tickers(self):
+        engine = price_stream.StreamingAlertEngine(price_stream.ReplaySource(os.devnull), self.load_subscriptions, self.deliver)
+        await engine.resync()
+        await self.replay(engine, [("AAPL", 110.0), ("MSFT", 107.0), ("AAPL", 111.0), ("MSFT", 125.0)])
+        for _ in range(5):
+            await asyncio.sleep(0)
+
+        # Every tick was consumed and MSFT alerted while the AAPL send is still blocked
+        self.assertEqual(self.delivered, [("MSFT", 2), ("MSFT", 3)])
+        self.assertIn(1, engine._in_flight)
+
+        self.gates["AAPL"].set()
+        await asyncio.gather(*engine._workers.values())
+        # The second AAPL tick did not queue a duplicate of the send already in flight
+        self.assertEqual(self.delivered, [("MSFT", 2), ("MSFT", 3), ("AAPL", 1)])
+        self.assertEqual(engine._in_flight, set())
+
+    async def test_resync_keeps_states_confirmed_during_the_read(self):
+        engine = price_stream.StreamingAlertEngine(price_stream.ReplaySource(os.devnull), self.load_subscriptions, self.deliver)
+        self.gates["MSFT"] = asyncio.Event()
+        await engine.resync()
+        await self.replay(engine, [("MSFT", 107.0)])
+
+        # The database read starts before the MSFT alert is persisted, so it still returns the row un-alerted
+        async def stale_subscriptions():
+            self.gates["MSFT"].set()
+            await asyncio.gather(*engine._workers.values())
+            return SUBSCRIPTIONS
+
+        engine.load_subscriptions = stale_subscriptions
+        await engine.resync()
+        await self.replay(engine, [("MSFT", 107.5)])
+        await asyncio.gather(*engine._workers.values())
+        self.assertEqual(self.delivered, [("MSFT", 2)])
+
+
+if __name__ == "__main__":
+    unittest.main()
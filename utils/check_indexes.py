@@ -0,0 +1,151 @@
+# Runs every database_services function against a real database with enable_seqscan = off and
+# EXPLAINs each statement it issues, failing if a filtered sequential scan remains (i.e. no usable index).
+# Everything happens in one transaction that is rolled back, so it is safe to point at a live database.
+import os
+import sys
+from contextlib import contextmanager
+from datetime import date
+from pathlib import Path
+
+import psycopg2
+import psycopg2.extensions
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("DISCORD_PRO_SERVER_SKU_ID", "0")
+
+from database_services import (db, identity_map, server_db, stock_db, subscribed_stock_db, server_plan_db,  # noqa: E402
+                               plan_db, history_db, alert_lease_db, alert_rule_db)
+
+# Statements that read a whole table on purpose, with the reason
+EXEMPT = {
+    "subscribed_stock_db.get_all_subscriptions": "reads every subscription on this worker's shards each alert tick",
+    "alert_rule_db.get_all_rules": "reads every alert rule on this worker's shards each rule tick",
+}
+
+CHECK_GUILD_ID = 1 << 60  # no real Discord snowflake is this large yet
+CHECK_TICKER = "IDXCHK"
+
+_plans = []  # (step, sql, plan)
+_current_step = None
+
+
+class _ExplainingCursor(psycopg2.extensions.cursor):
+    def execute(self, query, vars=None):
+        sql = query.decode() if isinstance(query, bytes) else query
+        if sql.lstrip().split(None, 1)[0].upper() in ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH"):
+            super().execute(f"EXPLAIN (FORMAT JSON) {sql}", vars)
+            _plans.append((_current_step, " ".join(sql.split()), self.fetchone()[0][0]["Plan"]))
+        return super().execute(query, vars)
+
+
+def _scans(plan):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from _scans(child)
+
+
+def _violations(plan):
+    # A Seq Scan with a Filter means rows were looked up without an index; unfiltered ones are whole-table reads
+    return [node for node in _scans(plan) if node["Node Type"] == "Seq Scan" and "Filter" in node]
+
+
+def _clear_caches():
+    # Make every lookup go to the database instead of the in-memory maps
+    identity_map._server_ids.clear()
+    identity_map._stock_ids.clear()
+    identity_map._tickers.clear()
+    server_plan_db._plan_cache.clear()
+    server_db._alert_channels.clear()
+
+
+def _steps():
+    today = date.today()
+    bar = (today, 1.0, 1.0, 1.0, 1.0, 100)
+    return [
+        ("server_db.insert_server", server_db.insert_server, (CHECK_GUILD_ID, "index check")),
+        ("server_db.get_server_internal_id", server_db.get_server_internal_id, (CHECK_GUILD_ID,)),
+        ("server_db.set_alert_channel_id", server_db.set_alert_channel_id, (CHECK_GUILD_ID, 1)),
+        ("server_db.load_alert_channels", server_db.load_alert_channels, ()),
+        ("identity_map.load_servers", identity_map.load_servers, ()),
+        ("stock_db.load_stock_index", stock_db.load_stock_index, ()),
+        ("stock_db.get_stock_internal_id", stock_db.get_stock_internal_id, (CHECK_TICKER,)),
+        ("stock_db.get_ticker_by_id", stock_db.get_ticker_by_id, (0,)),
+        ("stock_db.get_stock_internal_ids", stock_db.get_stock_internal_ids, ([CHECK_TICKER],)),
+        ("plan_db.get_plan_by_name", plan_db.get_plan_by_name, ("Free",)),
+        ("subscribed_stock_db.insert_server_stock", subscribed_stock_db.insert_server_stock, (CHECK_GUILD_ID, CHECK_TICKER, 5.0)),
+        ("subscribed_stock_db.get_subscribed_stocks", subscribed_stock_db.get_subscribed_stocks, (CHECK_GUILD_ID,)),
+        ("subscribed_stock_db.get_server_subscriptions", subscribed_stock_db.get_server_subscriptions, (CHECK_GUILD_ID,)),
+        ("subscribed_stock_db.upsert_server_stocks", subscribed_stock_db.upsert_server_stocks, (CHECK_GUILD_ID, {CHECK_TICKER: 4.0}, 50)),
+        ("subscribed_stock_db.update_server_stock_threshold", subscribed_stock_db.update_server_stock_threshold, (CHECK_GUILD_ID, CHECK_TICKER, 3.0)),
+        ("subscribed_stock_db.mark_stock_as_alerted", subscribed_stock_db.mark_stock_as_alerted, (CHECK_GUILD_ID, CHECK_TICKER)),
+        ("subscribed_stock_db.reset_stock_alert", subscribed_stock_db.reset_stock_alert, (CHECK_GUILD_ID, CHECK_TICKER)),
+        ("subscribed_stock_db.get_all_subscriptions", subscribed_stock_db.get_all_subscriptions, ()),
+        ("subscribed_stock_db.apply_alert_states", subscribed_stock_db.apply_alert_states, ([(0, True), (1, False)],)),
+        ("alert_rule_db.insert_rule", alert_rule_db.insert_rule, (CHECK_GUILD_ID, CHECK_TICKER, "price > 1", 50)),
+        ("alert_rule_db.get_server_rules", alert_rule_db.get_server_rules, (CHECK_GUILD_ID,)),
+        ("alert_rule_db.get_all_rules", alert_rule_db.get_all_rules, ()),
+        ("alert_rule_db.apply_rule_states", alert_rule_db.apply_rule_states, ([(0, True), (1, False)],)),
+        ("alert_rule_db.delete_rules", alert_rule_db.delete_rules, (CHECK_GUILD_ID, [0])),
+        ("subscribed_stock_db.delete_server_stock", subscribed_stock_db.delete_server_stock, (CHECK_GUILD_ID, CHECK_TICKER)),
+        ("subscribed_stock_db.delete_server_stocks", subscribed_stock_db.delete_server_stocks, (CHECK_GUILD_ID, [CHECK_TICKER])),
+        ("subscribed_stock_db.delete_server_stocks_from_server", subscribed_stock_db.delete_server_stocks_from_server, (CHECK_GUILD_ID,)),
+        ("server_plan_db.load_plan_cache", server_plan_db.load_plan_cache, ()),
+        ("server_plan_db.get_server_plan", server_plan_db.get_server_plan, (CHECK_GUILD_ID,)),
+        ("server_plan_db.update_server_plan", server_plan_db.update_server_plan, (CHECK_GUILD_ID, "Free")),
+        ("server_plan_db.create_entitlement", server_plan_db.create_entitlement, (CHECK_GUILD_ID, 1, CHECK_GUILD_ID, "Free")),
+        ("server_plan_db.renew_entitlement", server_plan_db.renew_entitlement, (CHECK_GUILD_ID, CHECK_GUILD_ID)),
+        ("server_plan_db.remove_entitlement", server_plan_db.remove_entitlement, (CHECK_GUILD_ID, CHECK_GUILD_ID)),
+        ("history_db.save_bars", history_db.save_bars, (CHECK_TICKER, [bar], today, today, True)),
+        ("history_db.get_history_range", history_db.get_history_range, (CHECK_TICKER,)),
+        ("history_db.get_bars", history_db.get_bars, (CHECK_TICKER, today)),
+        ("history_db.get_history_ranges", history_db.get_history_ranges, ([CHECK_TICKER],)),
+        ("history_db.get_bars_many", history_db.get_bars_many, ([CHECK_TICKER], today)),
+        ("history_db.get_indicator_states", history_db.get_indicator_states, ([CHECK_TICKER],)),
+        ("history_db.get_bars_after", history_db.get_bars_after, ({CHECK_TICKER: date.min},)),
+        ("history_db.save_indicators", history_db.save_indicators, ([(CHECK_TICKER, today) + (1.0,) * 9], [(CHECK_TICKER, today, {})])),
+        ("alert_lease_db.claim_shards", alert_lease_db.claim_shards, ("index-check", [0], 1)),
+        ("alert_lease_db.get_unleased_shards", alert_lease_db.get_unleased_shards, (1,)),
+        ("alert_lease_db.release_shards", alert_lease_db.release_shards, ("index-check",)),
+    ]
+
+
+def main():
+    global _current_step
+    conn = psycopg2.connect(**db._connection_params())
+
+    @contextmanager
+    def transaction():
+        with conn.cursor(cursor_factory=_ExplainingCursor) as cursor:
+            yield cursor
+
+    db.transaction = transaction
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute('INSERT INTO stock (ticker, name) VALUES (%s, %s) ON CONFLICT (ticker) DO NOTHING',
+                           (CHECK_TICKER, "Index Check Inc"))
+        for step, func, args in _steps():
+            _current_step = step
+            _clear_caches()
+            func(*args)
+    finally:
+        conn.rollback()
+        conn.close()
+
+    failures = 0
+    for step, sql, plan in _plans:
+        bad = _violations(plan)
+        if bad and step in EXEMPT:
+            print(f"SKIP {step}: {EXEMPT[step]}")
+        elif bad:
+            failures += 1
+            tables = ", ".join(f"{node['Relation Name']} ({node['Filter']})" for node in bad)
+            print(f"FAIL {step}: sequential scan on {tables}\n     {sql[:160]}")
+        else:
+            print(f"ok   {step}: {plan['Node Type']}")
+    print(f"{len(_plans)} statements checked, {failures} without a usable index")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,39 +2,138 @@ import json
 import os
 import time
 from pathlib import Path
+from typing import Iterable, Iterator
 from urllib.request import Request, urlopen
 from urllib.error import URLError, HTTPError
 
 SEC_URL = "https://www.sec.gov/files/company_tickers.json"
+# Downloaded payload and its ETag/Last-Modified validators live here between runs
+SEC_CACHE_DIR = Path(os.environ.get("SEC_CACHE_DIR", Path.home() / ".cache" / "aurelius"))
+# A local company_tickers.json to use instead of SEC (tests, offline development)
+SEC_TICKERS_FILE = os.environ.get("SEC_TICKERS_FILE", "")
+CHUNK_SIZE = 64 * 1024
 
 def _user_agent() -> str:
     # SEC requests a descriptive UA with contact info
     return os.environ.get("SEC_USER_AGENT", "Aurelius/1.0 (contact: email@example.com)")
 
-def fetch_sec_company_tickers() -> dict:
-    req = Request(
-        SEC_URL,
-        headers={
-            "User-Agent": _user_agent(),
-            "Accept": "application/json",
-            "Connection": "keep-alive",
-        },
-        method="GET",
-    )
+def _cache_paths() -> tuple[Path, Path]:
+    return SEC_CACHE_DIR / "company_tickers.json", SEC_CACHE_DIR / "company_tickers.meta.json"
+
+def fetch_sec_company_tickers() -> Path:
+    # Returns the path of an up-to-date company_tickers.json, downloading only when SEC has a newer one
+    if SEC_TICKERS_FILE:
+        return Path(SEC_TICKERS_FILE)
+
+    payload_path, meta_path = _cache_paths()
+    headers = {
+        "User-Agent": _user_agent(),
+        "Accept": "application/json",
+        "Connection": "keep-alive",
+    }
+    meta = {}
+    if payload_path.exists() and meta_path.exists():
+        meta = json.loads(meta_path.read_text())
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+    req = Request(SEC_URL, headers=headers, method="GET")
     try:
         with urlopen(req, timeout=30) as resp:
             if resp.status != 200:
                 raise HTTPError(SEC_URL, resp.status, "Bad response", resp.headers, None)
-            data = json.loads(resp.read().decode("utf-8"))
-    except (URLError, HTTPError) as e:
+            SEC_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+            # Stream to a temp file and swap it in, so a failed download never replaces a good cache
+            partial_path = payload_path.with_suffix(".part")
+            with open(partial_path, "wb") as out:
+                while chunk := resp.read(CHUNK_SIZE):
+                    out.write(chunk)
+            partial_path.replace(payload_path)
+            meta = {
+                "etag": resp.headers.get("ETag"),
+                "last_modified": resp.headers.get("Last-Modified"),
+                "fetched_at": time.time(),
+            }
+            meta_path.write_text(json.dumps(meta))
+    except HTTPError as e:
+        if e.code == 304:
+            return payload_path  # Not modified, the cached copy is current
+        if payload_path.exists():
+            print(f"SEC download failed ({e}), using cached tickers from {payload_path}")
+            return payload_path
         raise RuntimeError(f"Failed to fetch SEC tickers: {e}") from e
+    except URLError as e:
+        if payload_path.exists():
+            print(f"SEC download failed ({e}), using cached tickers from {payload_path}")
+            return payload_path
+        raise RuntimeError(f"Failed to fetch SEC tickers: {e}") from e
+
+    return payload_path
+
+def iter_company_entries(path: Path) -> Iterator[dict]:
+    # Incrementally decodes {"0": {...}, "1": {...}, ...}, holding one chunk and one entry in memory at a time
+    decoder = json.JSONDecoder()
+    with open(path, encoding="utf-8") as f:
+        buffer = ""
+        pos = 0
+        eof = False
+
+        def fill() -> bool:
+            nonlocal buffer, pos, eof
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                eof = True
+                return False
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            return True
+
+        def skip_whitespace() -> str:
+            nonlocal pos
+            while True:
+                while pos < len(buffer) and buffer[pos].isspace():
+                    pos += 1
+                if pos < len(buffer) or not fill():
+                    return buffer[pos] if pos < len(buffer) else ""
+
+        def decode():
+            nonlocal pos
+            while True:
+                try:
+                    value, end = decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    # The value runs past the end of the buffer; read more and try again
+                    if eof or not fill():
+                        raise
+                    continue
+                pos = end
+                return value
 
-    return data
+        if skip_whitespace() != "{":
+            raise ValueError(f"{path} is not a JSON object")
+        pos += 1
+        while True:
+            token = skip_whitespace()
+            if token == "}":
+                return
+            if token == ",":
+                pos += 1
+                continue
+            decode()  # key
+            if skip_whitespace() != ":":
+                raise ValueError(f"Malformed SEC payload in {path}")
+            pos += 1
+            skip_whitespace()
+            yield decode()
 
-def build_ticker_name_map(sec_payload: dict) -> dict[str, str]:
+def build_ticker_name_map(sec_payload: dict | Iterable[dict]) -> dict[str, str]:
     # Payload is a dict keyed by numeric strings: {"0": {"ticker": "AAPL", "title": "Apple Inc.", ...}, ...}
+    # (or an iterable of its entries, as streamed by iter_company_entries)
+    entries = sec_payload.values() if isinstance(sec_payload, dict) else sec_payload
     mapping: dict[str, str] = {}
-    for entry in sec_payload.values():
+    for entry in entries:
         t = (entry.get("ticker") or "").strip().upper()
         name = (entry.get("title") or "").strip()
         if t and name:
@@ -43,8 +142,7 @@ def build_ticker_name_map(sec_payload: dict) -> dict[str, str]:
 
 
 def get_ticker_name_dict() -> dict[str, str]:
-    payload = fetch_sec_company_tickers()
-    return build_ticker_name_map(payload)
+    return build_ticker_name_map(iter_company_entries(fetch_sec_company_tickers()))
 
 if __name__ == "__main__":
     mapping = get_ticker_name_dict()
@@ -53,4 +151,4 @@ if __name__ == "__main__":
     for k in ("AAPL", "MSFT", "GOOGL", "AMZN", "TSLA", "NET", "^GSPC"):
         if k in mapping:
             print(f"{k}: {mapping[k]}")
-    print(len(mapping))
\ No newline at end of file
+    print(len(mapping))
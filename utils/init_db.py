@@ -1,7 +1,8 @@
 import psycopg2
-import pandas as pd
 import os
 from collect_stocks_names import get_ticker_name_dict
+from load_stocks import load_stock_universe
+from migrate import apply_migrations
 
 
 
@@ -13,74 +14,15 @@ conn = psycopg2.connect(
     port='5432'
 )
 
-cursor = conn.cursor()
-
-# Create Server table (Discord servers/guilds)
-cursor.execute('''
-CREATE TABLE IF NOT EXISTS server (
-    id SERIAL PRIMARY KEY,
-    server_id BIGINT UNIQUE NOT NULL,
-    server_name VARCHAR(100)
-);
-''')
-
-# Create Stock table
-cursor.execute('''
-CREATE TABLE IF NOT EXISTS stock (
-    id SERIAL PRIMARY KEY,
-    ticker VARCHAR(10) UNIQUE NOT NULL,
-    name VARCHAR(200)
-);
-''')
-
-# Create SubscribedStock table (junction table - pure many-to-many)
-cursor.execute('''
-CREATE TABLE IF NOT EXISTS subscribed_stock (
-    id SERIAL PRIMARY KEY,
-    server_id INTEGER REFERENCES server(id) ON DELETE CASCADE,
-    stock_id INTEGER REFERENCES stock(id) ON DELETE CASCADE,
-    threshold DECIMAL(5,2) NOT NULL DEFAULT 10.0,
-    alerted BOOLEAN NOT NULL DEFAULT FALSE,
-    last_alerted TIMESTAMP NULL,
-    UNIQUE (server_id, stock_id)
-);
-''')
-
-cursor.execute('''
-CREATE TABLE IF NOT EXISTS plan (
-    id SERIAL PRIMARY KEY,
-    plan_name VARCHAR(50) UNIQUE NOT NULL,
-    price DECIMAL(6,2) NOT NULL
-);
-''')
+# Create/upgrade tables and indexes (versioned files in utils/migrations)
+for name in apply_migrations(conn):
+    print(f"Applied migration {name}")
 
-cursor.execute('''
-CREATE TABLE IF NOT EXISTS server_plan (
-    id SERIAL PRIMARY KEY,
-    server_id INTEGER NOT NULL REFERENCES server(id) ON DELETE CASCADE,
-    plan_id INTEGER NOT NULL REFERENCES plan(id) ON DELETE CASCADE,
-    start_date TIMESTAMPTZ NOT NULL DEFAULT NOW(),
-    end_date TIMESTAMPTZ NULL,
-    entitlement_id BIGINT UNIQUE,
-    purchaser_user_id BIGINT,
-    billing_platform VARCHAR(50),
-    original_plan_name VARCHAR(50),
-    UNIQUE (server_id)
-);
-''')
-
-# Check if stock table is empty before inserting initial data
-cursor.execute('SELECT COUNT(*) FROM stock')
-count = cursor.fetchone()[0]
-if count > 0:
-    print("Stock table already has data. Skipping initial data insertion.")
+cursor = conn.cursor()
 
-else:
-    # Fill Stock table with initial data from companies.csv
-    companies = get_ticker_name_dict()
-    df = pd.DataFrame(list(companies.items()), columns=['ticker', 'name'])
-    for _, row in df.iterrows():
-        cursor.execute('INSERT INTO stock (ticker, name) VALUES (%s, %s) ON CONFLICT (ticker) DO NOTHING', (row['ticker'], row['name']))
+# Sync the stock table with the SEC ticker list (adds new tickers, renames, drops delisted ones)
+inserted, renamed, deleted = load_stock_universe(cursor, get_ticker_name_dict())
+print(f"Stock universe: {inserted} added, {renamed} renamed, {deleted} removed.")
 
 # Fill Plan table with initial plans
 cursor.execute('SELECT COUNT(*) FROM plan')
@@ -0,0 +1,124 @@
+import argparse
+import os
+import time
+import psycopg2
+from collect_stocks_names import get_ticker_name_dict
+
+# stock.ticker / stock.name column widths
+MAX_TICKER_LENGTH = 10
+MAX_NAME_LENGTH = 200
+# Refuse to delete when the new universe shrank this much (likely a truncated download)
+MIN_UNIVERSE_RATIO = 0.5
+
+
+def _copy_escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+class _CopySource:
+    ''' File-like reader over (ticker, name) pairs in COPY text format, so rows are streamed instead of built up front '''
+
+    def __init__(self, mapping: dict[str, str]):
+        self._lines = (
+            f"{_copy_escape(ticker)}\t{_copy_escape(name[:MAX_NAME_LENGTH])}\n"
+            for ticker, name in mapping.items()
+            if len(ticker) <= MAX_TICKER_LENGTH
+        )
+        self._buffer = ""
+
+    def read(self, size: int = -1) -> str:
+        while size < 0 or len(self._buffer) < size:
+            line = next(self._lines, None)
+            if line is None:
+                break
+            self._buffer += line
+        if size < 0:
+            size = len(self._buffer)
+        chunk, self._buffer = self._buffer[:size], self._buffer[size:]
+        return chunk
+
+
+def load_stock_universe(cursor, mapping: dict[str, str]) -> tuple[int, int, int]:
+    ''' Sync the stock table with mapping; returns (inserted, renamed, deleted). Runs in the caller's transaction. '''
+    cursor.execute('''
+        CREATE TEMP TABLE stock_staging (
+            ticker VARCHAR(10) PRIMARY KEY,
+            name VARCHAR(200)
+        ) ON COMMIT DROP
+    ''')
+    cursor.copy_expert('COPY stock_staging (ticker, name) FROM STDIN', _CopySource(mapping), size=65536)
+
+    cursor.execute('SELECT (SELECT COUNT(*) FROM stock_staging), (SELECT COUNT(*) FROM stock)')
+    staged, current = cursor.fetchone()
+    allow_delete = staged >= current * MIN_UNIVERSE_RATIO
+    if not allow_delete:
+        print(f"New universe has {staged} tickers against {current} stored, not deleting any.")
+
+    # Ids of existing tickers are kept; delisted tickers still watched by a server or used by an alert rule are left in place
+    cursor.execute('''
+        WITH upserted AS (
+            INSERT INTO stock (ticker, name)
+            SELECT ticker, name FROM stock_staging
+            ON CONFLICT (ticker) DO UPDATE SET name = EXCLUDED.name
+            WHERE stock.name IS DISTINCT FROM EXCLUDED.name
+            RETURNING (xmax = 0) AS inserted
+        ), deleted AS (
+            DELETE FROM stock st
+            WHERE %s
+            AND NOT EXISTS (SELECT 1 FROM stock_staging s WHERE s.ticker = st.ticker)
+            AND NOT EXISTS (SELECT 1 FROM subscribed_stock ss WHERE ss.stock_id = st.id)
+            AND NOT EXISTS (SELECT 1 FROM alert_rule ar WHERE ar.stock_id = st.id)
+            RETURNING 1
+        )
+        SELECT
+            (SELECT COUNT(*) FROM upserted WHERE inserted),
+            (SELECT COUNT(*) FROM upserted WHERE NOT inserted),
+            (SELECT COUNT(*) FROM deleted)
+    ''', (allow_delete,))
+    inserted, renamed, deleted = cursor.fetchone()
+
+    if inserted or renamed or deleted:
+        # Running bots reload their in-memory ticker index when they see this (delivered on commit)
+        cursor.execute('NOTIFY stock_universe_changed')
+    return inserted, renamed, deleted
+
+
+def connect():
+    return psycopg2.connect(
+        dbname=os.getenv("POSTGRES_DB"),
+        user=os.getenv("POSTGRES_USER"),
+        password=os.getenv("POSTGRES_PASSWORD"),
+        host=os.getenv("POSTGRES_HOST"),
+        port='5432'
+    )
+
+
+def refresh() -> None:
+    mapping = get_ticker_name_dict()
+    started = time.perf_counter()
+    conn = connect()
+    try:
+        with conn.cursor() as cursor:
+            inserted, renamed, deleted = load_stock_universe(cursor, mapping)
+        conn.commit()
+    finally:
+        conn.close()
+    print(f"Stock universe synced in {time.perf_counter() - started:.2f}s: "
+          f"{inserted} added, {renamed} renamed, {deleted} removed ({len(mapping)} tickers from SEC)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sync the stock table with the SEC ticker list")
+    parser.add_argument("--every", type=float, default=0, help="keep running, refreshing every N hours")
+    args = parser.parse_args()
+
+    while True:
+        try:
+            refresh()
+        except Exception as e:
+            if not args.every:
+                raise
+            print(f"Stock universe refresh failed, will retry: {e}")
+        if not args.every:
+            break
+        time.sleep(args.every * 3600)
@@ -0,0 +1,71 @@
+import os
+import re
+from pathlib import Path
+import psycopg2
+
+# Versioned schema changes: NNNN_description.sql, applied in order and recorded in schema_migrations
+MIGRATIONS_DIR = Path(__file__).resolve().parent / "migrations"
+# Serialises concurrent deployments running migrations against the same database
+MIGRATION_LOCK_ID = 7_246_109_331
+
+
+def migration_files() -> list[tuple[int, str, Path]]:
+    migrations = []
+    for path in sorted(MIGRATIONS_DIR.glob("*.sql")):
+        match = re.fullmatch(r"(\d+)_(.+)\.sql", path.name)
+        if not match:
+            raise ValueError(f"Migration file {path.name} must be named NNNN_description.sql")
+        migrations.append((int(match.group(1)), match.group(2), path))
+    versions = [version for version, _, _ in migrations]
+    if len(versions) != len(set(versions)):
+        raise ValueError("Two migration files share a version number")
+    return migrations
+
+
+def apply_migrations(conn) -> list[str]:
+    ''' Apply every migration not yet recorded, each in its own transaction. Returns the names applied. '''
+    applied_now = []
+    with conn.cursor() as cursor:
+        cursor.execute('SELECT pg_advisory_lock(%s)', (MIGRATION_LOCK_ID,))
+        try:
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version INTEGER PRIMARY KEY,
+                    name VARCHAR(200) NOT NULL,
+                    applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+                )
+            ''')
+            cursor.execute('SELECT version FROM schema_migrations')
+            applied = {row[0] for row in cursor.fetchall()}
+            conn.commit()
+
+            for version, name, path in migration_files():
+                if version in applied:
+                    continue
+                cursor.execute(path.read_text())
+                cursor.execute('INSERT INTO schema_migrations (version, name) VALUES (%s, %s)', (version, name))
+                conn.commit()
+                applied_now.append(path.name)
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            # Session-level lock, so it survives the commits above and must be released explicitly
+            cursor.execute('SELECT pg_advisory_unlock(%s)', (MIGRATION_LOCK_ID,))
+            conn.commit()
+    return applied_now
+
+
+if __name__ == "__main__":
+    conn = psycopg2.connect(
+        dbname=os.getenv("POSTGRES_DB"),
+        user=os.getenv("POSTGRES_USER"),
+        password=os.getenv("POSTGRES_PASSWORD"),
+        host=os.getenv("POSTGRES_HOST"),
+        port='5432'
+    )
+    try:
+        applied = apply_migrations(conn)
+    finally:
+        conn.close()
+    print(f"Applied {len(applied)} migration(s): {', '.join(applied)}" if applied else "Database schema is up to date.")
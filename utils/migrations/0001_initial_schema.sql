@@ -0,0 +1,72 @@
+-- Baseline schema. IF NOT EXISTS lets databases created by the old init_db.py adopt it unchanged.
+
+-- Discord servers/guilds
+CREATE TABLE IF NOT EXISTS server (
+    id SERIAL PRIMARY KEY,
+    server_id BIGINT UNIQUE NOT NULL,
+    server_name VARCHAR(100),
+    alert_channel_id BIGINT NULL
+);
+ALTER TABLE server ADD COLUMN IF NOT EXISTS alert_channel_id BIGINT NULL;
+
+CREATE TABLE IF NOT EXISTS stock (
+    id SERIAL PRIMARY KEY,
+    ticker VARCHAR(10) UNIQUE NOT NULL,
+    name VARCHAR(200)
+);
+
+-- Junction table - pure many-to-many
+CREATE TABLE IF NOT EXISTS subscribed_stock (
+    id SERIAL PRIMARY KEY,
+    server_id INTEGER REFERENCES server(id) ON DELETE CASCADE,
+    stock_id INTEGER REFERENCES stock(id) ON DELETE CASCADE,
+    threshold DECIMAL(5,2) NOT NULL DEFAULT 10.0,
+    alerted BOOLEAN NOT NULL DEFAULT FALSE,
+    last_alerted TIMESTAMP NULL,
+    UNIQUE (server_id, stock_id)
+);
+
+CREATE TABLE IF NOT EXISTS plan (
+    id SERIAL PRIMARY KEY,
+    plan_name VARCHAR(50) UNIQUE NOT NULL,
+    price DECIMAL(6,2) NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS server_plan (
+    id SERIAL PRIMARY KEY,
+    server_id INTEGER NOT NULL REFERENCES server(id) ON DELETE CASCADE,
+    plan_id INTEGER NOT NULL REFERENCES plan(id) ON DELETE CASCADE,
+    start_date TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    end_date TIMESTAMPTZ NULL,
+    entitlement_id BIGINT UNIQUE,
+    purchaser_user_id BIGINT,
+    billing_platform VARCHAR(50),
+    original_plan_name VARCHAR(50),
+    UNIQUE (server_id)
+);
+
+-- Local daily OHLCV store (tickers are free text so indices like ^GSPC can be stored too)
+CREATE TABLE IF NOT EXISTS stock_history (
+    ticker VARCHAR(20) NOT NULL,
+    date DATE NOT NULL,
+    open DOUBLE PRECISION,
+    high DOUBLE PRECISION,
+    low DOUBLE PRECISION,
+    close DOUBLE PRECISION NOT NULL,
+    volume BIGINT,
+    PRIMARY KEY (ticker, date)
+);
+
+-- Date window already downloaded per ticker in stock_history
+CREATE TABLE IF NOT EXISTS stock_history_range (
+    ticker VARCHAR(20) PRIMARY KEY,
+    covered_from DATE NOT NULL,
+    covered_to DATE NOT NULL
+);
+
+-- Alert shard leases: which bot process evaluates alerts for each Discord shard
+CREATE TABLE IF NOT EXISTS alert_shard_lease (
+    shard_id INTEGER PRIMARY KEY,
+    owner VARCHAR(100) NOT NULL,
+    expires_at TIMESTAMPTZ NOT NULL
+);
@@ -0,0 +1,11 @@
+-- Indexes for the lookups in database_services (checked by utils/check_indexes.py).
+-- Already covered by constraints: server(server_id), server_plan(server_id), server_plan(entitlement_id),
+-- plan(plan_name), stock(ticker), and subscribed_stock(server_id) via the leading column of UNIQUE (server_id, stock_id).
+
+-- Company name search: partial/ILIKE matches and case-insensitive exact matches
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX IF NOT EXISTS stock_name_trgm_idx ON stock USING GIN (name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS stock_lower_name_idx ON stock (lower(name));
+
+-- Reverse lookups from a stock to its subscribers (and the ON DELETE CASCADE from stock)
+CREATE INDEX IF NOT EXISTS subscribed_stock_stock_id_idx ON subscribed_stock (stock_id);
@@ -0,0 +1,19 @@
+-- Daily technical indicators stored next to each bar (computed incrementally by bot/indicators.py).
+-- NULL while an indicator is still warming up or for bars stored before this migration.
+ALTER TABLE stock_history
+    ADD COLUMN IF NOT EXISTS sma_20 DOUBLE PRECISION,
+    ADD COLUMN IF NOT EXISTS sma_50 DOUBLE PRECISION,
+    ADD COLUMN IF NOT EXISTS ema_12 DOUBLE PRECISION,
+    ADD COLUMN IF NOT EXISTS ema_26 DOUBLE PRECISION,
+    ADD COLUMN IF NOT EXISTS rsi_14 DOUBLE PRECISION,
+    ADD COLUMN IF NOT EXISTS bb_upper DOUBLE PRECISION,
+    ADD COLUMN IF NOT EXISTS bb_middle DOUBLE PRECISION,
+    ADD COLUMN IF NOT EXISTS bb_lower DOUBLE PRECISION,
+    ADD COLUMN IF NOT EXISTS atr_14 DOUBLE PRECISION;
+
+-- Rolling indicator state per ticker after its last completed bar, so new bars are applied without re-reading the window
+CREATE TABLE IF NOT EXISTS stock_indicator_state (
+    ticker VARCHAR(20) PRIMARY KEY,
+    as_of DATE NOT NULL,
+    state JSONB NOT NULL
+);
@@ -0,0 +1,13 @@
+-- Condition-based alert rules (syntax in bot/alert_rules.py), stored in their normalised text form
+CREATE TABLE IF NOT EXISTS alert_rule (
+    id SERIAL PRIMARY KEY,
+    server_id INTEGER NOT NULL REFERENCES server(id) ON DELETE CASCADE,
+    stock_id INTEGER NOT NULL REFERENCES stock(id) ON DELETE CASCADE,
+    rule VARCHAR(100) NOT NULL,
+    alerted BOOLEAN NOT NULL DEFAULT FALSE,
+    last_alerted TIMESTAMP NULL,
+    UNIQUE (server_id, stock_id, rule)
+);
+
+-- Reverse lookups from a stock (universe sync keeps stocks that still have rules)
+CREATE INDEX IF NOT EXISTS alert_rule_stock_id_idx ON alert_rule (stock_id);